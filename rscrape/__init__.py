@@ -0,0 +1,5 @@
+"""Scrape and normalize amateur radio repeater listings.
+
+The scraper itself lives in the webscrape module, this package holds the
+console script and the optional parts that are only imported when used.
+"""
@@ -0,0 +1,125 @@
+"""Record/replay archive of raw query responses.
+
+Imported only when a run uses --record or --replay.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import threading
+import time
+from typing import Any
+
+import requests
+
+from webscrape import cachekey, normalizeformdata
+
+# Archive file inside the --record/--replay directory
+ARCHIVE_FILE = "responses.jsonl.gz"
+
+
+class ResponseArchive:
+    """Compressed archive of raw query responses for record and replay.
+
+    Every response is appended as one JSON line (form data, status, body) to
+    a gzip file in the archive directory, so a run can later be reproduced
+    offline with exactly the HTML it received.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """Open the archive.
+
+        Args:
+            directory (str): Directory holding the archive file.
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, ARCHIVE_FILE)
+        self._lock = threading.Lock()
+        self._responses: dict[str, dict[str, Any]] | None = None
+
+    def record(self, formdata: dict[str, str], response: requests.Response) -> None:
+        """Append a response to the archive.
+
+        Args:
+            formdata (dict): Form data the response was returned for.
+            response (requests.Response): The response to store.
+        """
+        entry = {
+            "form": dict(formdata),
+            "recorded": time.time(),
+            "status": response.status_code,
+            "text": response.text,
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with gzip.open(self.path, "at", encoding="UTF8") as g:
+                g.write(line)
+
+    def responses(self) -> dict[str, dict[str, Any]]:
+        """Load the archived responses keyed by cachekey of their form data.
+
+        Returns:
+            dict: The most recently recorded entry for each query.
+        """
+        with self._lock:
+            if self._responses is None:
+                responses = {}
+                with gzip.open(self.path, "rt", encoding="UTF8") as g:
+                    for line in g:
+                        if line.strip():
+                            entry = json.loads(line)
+                            responses[cachekey(entry["form"])] = entry
+                self._responses = responses
+            return self._responses
+
+    def lookup(self, formdata: dict[str, str]) -> dict[str, Any] | None:
+        """Find the archived entry for a query.
+
+        Args:
+            formdata (dict): Form data of the query.
+
+        Returns:
+            dict: Archived entry or None if the query was not recorded.
+        """
+        return self.responses().get(cachekey(formdata))
+
+
+class RecordingSession(requests.Session):
+    """Session that archives the body of every form POST it makes."""
+
+    def __init__(self, archive: ResponseArchive) -> None:
+        super().__init__()
+        self.archive = archive
+
+    def post(  # type: ignore[override]
+        self, url: str, data: Any = None, json: Any = None, **kwargs: Any
+    ) -> requests.Response:
+        response = super().post(url, data=data, json=json, **kwargs)
+        self.archive.record(data or {}, response)
+        return response
+
+
+class ReplaySession(requests.Session):
+    """Session that answers form POSTs from an archive without network access."""
+
+    def __init__(self, archive: ResponseArchive) -> None:
+        super().__init__()
+        self.archive = archive
+
+    def post(  # type: ignore[override]
+        self, url: str, data: Any = None, json: Any = None, **kwargs: Any
+    ) -> requests.Response:
+        entry = self.archive.lookup(data or {})
+        if entry is None:
+            raise requests.exceptions.ConnectionError(
+                f"No recorded response for {normalizeformdata(data or {})}"
+            )
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.encoding = "UTF8"
+        response._content = entry["text"].encode("UTF8")
+        response.url = url
+        return response
@@ -0,0 +1,237 @@
+"""Thread scaling benchmark of repeater classification.
+
+Run with ``python -m rscrape.bench`` on the standard and the free-threaded
+(python3.13t) interpreter to compare how classification scales with
+--threads. Results are printed as JSON. The synthetic rows and result
+pages are also the data of rscrape.microbench.
+"""
+
+from __future__ import annotations
+
+import argparse
+import html
+import json
+import os
+import random
+import sys
+import sysconfig
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any
+
+from webscrape import (
+    NAN,
+    VALID_DCS,
+    VALID_PLS,
+    classifyrepeaters,
+    classifyrepeatersinpool,
+)
+
+# Repeater channels of each band, as first MHz, spacing, channel count, the
+# decimals the frequency is listed with and the band's share of listings
+BAND_CHANNELS = (
+    (29.62, 0.02, 4, 3, 1),
+    (53.01, 0.02, 50, 3, 3),
+    (145.11, 0.015, 33, 3, 20),
+    (146.61, 0.015, 53, 3, 30),
+    (223.94, 0.02, 52, 3, 6),
+    (442.0, 0.025, 320, 3, 34),
+    (927.0125, 0.025, 40, 4, 3),
+    (1282.0, 0.025, 240, 3, 3),
+)
+
+# Digital modes named in the PL field instead of a tone
+PL_MODES = ["DMR", "D-STAR", "YSF", "NXDN", "P25", "DMR/FM", "YSF/FM"]
+
+# Note fragments, formatted with random codes
+NOTE_FRAGMENTS = [
+    "DMR CC{cc} Brandmeister TG {tg}",
+    "DMR CC{cc} c-Bridge",
+    "Fusion Wires-X room {node}",
+    "YSF DG-ID {cc}",
+    "NXDN RAN{cc}",
+    "P25 NAC:{nac}",
+    "P25 NAC {nac}",
+    "D-STAR gateway, reflector REF0{cc}",
+    "DCS({dcs}) wide coverage",
+    "D{dcs}",
+    "EchoLink node {node}",
+    "AllStar {node}",
+    "Linked to {town}",
+    "Net Tuesdays 8pm",
+    "under maintenance",
+    "Autopatch, emergency power",
+]
+
+# Call sign prefixes of the region
+CALL_PREFIXES = ["W", "K", "N", "KA", "KB", "KC", "KD", "WA", "WB", "AA", "AB"]
+
+# Compass points of the DIST/DIR cell
+DIRECTIONS = ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]
+
+# Header of a result page table
+PAGE_HEADER = ("LOC", "FREQ", "PL", "CALL", "DIST/DIR", "SPONSOR", "NOTES")
+
+
+@lru_cache(maxsize=1)
+def towns() -> list[str]:
+    """List the "City, ST" locations raw rows are drawn from.
+
+    Returns:
+        list: Every city of the bundled gazetteer, sorted.
+    """
+    from rscrape.mirror import loadgazetteer
+
+    return sorted(f"{city.title()}, {state}" for city, state in loadgazetteer())
+
+
+def syntheticrows(count: int, seed: int = 0) -> list[list[Any]]:
+    """Generate raw repeater rows like those parsed from a response.
+
+    Rows are on the repeater channels of every band, with tones, digital
+    modes, DCS and digital codes in the PL field and notes in roughly the
+    mix the databases list, and empty cells as NaN.
+
+    Args:
+        count (int): Number of rows.
+        seed (int): Random seed, the same seed gives the same rows.
+
+    Returns:
+        list: Raw rows of location, frequency, PL, call, distance, sponsor
+        and notes.
+    """
+    rng = random.Random(seed)
+    places = towns()
+    tones = sorted(VALID_PLS, key=float)
+    codes = sorted(VALID_DCS)
+    weights = [band[4] for band in BAND_CHANNELS]
+    rows = []
+    for _ in range(count):
+        first, step, channels, decimals, _ = rng.choices(BAND_CHANNELS, weights)[0]
+        freq = f"{first + step * rng.randrange(channels):.{decimals}f}"
+        town = rng.choice(places)
+        pick = rng.random()
+        if pick < 0.6:
+            pl: Any = rng.choice(tones)
+        elif pick < 0.85:
+            pl = rng.choice(PL_MODES)
+        else:
+            pl = NAN
+        call = (
+            f"{rng.choice(CALL_PREFIXES)}{rng.randrange(10)}"
+            f"{''.join(rng.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=rng.randint(1, 3)))}"
+        )
+        dist = f"{rng.uniform(0, 150):.1f}{rng.choice(DIRECTIONS)}"
+        sponsor = rng.choice(
+            [f"{town.split(',')[0]} ARC", "County ARES", call + " Club", NAN, NAN]
+        )
+        fragments = rng.choices(NOTE_FRAGMENTS, k=rng.randrange(4))
+        notes = ", ".join(
+            fragment.format(
+                cc=rng.randint(1, 15),
+                tg=rng.randint(3100, 3199),
+                node=rng.randint(10000, 999999),
+                nac=f"{rng.randrange(0x1000):03X}",
+                dcs=rng.choice(codes),
+                town=rng.choice(places),
+            )
+            for fragment in fragments
+        )
+        rows.append([town, freq, pl, call, dist, sponsor, notes or NAN])
+    return rows
+
+
+def syntheticpage(rows: list[list[Any]]) -> str:
+    """Render raw rows as a result page of the query URL.
+
+    Args:
+        rows (list): Raw rows, NaN cells are left empty.
+
+    Returns:
+        str: HTML with a layout table and the repeater table.
+    """
+    lines = [
+        "<html><body><table><tr><td>Repeater search results</td></tr></table>",
+        '<table border="1"><tr>'
+        + "".join(f"<td><b>{name}</b></td>" for name in PAGE_HEADER)
+        + "</tr>",
+    ]
+    for row in rows:
+        cells = "".join(
+            "<td></td>" if value != value else f"<td>{html.escape(str(value))}</td>"
+            for value in row
+        )
+        lines.append(f"<tr>{cells}</tr>")
+    lines.append("</table></body></html>")
+    return "\n".join(lines)
+
+
+def timeclassify(rows: list[list[Any]], threads: int, repeat: int) -> float:
+    """Time classification of rows, best of several runs.
+
+    Args:
+        rows (list): Raw rows.
+        threads (int): Worker threads, 0 to classify in the calling thread.
+        repeat (int): Number of runs.
+
+    Returns:
+        float: Seconds of the fastest run.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if threads > 0:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                start = time.perf_counter()
+                for _ in classifyrepeatersinpool(pool, rows, False, False, "Low", "v1"):
+                    pass
+        else:
+            start = time.perf_counter()
+            for _ in classifyrepeaters(rows, False, False, "Low", "v1"):
+                pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Run the benchmark and print the results as JSON.
+
+    Args:
+        argv (list[str]): Command-line arguments, defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="Raw rows to classify")
+    parser.add_argument(
+        "--threads", default="1,2,4,8", help="Comma-separated thread counts"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    rows = syntheticrows(args.rows)
+    serial = timeclassify(rows, 0, args.repeat)
+    results = []
+    for threads in (int(t) for t in args.threads.split(",")):
+        seconds = timeclassify(rows, threads, args.repeat)
+        results.append(
+            {
+                "threads": threads,
+                "seconds": round(seconds, 4),
+                "speedup": round(serial / seconds, 2),
+            }
+        )
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    report = {
+        "python": sys.version.split()[0],
+        "free_threaded_build": bool(sysconfig.get_config_var("Py_GIL_DISABLED")),
+        "gil_enabled": gil,
+        "cpus": os.cpu_count(),
+        "rows": args.rows,
+        "serial_seconds": round(serial, 4),
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
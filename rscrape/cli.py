@@ -0,0 +1,32 @@
+"""Entry point of the rscrape console script."""
+
+import sys
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Run the repeater scraper from the command line.
+
+    Only the standard library is imported until the arguments have been
+    parsed, pandas is not imported at all unless the response layout forces
+    the read_html fallback. ``rscrape serve`` starts the HTTP API instead.
+
+    Args:
+        argv (list[str]): Command-line arguments, defaults to sys.argv[1:].
+
+    Returns:
+        None: Processes data and writes output files.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        from rscrape.serve import main as serve_main
+
+        serve_main(argv[1:])
+        return
+
+    from webscrape import main as webscrape_main
+
+    webscrape_main(argv)
+
+
+if __name__ == "__main__":
+    main()
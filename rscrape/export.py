@@ -0,0 +1,171 @@
+"""Typed Parquet and Arrow IPC export of processed repeaters.
+
+Imported only when a run asks for --format parquet or arrow, pyarrow is
+only needed then.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from webscrape import (
+    MODE_DMR,
+    MODE_DSTAR,
+    MODE_FM,
+    MODE_NXDN,
+    MODE_P25,
+    MODE_YSF,
+    REPEATER_HEADER,
+    ExportSink,
+    Repeater,
+    StreamEntry,
+)
+
+# Rows buffered per record batch and Parquet row group
+EXPORT_BATCH = 65536
+
+# Type of each REPEATER_HEADER column, text columns with few distinct values
+# are dictionary encoded
+EXPORT_TYPES: dict[str, pa.DataType] = {
+    "City": pa.dictionary(pa.int32(), pa.string()),
+    "State": pa.dictionary(pa.int32(), pa.string()),
+    "Frequency": pa.float64(),
+    "Offset": pa.float64(),
+    "Offset Direction": pa.dictionary(pa.int32(), pa.string()),
+    "Name": pa.string(),
+    "Distance": pa.float64(),
+    "Direction": pa.dictionary(pa.int32(), pa.string()),
+    "Sponsor": pa.dictionary(pa.int32(), pa.string()),
+    "FM": pa.bool_(),
+    "CTCSS": pa.float64(),
+    "DCS": pa.int16(),
+    "Tone Mode": pa.dictionary(pa.int32(), pa.string()),
+    "DMR": pa.bool_(),
+    "DMR CC": pa.dictionary(pa.int32(), pa.string()),
+    "NXDN": pa.bool_(),
+    "NXDN RAN": pa.dictionary(pa.int32(), pa.string()),
+    "P25": pa.bool_(),
+    "P25 NAC": pa.dictionary(pa.int32(), pa.string()),
+    "D-STAR": pa.bool_(),
+    "YSF": pa.bool_(),
+    "TX Power": pa.dictionary(pa.int32(), pa.string()),
+    "Operating Mode": pa.dictionary(pa.int32(), pa.string()),
+    "AMS": pa.dictionary(pa.int32(), pa.string()),
+    "Comment": pa.string(),
+}
+
+EXPORT_SCHEMA = pa.schema([(name, EXPORT_TYPES[name]) for name in REPEATER_HEADER])
+
+
+def typedrow(repeater: Repeater) -> list[Any]:
+    """Build the typed export row of a repeater, in REPEATER_HEADER order.
+
+    Text is taken from the output row so both files hold the same values,
+    numbers and mode flags from the typed fields. Empty text and numbers
+    that are not numbers become nulls.
+
+    Args:
+        repeater (Repeater): Processed repeater.
+
+    Returns:
+        list: Export row.
+    """
+    row: list[Any] = [None if value == "" else value for value in repeater.row()]
+    modes = repeater.modes
+    row[2] = None if repeater.mhz != repeater.mhz else repeater.mhz
+    row[3] = float(repeater.offset or 0)
+    row[6] = None if repeater.miles != repeater.miles else repeater.miles
+    row[9] = bool(modes & MODE_FM)
+    row[10] = repeater.pltone
+    row[11] = repeater.dcs
+    row[13] = bool(modes & MODE_DMR)
+    row[15] = bool(modes & MODE_NXDN)
+    row[17] = bool(modes & MODE_P25)
+    row[19] = bool(modes & MODE_DSTAR)
+    row[20] = bool(modes & MODE_YSF)
+    return row
+
+
+class RecordWriter(ExportSink):
+    """Typed columnar file of the output repeaters, written in batches.
+
+    Dictionaries of the encoded columns only grow from batch to batch, so an
+    Arrow IPC file gets each batch's new values as a dictionary delta and a
+    Parquet file keeps dictionary pages per row group.
+    """
+
+    def __init__(self, path: str, fmt: str, batch: int = EXPORT_BATCH) -> None:
+        """Open the file.
+
+        Args:
+            path (str): Path of the file to write.
+            fmt (str): "parquet" or "arrow" (Arrow IPC file).
+            batch (int): Rows buffered per record batch.
+
+        Raises:
+            ValueError: If the format is unknown.
+        """
+        if fmt == "parquet":
+            self.writer: Any = pq.ParquetWriter(path, EXPORT_SCHEMA, compression="zstd")
+        elif fmt == "arrow":
+            options = pa.ipc.IpcWriteOptions(
+                compression="zstd", emit_dictionary_deltas=True
+            )
+            self.writer = pa.ipc.new_file(path, EXPORT_SCHEMA, options=options)
+        else:
+            raise ValueError(f"Invalid format {fmt}")
+        self.batch = batch
+        self.rows: list[list[Any]] = []
+        # Empty text is written as null, the unused "" entry keeps a column
+        # that is all null in the first batch from starting with an empty
+        # dictionary, which an IPC file cannot extend with a delta
+        self.dictionaries: dict[str, dict[str, int]] = {
+            name: {"": 0}
+            for name, kind in EXPORT_TYPES.items()
+            if pa.types.is_dictionary(kind)
+        }
+
+    def write(self, entry: StreamEntry) -> None:
+        """Add an output repeater, writing a batch once enough are buffered.
+
+        Args:
+            entry (StreamEntry): Selected repeater.
+        """
+        if not entry.output:
+            return
+        self.rows.append(typedrow(entry.repeater))
+        if len(self.rows) >= self.batch:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered repeaters as one record batch."""
+        if not self.rows:
+            return
+        arrays = []
+        for index, name in enumerate(REPEATER_HEADER):
+            values = [row[index] for row in self.rows]
+            dictionary = self.dictionaries.get(name)
+            if dictionary is None:
+                arrays.append(pa.array(values, EXPORT_TYPES[name]))
+                continue
+            indices = [
+                None if value is None else dictionary.setdefault(value, len(dictionary))
+                for value in values
+            ]
+            arrays.append(
+                pa.DictionaryArray.from_arrays(
+                    pa.array(indices, pa.int32()),
+                    pa.array(list(dictionary), pa.string()),
+                )
+            )
+        batch = pa.RecordBatch.from_arrays(arrays, schema=EXPORT_SCHEMA)
+        self.writer.write_batch(batch)
+        self.rows = []
+
+    def close(self) -> None:
+        """Write the remaining repeaters and close the file."""
+        self.flush()
+        self.writer.close()
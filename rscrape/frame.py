@@ -0,0 +1,460 @@
+"""Columnar processing of repeater rows with pandas.
+
+Imported only when a run uses --columnar. Produces exactly the repeaters
+of webscrape.processrepeaterdata, but computes each field over the whole
+frame at once. Text columns are factorized first, so every pattern
+is matched once per distinct PL field, location or note rather than once
+per row; large pulls repeat the same PL fields, places and notes many times
+over.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable, Iterator
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from webscrape import (
+    BAND_PLAN,
+    DISTDIR,
+    LOCATION,
+    MODE_DMR,
+    MODE_DSTAR,
+    MODE_FM,
+    MODE_NXDN,
+    MODE_P25,
+    MODE_SETS,
+    MODE_YSF,
+    NAN,
+    NOTES_SCAN,
+    VALID_DCS,
+    VALID_PLS,
+    Repeater,
+    StreamEntry,
+    compilefilter,
+    tofloat,
+)
+
+# PL tone pattern of webscrape.processrepeaterdata
+TONE = r"([6-9]{1}[0-9]{1}\.[0-9]{1}|[1-2]{1}[0-9]{2}\.[0-9]{1})"
+
+
+def bydistinct(
+    column: pd.Series, fields: Callable[[pd.Series], pd.DataFrame]
+) -> pd.DataFrame:
+    """Compute fields once per distinct value of a column.
+
+    Args:
+        column (pandas.Series): Column of raw or output cells.
+        fields (callable): Computes a frame of fields from a column.
+
+    Returns:
+        pandas.DataFrame: The fields of every row of the column.
+    """
+    codes, uniques = pd.factorize(column, use_na_sentinel=False)
+    distinct = fields(pd.Series(uniques, dtype=object))
+    return distinct.take(codes).set_axis(column.index)
+
+
+def contains(column: pd.Series, pattern: str, case: bool = True) -> pd.Series:
+    """Search every cell of a column with a regular expression."""
+    return column.str.contains(pattern, case=case, regex=True).astype(bool)
+
+
+def plfields(pl: pd.Series) -> pd.DataFrame:
+    """Modes and tone named in PL fields."""
+    return pd.DataFrame(
+        {
+            "nxdn": contains(pl, "nxdn", case=False),
+            "ysf": contains(pl, "ysf", case=False),
+            "dstar": contains(pl, "d-star", case=False),
+            "dmr": contains(pl, "dmr", case=False),
+            "p25": contains(pl, "p25", case=False),
+            "tone": pl.str.extract(TONE)[0],
+        }
+    )
+
+
+def notesfields(notes: pd.Series) -> pd.DataFrame:
+    """Modes, codes and tones named in notes.
+
+    Every match of the single-scan notes pattern is extracted at once, and
+    the first match of each of its groups in a note is what a search for
+    that pattern alone would find.
+    """
+    hits = notes.str.extractall(NOTES_SCAN)
+    found = hits.groupby(level=0).first().reindex(notes.index)
+    nxdn = found["nxdn"].notna()
+    dmr = found["dmr"].notna()
+
+    # Empty groups are extracted as missing, so the parts of a NAC come from
+    # the first NAC match itself rather than the first non-empty part
+    nacs = hits[hits["nac"].notna()].groupby(level=0).head(1)
+    nacs = nacs.droplevel(1).reindex(notes.index)
+    nac = "NAC" + nacs["naccolon"].fillna("") + " " + nacs["nacnum"].fillna("UNKNOWN")
+    fields = pd.DataFrame(
+        {
+            "nxdn": nxdn,
+            "ysf": found["ysf"].notna(),
+            "dstar": found["dstar"].notna(),
+            "dmr": dmr,
+            "p25": found["nac"].notna(),
+            # Codes are only read from notes that name the mode themselves
+            "ran": ("R" + found["ran"]).where(nxdn).fillna(""),
+            "cc": ("C" + found["cc"]).where(dmr).fillna(""),
+            "nac": nac.where(nacs["nac"].notna(), ""),
+            "tone": notes.str.extract(TONE)[0],
+        }
+    )
+
+    # DCS from DCS(nnn), then from Dnnn
+    hasnotes = notes != "EMPTY"
+    fields["dcsfound"] = hasnotes & (found["dcs"].notna() | found["dcode"].notna())
+    fields["dcs"] = ""
+    for code in (found["dcsnum"].str.zfill(3), found["dcode"]):
+        fields["dcs"] = fields["dcs"].mask(hasnotes & code.isin(VALID_DCS), code)
+    return fields
+
+
+def locationfields(location: pd.Series) -> pd.DataFrame:
+    """City and state of locations."""
+    return location.str.extract(LOCATION).fillna("UNKNOWN")
+
+
+def distancefields(distance: pd.Series) -> pd.DataFrame:
+    """Distance, direction and miles of distances."""
+    fields = distance.map(str).str.extract(DISTDIR).fillna("UNKNOWN")
+    fields["miles"] = fields[0].map(tofloat)
+    return fields
+
+
+def texts(values: pd.Series, text: str) -> pd.DataFrame:
+    """Cells whose text contains a string."""
+    return pd.DataFrame({0: values.map(str).str.contains(text, regex=False)})
+
+
+def offsetfields(freq: pd.Series) -> pd.DataFrame:
+    """Megahertz, offset and offset direction of frequencies."""
+    mhz = []
+    for value in freq:
+        try:
+            mhz.append(float(value))
+        except ValueError:
+            logging.error(f"Error: '{value}' is not a valid float string")
+            mhz.append(NAN)
+    offset, offset_dir = BAND_PLAN.offsets(mhz)
+    return pd.DataFrame(
+        {"mhz": mhz, "offset": offset.tolist(), "offset_dir": offset_dir.tolist()},
+        dtype=object,
+    )
+
+
+def chirpoffsetfields(offset: pd.Series) -> pd.DataFrame:
+    """CHIRP offsets of offsets."""
+    return pd.DataFrame({0: [f"{abs(float(value)):.6f}" for value in offset]})
+
+
+def typedfields(values: pd.Series, convert: Callable[[str], Any]) -> pd.DataFrame:
+    """Typed values of tone or code text, None where there is none."""
+    return pd.DataFrame(
+        {0: [convert(value) if value else None for value in values]}, dtype=object
+    )
+
+
+def repeaters(columns: list[Any], keep: Any) -> Iterator[Repeater]:
+    """Build the repeaters of the rows kept.
+
+    Args:
+        columns (list): Repeater fields, a str for a field with one value.
+        keep (numpy.ndarray): Boolean row mask.
+
+    Returns:
+        Iterator: Repeater records.
+    """
+    kept = int(keep.sum())
+    values = (
+        column[keep].tolist() if isinstance(column, pd.Series) else [column] * kept
+        for column in columns
+    )
+    return map(Repeater._make, zip(*values, strict=True))
+
+
+def flag(mask: pd.Series, value: str = "TRUE", other: str = "") -> pd.Series:
+    """Turn a boolean column into an output column of two values."""
+    return pd.Series(other, index=mask.index, dtype=object).mask(mask, value)
+
+
+def matches(columns: list[Any], searchfilter: str) -> pd.Series:
+    """Select the rows with the search text in any of their cells.
+
+    Args:
+        columns (list): Output columns, a str for a column with one value.
+        searchfilter (str): Text to search for, "" keeps every row.
+
+    Returns:
+        pandas.Series: Boolean row mask.
+    """
+    index = next(c for c in columns if isinstance(c, pd.Series)).index
+    found = pd.Series(searchfilter == "", index=index)
+    if searchfilter == "":
+        return found
+    for column in columns:
+        if isinstance(column, pd.Series):
+            found |= bydistinct(column, lambda values: texts(values, searchfilter))[0]
+        elif searchfilter in column:
+            found[:] = True
+    return found
+
+
+def processrepeaterframe(
+    rpters: list[list[Any]],
+    repeater_list: list[Repeater],
+    rfilter: list[str],
+    chirp: bool,
+    chirprepeaterlist: list[Repeater],
+    searchfilter: str,
+    exnotes: bool,
+    DEBUG: bool,
+    tx_power: str,
+    ams_mode: str,
+) -> None:
+    """Process raw repeater data column-wise into formatted entries.
+
+    Args:
+        rpters (list): List of raw repeater data entries.
+        repeater_list (list): List to append processed Repeater entries.
+        rfilter (list): List of mode filters (e.g., ['fm', 'ysf']).
+        chirp (bool): Flag to generate CHIRP format output.
+        chirprepeaterlist (list): List to append Repeater entries for CHIRP.
+        searchfilter (str): Text to search for in repeater entries.
+        exnotes (bool): Flag to include extended notes.
+        DEBUG (bool): Flag for debug printing.
+        tx_power (str): Transmit power level.
+        ams_mode (str): AMS mode version ('v1' or 'v2').
+
+    Returns:
+        None: Modifies repeater_list and chirprepeaterlist in place.
+    """
+    for entry in selectrepeaterframe(
+        rpters, rfilter, chirp, searchfilter, exnotes, DEBUG, tx_power, ams_mode
+    ):
+        if entry.location is not None:
+            chirprepeaterlist.append(entry.repeater)
+        if entry.output:
+            repeater_list.append(entry.repeater)
+
+
+def selectrepeaterframe(
+    rpters: list[list[Any]],
+    rfilter: list[str],
+    chirp: bool,
+    searchfilter: str,
+    exnotes: bool,
+    DEBUG: bool,
+    tx_power: str,
+    ams_mode: str,
+) -> Iterator[StreamEntry]:
+    """Select the repeaters to write, processing the rows column-wise.
+
+    The columns are computed at once, then the selected repeaters are built
+    one at a time as the writer takes them.
+
+    Args:
+        rpters (list): List of raw repeater data entries.
+        rfilter (list): List of mode filters (e.g., ['fm', 'ysf']).
+        chirp (bool): Flag to select CHIRP entries as well.
+        searchfilter (str): Text to search for in repeater entries.
+        exnotes (bool): Flag to include extended notes.
+        DEBUG (bool): Flag for debug printing.
+        tx_power (str): Transmit power level.
+        ams_mode (str): AMS mode version ('v1' or 'v2').
+
+    Yields:
+        StreamEntry: Each repeater written to either file.
+    """
+    if not rpters:
+        return
+    if DEBUG:
+        for row in rpters:
+            logging.debug(row)
+
+    # Cells whose text contains "nan" are empty, as in processrepeaterdata
+    raw = pd.DataFrame([row[:7] for row in rpters], dtype=object)
+    empty = {
+        column: bydistinct(raw[column], lambda values: texts(values, "nan"))[0]
+        for column in (0, 1, 2, 3, 5, 6)
+    }
+
+    # City and state
+    location = bydistinct(raw[0].mask(empty[0], ""), locationfields)
+    city = location[0].mask(empty[0], "EMPTY")
+    state = location[1].mask(empty[0], "EMPTY")
+
+    # Frequency, offset looked up once per distinct frequency
+    freq = raw[1].mask(empty[1], "EMPTY")
+    offsets = bydistinct(freq, offsetfields)
+    offset_dir = offsets["offset_dir"]
+
+    call = raw[3].mask(empty[3], "EMPTY")
+    distance = bydistinct(raw[4], distancefields)
+    dist = distance[0]
+    direct = distance[1]
+    sponsor = raw[5].mask(empty[5], "EMPTY")
+    notes = raw[6].mask(empty[6], "EMPTY")
+
+    # Modes named in the PL field or the notes
+    haspl = ~empty[2]
+    hasnotes = notes != "EMPTY"
+    plmodes = bydistinct(raw[2].mask(empty[2], ""), plfields)
+    notemodes = bydistinct(notes, notesfields)
+    nxdn = plmodes["nxdn"] | notemodes["nxdn"]
+    ysf = plmodes["ysf"] | notemodes["ysf"]
+    dstar = plmodes["dstar"] | notemodes["dstar"]
+    dmr = plmodes["dmr"] | notemodes["dmr"]
+    p25 = plmodes["p25"] | notemodes["p25"]
+
+    # PL tone from the PL field, then from the notes
+    plvalid = haspl & plmodes["tone"].isin(VALID_PLS)
+    notevalid = haspl & ~plvalid & notemodes["tone"].isin(VALID_PLS)
+    pltone = plmodes["tone"].where(plvalid, notemodes["tone"].where(notevalid, ""))
+    dcs = notemodes["dcs"]
+    fm = plvalid | notevalid | notemodes["dcsfound"]
+
+    # Some stations are FM and dont have a PL or DCS
+    fm |= ~(ysf | dstar | nxdn | p25 | dmr | fm)
+
+    # Extended Notes
+    if exnotes:
+        comment = (city + "," + state + "," + call + "," + notes).where(hasnotes, "")
+    else:
+        comment = notes
+
+    modes = pd.Series(
+        fm.to_numpy() * MODE_FM
+        | dmr.to_numpy() * MODE_DMR
+        | nxdn.to_numpy() * MODE_NXDN
+        | p25.to_numpy() * MODE_P25
+        | dstar.to_numpy() * MODE_DSTAR
+        | ysf.to_numpy() * MODE_YSF,
+        index=raw.index,
+    )
+    fields = [
+        city,
+        state,
+        freq,
+        offsets["mhz"],
+        offsets["offset"],
+        offset_dir,
+        call,
+        dist,
+        distance["miles"],
+        direct,
+        sponsor,
+        modes,
+        bydistinct(pltone, lambda values: typedfields(values, float))[0],
+        bydistinct(dcs, lambda values: typedfields(values, int))[0],
+        notemodes["cc"],
+        notemodes["ran"],
+        notemodes["nac"],
+        tx_power,
+        ams_mode,
+        notes,
+        comment,
+        pd.Series([row[7] if len(row) > 7 else "" for row in rpters], dtype=object),
+    ]
+
+    # Build Chirp list, numbering only the entries kept. The number is part
+    # of the entry the search text is looked for in, so entries that match
+    # only through their number are found in order.
+    chirpkeep = fm.to_numpy(copy=True) if chirp else np.zeros(len(raw), dtype=bool)
+    if chirp and searchfilter:
+        chirpoffset = bydistinct(offsets["offset"], chirpoffsetfields)[0]
+        chirpcolumns = [
+            call,
+            freq.map(str),
+            offset_dir,
+            chirpoffset,
+            flag(dcs != "", "DTCS", "Tone"),
+            pltone.mask(pltone == "", "88.5"),
+            dcs.mask(dcs == "", "023"),
+            "NN",
+            "FM",
+            "5.00",
+            "",
+            dist + " :: " + call + " :: " + city + " " + state + " :: " + notes,
+        ]
+        found = matches(chirpcolumns, searchfilter).to_numpy()
+        chirpcount = 0
+        for index in np.flatnonzero(chirpkeep):
+            if found[index] or searchfilter in str(chirpcount):
+                chirpcount += 1
+            else:
+                chirpkeep[index] = False
+
+    # Append filtered output
+    keep = pd.Series(True, index=raw.index)
+    if searchfilter:
+        # YSF Operating Mode
+        operating_mode = flag(fm, "FM")
+        ams = pd.Series("N", index=raw.index, dtype=object)
+        if ams_mode == "v1":
+            operating_mode = operating_mode.mask(ysf, "Auto")
+            ams = ams.mask(ysf, "")
+        elif ams_mode == "v2":
+            operating_mode = operating_mode.mask(ysf, "FM")
+            ams = ams.mask(ysf, "Y")
+
+        columns = [
+            city,
+            state,
+            freq,
+            offsets["offset"].map(lambda offset: str(offset) if offset else "0"),
+            offset_dir,
+            call,
+            dist,
+            direct,
+            sponsor,
+            flag(fm),
+            pltone,
+            dcs,
+            flag(pltone != "", "Tone").mask(dcs != "", "DCS"),
+            flag(dmr),
+            notemodes["cc"],
+            flag(nxdn),
+            notemodes["ran"],
+            flag(p25),
+            notemodes["nac"],
+            flag(dstar),
+            flag(ysf),
+            tx_power,
+            operating_mode,
+            ams,
+            comment,
+        ]
+        keep = matches(columns, searchfilter)
+
+    # Look up each row in the filter plan by its mode bits
+    plan = compilefilter(rfilter)
+    wanted = np.array([bool(plan >> bits & 1) for bits in range(MODE_SETS)])
+    keep &= wanted[modes.to_numpy()]
+
+    # Entries of either file, with the CHIRP locations of the CHIRP entries
+    output = keep.to_numpy()
+    selected = output | chirpkeep
+    locations = [
+        location if kept else None
+        for location, kept in zip(
+            (np.cumsum(chirpkeep) - 1)[selected].tolist(),
+            chirpkeep[selected].tolist(),
+            strict=True,
+        )
+    ]
+    yield from map(
+        StreamEntry,
+        repeaters(fields, selected),
+        output[selected].tolist(),
+        locations,
+    )
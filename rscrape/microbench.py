@@ -0,0 +1,389 @@
+"""Microbenchmarks of the hot functions and the offline pipeline.
+
+Run with ``python -m rscrape.microbench``. Every benchmark is timed on the
+synthetic rows and result page of each --rows size, best of --repeat runs.
+--save stores the results as a baseline, --baseline compares them with one
+and exits with status 1 when a benchmark is slower than --threshold allows.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from typing import Any
+
+from rscrape.archive import ReplaySession, ResponseArchive
+from rscrape.bench import syntheticpage, syntheticrows
+from webscrape import (
+    FORMDATA,
+    RepeaterTable,
+    ResponseCache,
+    classifymodes,
+    classifyrepeaters,
+    compilefilter,
+    determineoffset,
+    extractrepeatertable,
+    filteroutput,
+    mergerepeatertables,
+    parserepeatertable,
+    processrepeaterdata,
+    runquery,
+    updatewebformdata,
+)
+
+# Row counts timed by default, 1M rows takes minutes per benchmark so it is
+# only timed when asked for with --rows
+BENCH_ROWS = "1000,10000,100000"
+
+# Reference baseline of the default sizes, for --baseline
+BENCH_BASELINE = os.path.join("bench", "baseline.json")
+
+# Fraction a benchmark may be slower than its baseline before it is flagged
+BENCH_THRESHOLD = 0.10
+
+# Mode filters of the filteroutput benchmark
+BENCH_FILTER = ["dmr+!fm", "ysf", "p25"]
+
+# Query the pipeline benchmark answers from its response cache
+BENCH_QUERY = ("Providence", "RI", "50", "144,440")
+
+
+class BenchData:
+    """Synthetic input of one benchmark size, built once for all benchmarks."""
+
+    def __init__(self, rows: int, seed: int, workdir: str) -> None:
+        """Generate the rows and page.
+
+        Args:
+            rows (int): Number of repeater rows.
+            seed (int): Random seed of the rows.
+            workdir (str): Scratch directory of the pipeline benchmark.
+        """
+        self.rows = syntheticrows(rows, seed)
+        self.page = syntheticpage(self.rows)
+        self.workdir = workdir
+
+
+def benchdetermineoffset(data: BenchData) -> Callable[[], Any]:
+    """Time determineoffset on the frequency of every row."""
+    freqs = [row[1] for row in data.rows]
+    return lambda: [determineoffset(freq) for freq in freqs]
+
+
+def benchclassifymodes(data: BenchData) -> Callable[[], Any]:
+    """Time classifymodes on the PL field and notes of every row."""
+    fields = [
+        (None if pl != pl else pl, "EMPTY" if notes != notes else notes)
+        for _, _, pl, _, _, _, notes in data.rows
+    ]
+    return lambda: [classifymodes(pl, notes) for pl, notes in fields]
+
+
+def benchprocessrepeaterdata(data: BenchData) -> Callable[[], Any]:
+    """Time processrepeaterdata on the rows, with CHIRP entries."""
+
+    def run() -> None:
+        processrepeaterdata(
+            data.rows, [], ["all"], True, 0, [], [], "", False, False, "Low", "v1"
+        )
+
+    return run
+
+
+def benchfilteroutput(data: BenchData) -> Callable[[], Any]:
+    """Time filteroutput on every classified repeater."""
+    repeaters = list(classifyrepeaters(data.rows, False, False, "Low", "v1"))
+    plan = compilefilter(BENCH_FILTER)
+
+    def run() -> None:
+        kept: list[Any] = []
+        for repeater in repeaters:
+            filteroutput(plan, repeater, kept)
+
+    return run
+
+
+def benchextract(data: BenchData) -> Callable[[], Any]:
+    """Time the lxml parse of the result page."""
+    return lambda: extractrepeatertable(data.page)
+
+
+def benchreadhtml(data: BenchData) -> Callable[[], Any]:
+    """Time the pd.read_html parse of the result page."""
+    return lambda: parserepeatertable(data.page)
+
+
+def benchmerge(data: BenchData) -> Callable[[], Any]:
+    """Time the merge of the rows split over four source tables."""
+    header = ("LOC", "FREQ", "PL", "CALL", "DIST/DIR", "SPONSOR", "NOTES")
+    tables = [
+        RepeaterTable(header, sorted(map(tuple, data.rows[i::4]), key=lambda r: r[1]))
+        for i in range(4)
+    ]
+    sources = ["nerep", "nesmc", "csma", "nyrep"]
+    return lambda: mergerepeatertables(tables, sources)
+
+
+def benchpipeline(data: BenchData) -> Callable[[], Any]:
+    """Time a query answered from the response cache, as runquery does it.
+
+    The session replays an empty archive, so a cache miss fails the benchmark
+    instead of reaching the network.
+    """
+    city, state, radius, bands = BENCH_QUERY
+    cache = ResponseCache(
+        os.path.join(data.workdir, "cache"), maxsize=4 * len(data.page) + (1 << 20)
+    )
+    formdata = dict(FORMDATA)
+    updatewebformdata(formdata, city, state, radius, bands, "", "nerep")
+    cache.put(formdata, data.page)
+    archive = ResponseArchive(os.path.join(data.workdir, "archive"))
+    os.makedirs(archive.directory, exist_ok=True)
+    with gzip.open(archive.path, "wt", encoding="UTF8"):
+        pass
+    session = ReplaySession(archive)
+    output = os.path.join(data.workdir, "pipeline.csv")
+
+    def run() -> None:
+        runquery(
+            session,
+            city,
+            state,
+            radius,
+            bands,
+            ["all"],
+            output,
+            True,
+            "",
+            0,
+            "nerep",
+            False,
+            False,
+            "Low",
+            "v1",
+            cache,
+        )
+
+    return run
+
+
+# Benchmarks by name, each builds the timed call from the synthetic data.
+# pipeline answers a query from the response cache and writes the CSV and
+# CHIRP files, everything but the POST
+BENCHMARKS: dict[str, Callable[[BenchData], Callable[[], Any]]] = {
+    "determineoffset": benchdetermineoffset,
+    "classifymodes": benchclassifymodes,
+    "processrepeaterdata": benchprocessrepeaterdata,
+    "filteroutput": benchfilteroutput,
+    "extract": benchextract,
+    "read_html": benchreadhtml,
+    "merge": benchmerge,
+    "pipeline": benchpipeline,
+}
+
+
+def timebest(call: Callable[[], Any], repeat: int) -> float:
+    """Time a call, best of several runs.
+
+    Args:
+        call (callable): Timed call.
+        repeat (int): Number of runs.
+
+    Returns:
+        float: Seconds of the fastest run.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def runbenchmarks(
+    names: list[str], sizes: list[int], repeat: int, seed: int = 0
+) -> list[dict[str, Any]]:
+    """Time benchmarks at every size.
+
+    Args:
+        names (list): Benchmark names, keys of BENCHMARKS.
+        sizes (list): Row counts.
+        repeat (int): Runs per measurement.
+        seed (int): Random seed of the synthetic data.
+
+    Returns:
+        list: Benchmark, rows, seconds and rows per second of every run.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in sizes:
+            data = BenchData(rows, seed, workdir)
+            for name in names:
+                seconds = timebest(BENCHMARKS[name](data), repeat)
+                results.append(
+                    {
+                        "benchmark": name,
+                        "rows": rows,
+                        "seconds": round(seconds, 6),
+                        "rows_per_second": round(rows / seconds) if seconds else 0,
+                    }
+                )
+    return results
+
+
+def comparebaseline(
+    results: list[dict[str, Any]],
+    baseline: list[dict[str, Any]],
+    threshold: float = BENCH_THRESHOLD,
+) -> list[dict[str, Any]]:
+    """Compare results with a baseline.
+
+    Args:
+        results (list): Results of runbenchmarks.
+        baseline (list): Results saved earlier.
+        threshold (float): Fraction slower that is a regression, and faster
+            that is an improvement.
+
+    Returns:
+        list: The results with the baseline seconds, the change as a
+        fraction and a status of "regression", "improved", "ok" or "new".
+    """
+    base = {(entry["benchmark"], entry["rows"]): entry["seconds"] for entry in baseline}
+    compared = []
+    for result in results:
+        before = base.get((result["benchmark"], result["rows"]))
+        change = None
+        status = "new"
+        if before:
+            change = round(result["seconds"] / before - 1, 4)
+            if change > threshold:
+                status = "regression"
+            elif change < -threshold:
+                status = "improved"
+            else:
+                status = "ok"
+        compared.append(
+            {**result, "baseline_seconds": before, "change": change, "status": status}
+        )
+    return compared
+
+
+def formatreport(results: list[dict[str, Any]]) -> str:
+    """Format results, compared or not, as a text table.
+
+    Args:
+        results (list): Results of runbenchmarks or comparebaseline.
+
+    Returns:
+        str: One line per result under a header line.
+    """
+    lines = [
+        f"{'benchmark':<20} {'rows':>8} {'seconds':>10} {'rows/s':>11} "
+        f"{'baseline':>10} {'change':>8}  status"
+    ]
+    for result in results:
+        before = result.get("baseline_seconds")
+        change = result.get("change")
+        lines.append(
+            f"{result['benchmark']:<20} {result['rows']:>8} "
+            f"{result['seconds']:>10.4f} {result['rows_per_second']:>11} "
+            f"{'' if before is None else f'{before:.4f}':>10} "
+            f"{'' if change is None else f'{change:+.1%}':>8}  "
+            f"{result.get('status', '')}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Run the benchmarks, print the report and save or compare baselines.
+
+    Args:
+        argv (list[str]): Command-line arguments, defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows",
+        default=BENCH_ROWS,
+        help=f"Comma-separated row counts (default: {BENCH_ROWS})",
+    )
+    parser.add_argument(
+        "--only",
+        default=",".join(BENCHMARKS),
+        help="Comma-separated benchmarks to run (default: all of "
+        + ", ".join(BENCHMARKS)
+        + ")",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic data seed")
+    parser.add_argument("--save", metavar="FILE", help="Save the results as a baseline")
+    parser.add_argument(
+        "--baseline",
+        metavar="FILE",
+        help=f"Compare with a baseline, i.e. the reference {BENCH_BASELINE}",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=BENCH_THRESHOLD,
+        help="Fraction slower than the baseline flagged as a regression "
+        f"(default: {BENCH_THRESHOLD})",
+    )
+    parser.add_argument("--json", metavar="FILE", help="Also write the report as JSON")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    names = [name.strip() for name in args.only.split(",") if name.strip()]
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f"Invalid benchmark '{name}'")
+    try:
+        sizes = [int(rows) for rows in args.rows.split(",")]
+    except ValueError:
+        parser.error("Row counts must be numeric")
+
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline, encoding="UTF8") as f:
+                baseline = json.load(f)["results"]
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f"Error reading baseline: {e}")
+
+    results = runbenchmarks(names, sizes, args.repeat, args.seed)
+    if baseline is not None:
+        results = comparebaseline(results, baseline, args.threshold)
+    print(formatreport(results))
+
+    report = {
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "threshold": args.threshold,
+        "results": results,
+    }
+    for path in (args.save, args.json):
+        if path:
+            with open(path, "w", encoding="UTF8") as f:
+                json.dump(report, f, indent=2)
+                f.write("\n")
+
+    regressions = [r for r in results if r.get("status") == "regression"]
+    if regressions:
+        print(
+            f"{len(regressions)} benchmarks slower than the baseline by more than "
+            f"{args.threshold:.0%}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+"""Local mirror of every database, answering radius queries offline.
+
+Imported only when a run uses --mirror. The mirror is pulled once with
+--update-mirror: every database is queried over every band around the middle
+of the region, each repeater is placed at the centroid of its city and the
+rows are saved. A query from any city in the gazetteer is then answered from
+a latitude/longitude grid index, with the great-circle distance and compass
+direction computed here in the DIST/DIR format the databases publish, so the
+rows go through the same merge, classify and export as fetched ones.
+
+gazetteer.csv.gz holds the mean position of the ZIP codes of every city of
+the region's states, coordinates from GeoNames (CC BY 4.0).
+"""
+
+from __future__ import annotations
+
+import csv
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from webscrape import (
+    BAND_RANGES,
+    DB_SOURCES,
+    DISTDIR,
+    FORMDATA,
+    LOCATION,
+    NAN,
+    VALID_BANDS,
+    RepeaterTable,
+    ResponseCache,
+    fetchrepeatertables,
+    freqkey,
+    ismissing,
+    tofloat,
+)
+
+if TYPE_CHECKING:
+    import requests
+
+# City centroids bundled with the package
+GAZETTEER_FILE = os.path.join(os.path.dirname(__file__), "gazetteer.csv.gz")
+
+# Mirror file in the --mirror directory
+MIRROR_FILE = "mirror.jsonl.gz"
+
+# Location every database is pulled around, and the radius in miles that
+# covers the whole region from it
+MIRROR_CENTER = ("Worcester", "MA")
+MIRROR_RADIUS = "500"
+
+EARTH_RADIUS = 3958.8  # mean radius of the earth in miles
+
+GRID_DEGREES = 0.25  # latitude/longitude size of a spatial index cell
+
+# Compass points of the published directions, clockwise from north
+COMPASS = ("N", "NE", "E", "SE", "S", "SW", "W", "NW")
+
+# Abbreviated first words of city names, as spelled out in the gazetteer
+PLACE_ABBREVIATIONS = {
+    "E": "EAST",
+    "W": "WEST",
+    "N": "NORTH",
+    "S": "SOUTH",
+    "ST": "SAINT",
+    "MT": "MOUNT",
+    "FT": "FORT",
+    "PT": "POINT",
+}
+
+
+@lru_cache(maxsize=1)
+def loadgazetteer(
+    path: str = GAZETTEER_FILE,
+) -> dict[tuple[str, str], tuple[float, float]]:
+    """Read the city centroids.
+
+    Args:
+        path (str): Gzipped CSV of city, state, lat and lon.
+
+    Returns:
+        dict: Latitude and longitude by upper case city and state.
+    """
+    with gzip.open(path, "rt", encoding="UTF8", newline="") as f:
+        return {
+            (row["city"], row["state"]): (float(row["lat"]), float(row["lon"]))
+            for row in csv.DictReader(f)
+        }
+
+
+def placenames(city: str) -> list[str]:
+    """List the gazetteer spellings a city name may have.
+
+    Args:
+        city (str): City name as typed or published, e.g. "E. Providence".
+
+    Returns:
+        list: Upper case candidates, the name itself first.
+    """
+    name = " ".join(re.sub(r"[.\-]", " ", city).upper().split())
+    names = [name]
+    first, _, rest = name.partition(" ")
+    if rest and first in PLACE_ABBREVIATIONS:
+        names.append(f"{PLACE_ABBREVIATIONS[first]} {rest}")
+    if "/" in name:
+        names.extend(placenames(name.split("/")[0]))
+    return names
+
+
+def locate(city: str, state: str) -> tuple[float, float] | None:
+    """Find the centroid of a city.
+
+    Args:
+        city (str): City name.
+        state (str): Two-letter state abbreviation.
+
+    Returns:
+        tuple: Latitude and longitude, or None if the city is not listed.
+    """
+    gazetteer = loadgazetteer()
+    for name in placenames(city):
+        position = gazetteer.get((name, state.upper()))
+        if position is not None:
+            return position
+    return None
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points with the haversine formula.
+
+    Args:
+        lat1 (float): Latitude of the first point in degrees.
+        lon1 (float): Longitude of the first point in degrees.
+        lat2 (float): Latitude of the second point in degrees.
+        lon2 (float): Longitude of the second point in degrees.
+
+    Returns:
+        float: Distance in miles.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bearing(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Initial bearing from the first point to the second.
+
+    Args:
+        lat1 (float): Latitude of the first point in degrees.
+        lon1 (float): Longitude of the first point in degrees.
+        lat2 (float): Latitude of the second point in degrees.
+        lon2 (float): Longitude of the second point in degrees.
+
+    Returns:
+        float: Degrees clockwise from north, 0 to 360.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dlon = math.radians(lon2 - lon1)
+    y = math.sin(dlon) * math.cos(phi2)
+    x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(
+        dlon
+    )
+    return math.degrees(math.atan2(y, x)) % 360
+
+
+def destination(
+    lat: float, lon: float, degrees: float, miles: float
+) -> tuple[float, float]:
+    """Point reached travelling a distance along a bearing.
+
+    Args:
+        lat (float): Latitude of the start in degrees.
+        lon (float): Longitude of the start in degrees.
+        degrees (float): Bearing clockwise from north.
+        miles (float): Distance travelled.
+
+    Returns:
+        tuple: Latitude and longitude of the end point.
+    """
+    phi, theta = math.radians(lat), math.radians(degrees)
+    delta = miles / EARTH_RADIUS
+    phi2 = math.asin(
+        math.sin(phi) * math.cos(delta)
+        + math.cos(phi) * math.sin(delta) * math.cos(theta)
+    )
+    lam2 = math.radians(lon) + math.atan2(
+        math.sin(theta) * math.sin(delta) * math.cos(phi),
+        math.cos(delta) - math.sin(phi) * math.sin(phi2),
+    )
+    return math.degrees(phi2), (math.degrees(lam2) + 540) % 360 - 180
+
+
+def formatdistdir(miles: float, degrees: float) -> str:
+    """Format a distance and bearing as a DIST/DIR cell, e.g. "12.3NE".
+
+    Args:
+        miles (float): Distance in miles.
+        degrees (float): Bearing clockwise from north.
+
+    Returns:
+        str: Distance with one decimal and the compass point, no point for
+        a repeater in the city searched from.
+    """
+    text = f"{min(miles, 999.9):.1f}"
+    if text == "0.0":
+        return text
+    return text + COMPASS[int((degrees + 22.5) // 45) % len(COMPASS)]
+
+
+def placedistdir(origin: tuple[float, float], cell: str) -> tuple[float, float] | None:
+    """Place a repeater at its published distance and direction from a point.
+
+    Args:
+        origin (tuple): Latitude and longitude the distance was measured from.
+        cell (str): DIST/DIR cell, e.g. "12.3NE", no direction at the point.
+
+    Returns:
+        tuple: Latitude and longitude, or None if the distance or direction
+        is not one the databases publish.
+    """
+    distdir = DISTDIR.search(cell)
+    if distdir is None:
+        return None
+    direction = distdir.group(2)
+    if not direction:
+        return origin
+    miles = tofloat(distdir.group(1))
+    if direction not in COMPASS or miles != miles:
+        return None
+    return destination(*origin, COMPASS.index(direction) * 45, miles)
+
+
+class GridIndex:
+    """Points bucketed in latitude/longitude cells for radius searches.
+
+    A search only measures the points of the cells overlapping the bounding
+    box of the circle, instead of every point.
+    """
+
+    def __init__(self, degrees: float = GRID_DEGREES) -> None:
+        """Create an empty index.
+
+        Args:
+            degrees (float): Latitude and longitude size of a cell.
+        """
+        self.degrees = degrees
+        self.cells: dict[tuple[int, int], list[tuple[float, float, Any]]] = {}
+
+    def add(self, lat: float, lon: float, item: Any) -> None:
+        """Index an item at a point.
+
+        Args:
+            lat (float): Latitude in degrees.
+            lon (float): Longitude in degrees.
+            item: Item returned by searches.
+        """
+        cell = (math.floor(lat / self.degrees), math.floor(lon / self.degrees))
+        self.cells.setdefault(cell, []).append((lat, lon, item))
+
+    def within(
+        self, lat: float, lon: float, miles: float
+    ) -> list[tuple[float, float, Any]]:
+        """Find the items within a distance of a point.
+
+        Args:
+            lat (float): Latitude of the center in degrees.
+            lon (float): Longitude of the center in degrees.
+            miles (float): Search radius.
+
+        Returns:
+            list: Distance, bearing from the center and item of every match.
+        """
+        dlat = math.degrees(miles / EARTH_RADIUS)
+        widest = math.radians(min(89.0, abs(lat) + dlat))
+        dlon = min(180.0, dlat / math.cos(widest))
+        found = []
+        for row in range(
+            math.floor((lat - dlat) / self.degrees),
+            math.floor((lat + dlat) / self.degrees) + 1,
+        ):
+            for column in range(
+                math.floor((lon - dlon) / self.degrees),
+                math.floor((lon + dlon) / self.degrees) + 1,
+            ):
+                for plat, plon, item in self.cells.get((row, column), ()):
+                    miles_away = distance(lat, lon, plat, plon)
+                    if miles_away <= miles:
+                        found.append((miles_away, bearing(lat, lon, plat, plon), item))
+        return found
+
+
+class MirrorEntry(NamedTuple):
+    """Repeater row of the mirror and the point it is placed at."""
+
+    source: str
+    lat: float
+    lon: float
+    row: tuple[Any, ...]
+
+
+class RepeaterMirror:
+    """Every repeater of every database, indexed by position."""
+
+    def __init__(
+        self,
+        entries: list[MirrorEntry],
+        headers: dict[str, tuple[str, ...]],
+        built: float = 0.0,
+    ) -> None:
+        """Index mirrored rows.
+
+        Args:
+            entries (list): Positioned rows.
+            headers (dict): Table header of each mirrored database.
+            built (float): Time the databases were pulled.
+        """
+        self.entries = entries
+        self.headers = headers
+        self.built = built
+        self.index = GridIndex()
+        for entry in entries:
+            self.index.add(entry.lat, entry.lon, entry)
+
+    @classmethod
+    def fromtables(
+        cls,
+        tables: list[RepeaterTable],
+        sources: list[str],
+        center: tuple[str, str] = MIRROR_CENTER,
+    ) -> RepeaterMirror:
+        """Position the rows of tables pulled around a center.
+
+        A repeater is placed at the centroid of its city, one in a city the
+        gazetteer does not list at the published distance and direction from
+        the center, rows with neither are left out.
+
+        Args:
+            tables (list): Parsed repeater tables, one per source.
+            sources (list): Database of each table.
+            center (tuple): City and state the tables were pulled around.
+
+        Raises:
+            ValueError: If the center or a table column is unknown.
+
+        Returns:
+            RepeaterMirror: Mirror of the tables.
+        """
+        origin = locate(*center)
+        if origin is None:
+            raise ValueError(f"Unknown location {center[0]}, {center[1]}")
+        entries = []
+        headers = {}
+        skipped = 0
+        for table, source in zip(tables, sources, strict=True):
+            headers[source] = table.header
+            locindex = table.header.index("LOC")
+            distindex = table.header.index("DIST/DIR")
+            for row in table.rows:
+                position = None
+                location = LOCATION.search(str(row[locindex]))
+                if location:
+                    position = locate(location.group(1).strip(), location.group(2))
+                if position is None:
+                    position = placedistdir(origin, str(row[distindex]))
+                if position is None:
+                    skipped += 1
+                    continue
+                entries.append(MirrorEntry(source, *position, row))
+        if skipped:
+            logging.info(f"Mirror left out {skipped} rows without a location")
+        return cls(entries, headers, time.time())
+
+    @classmethod
+    def load(cls, directory: str) -> RepeaterMirror:
+        """Read the mirror saved in a directory.
+
+        Args:
+            directory (str): Mirror directory.
+
+        Raises:
+            OSError: If the directory holds no mirror.
+            ValueError: If the mirror file is not valid.
+
+        Returns:
+            RepeaterMirror: The saved mirror.
+        """
+        path = os.path.join(directory, MIRROR_FILE)
+        with gzip.open(path, "rt", encoding="UTF8") as f:
+            meta = json.loads(f.readline())
+            entries = []
+            for line in f:
+                record = json.loads(line)
+                row = tuple(NAN if cell is None else cell for cell in record["row"])
+                entries.append(
+                    MirrorEntry(record["source"], record["lat"], record["lon"], row)
+                )
+        headers = {source: tuple(header) for source, header in meta["headers"].items()}
+        return cls(entries, headers, meta["built"])
+
+    def save(self, directory: str) -> None:
+        """Write the mirror to a directory, replacing the saved one at once.
+
+        Args:
+            directory (str): Mirror directory, created if needed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, MIRROR_FILE)
+        with gzip.open(path + ".tmp", "wt", encoding="UTF8") as f:
+            meta = {"built": self.built, "headers": self.headers}
+            f.write(json.dumps(meta) + "\n")
+            for entry in self.entries:
+                record = {
+                    "source": entry.source,
+                    "lat": round(entry.lat, 5),
+                    "lon": round(entry.lon, 5),
+                    "row": [None if ismissing(cell) else cell for cell in entry.row],
+                }
+                f.write(json.dumps(record) + "\n")
+        os.replace(path + ".tmp", path)
+
+    def tables(
+        self, city: str, state: str, radius: str, bands: str, sources: list[str]
+    ) -> list[RepeaterTable]:
+        """Answer a query from the mirror.
+
+        Args:
+            city (str): The city to search from.
+            state (str): The two-letter state abbreviation.
+            radius (str): The search radius in miles.
+            bands (str): Comma-separated list of bands to search.
+            sources (list): Databases to answer from.
+
+        Raises:
+            ValueError: If the city or a database is not in the mirror.
+
+        Returns:
+            list: One RepeaterTable per source, in the order of sources, rows
+            sorted by frequency with the computed DIST/DIR.
+        """
+        origin = locate(city, state)
+        if origin is None:
+            raise ValueError(f"Unknown location {city}, {state}")
+        for source in sources:
+            if source not in self.headers:
+                raise ValueError(f"Database {source} is not in the mirror")
+        ranges = [BAND_RANGES[band] for band in bands.split(",") if band]
+        columns = {
+            source: (header.index("FREQ"), header.index("DIST/DIR"))
+            for source, header in self.headers.items()
+        }
+
+        found: dict[str, list[tuple[Any, ...]]] = {source: [] for source in sources}
+        for miles, degrees, entry in sorted(
+            self.index.within(*origin, float(radius)), key=lambda match: match[0]
+        ):
+            rows = found.get(entry.source)
+            if rows is None:
+                continue
+            freqindex, distindex = columns[entry.source]
+            mhz = tofloat(entry.row[freqindex])
+            if not any(low <= mhz <= high for low, high in ranges):
+                continue
+            row = list(entry.row)
+            row[distindex] = formatdistdir(miles, degrees)
+            rows.append(tuple(row))
+
+        tables = []
+        for source in sources:
+            header = self.headers[source]
+            freqindex = header.index("FREQ")
+            rows = sorted(found[source], key=lambda row: freqkey(row[freqindex]))
+            tables.append(RepeaterTable(header, rows))
+        return tables
+
+
+def updatemirror(
+    session: requests.Session,
+    directory: str,
+    DEBUG: bool = False,
+    cache: ResponseCache | None = None,
+) -> RepeaterMirror:
+    """Pull every database over every band and save it as the mirror.
+
+    Args:
+        session (requests.Session): Shared pooled session.
+        directory (str): Mirror directory.
+        DEBUG (bool): Flag for debug printing.
+        cache (ResponseCache): Optional response cache.
+
+    Returns:
+        RepeaterMirror: The new mirror.
+    """
+    sources = list(DB_SOURCES)
+    bands = ",".join(sorted(VALID_BANDS, key=int))
+    tables = fetchrepeatertables(
+        session,
+        FORMDATA,
+        *MIRROR_CENTER,
+        MIRROR_RADIUS,
+        bands,
+        "",
+        sources,
+        DEBUG,
+        cache,
+    )
+    mirror = RepeaterMirror.fromtables(tables, sources)
+    mirror.save(directory)
+    logging.info(f"Mirrored {len(mirror.entries)} repeaters into {directory}")
+    return mirror
@@ -0,0 +1,212 @@
+"""In-memory search index over processed repeaters.
+
+Imported by rscrape serve, whose q= parameter searches the classified
+repeaters it keeps in memory many times; -z/--search keeps its single
+substring scan of the written rows.
+"""
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_left
+from collections.abc import Iterable
+
+from webscrape import Repeater
+
+# Repeater fields that are indexed, and can scope a query term as field:text
+SEARCH_FIELDS = ("call", "city", "state", "sponsor", "notes", "freq")
+
+# Words of a field, dotted numbers such as 146.940 stay one word
+SEARCH_TOKEN = re.compile(r"\w+(?:\.\w+)*")
+
+
+def trigrams(text: str) -> set[str]:
+    """Split text into its overlapping three character pieces.
+
+    Args:
+        text (str): Lowercase text.
+
+    Returns:
+        set: Every three character substring of the text.
+    """
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def termfields(term: str) -> tuple[tuple[str, ...], str]:
+    """Split a query term into the fields it searches and its text.
+
+    Args:
+        term (str): Query term, [field:]text or [field:]*text.
+
+    Raises:
+        ValueError: If the term names a field that is not indexed.
+
+    Returns:
+        tuple: Field names and lowercase text.
+    """
+    field, scoped, text = term.partition(":")
+    if not scoped:
+        return SEARCH_FIELDS, term.lower()
+    if field.lower() not in SEARCH_FIELDS:
+        raise ValueError(f"Invalid search field {field}")
+    return (field.lower(),), text.lower()
+
+
+class SearchIndex:
+    """Token and trigram index of a list of repeaters.
+
+    Built once over processed records, after which every query is answered
+    from posting sets instead of scanning every field of every row. A query
+    is one or more whitespace separated terms that must all match, matching
+    ignores case:
+
+        nb1              a word starting with nb1 in any field
+        call:NB1RI       a call sign word starting with NB1RI
+        call:W1-AB       the call sign words w1 and a word starting with ab
+        sponsor:arrl     a sponsor word starting with arrl
+        notes:*meister   meister anywhere in the notes, inside words too
+    """
+
+    def __init__(self, repeaters: Iterable[Repeater]) -> None:
+        """Index repeaters.
+
+        Args:
+            repeaters (iterable): Processed repeaters, kept in the given order.
+        """
+        self.repeaters = list(repeaters)
+        self.texts: dict[str, list[str]] = {}
+        self.words: dict[str, dict[str, set[int]]] = {}
+        self.sortedwords: dict[str, list[str]] = {}
+        self.pieces: dict[str, dict[str, set[int]]] = {}
+        for field in SEARCH_FIELDS:
+            texts = [str(getattr(r, field)).lower() for r in self.repeaters]
+            words: dict[str, set[int]] = {}
+            pieces: dict[str, set[int]] = {}
+            for number, text in enumerate(texts):
+                for word in SEARCH_TOKEN.findall(text):
+                    words.setdefault(word, set()).add(number)
+                for piece in trigrams(text):
+                    pieces.setdefault(piece, set()).add(number)
+            self.texts[field] = texts
+            self.words[field] = words
+            self.sortedwords[field] = sorted(words)
+            self.pieces[field] = pieces
+
+    def __len__(self) -> int:
+        """Return the number of indexed repeaters."""
+        return len(self.repeaters)
+
+    def prefixmatches(self, field: str, prefix: str) -> set[int]:
+        """Find the repeaters with a word starting with prefix in a field.
+
+        Args:
+            field (str): Indexed field name.
+            prefix (str): Lowercase word prefix.
+
+        Returns:
+            set: Positions of the matching repeaters.
+        """
+        sortedwords = self.sortedwords[field]
+        words = self.words[field]
+        found: set[int] = set()
+        for position in range(bisect_left(sortedwords, prefix), len(sortedwords)):
+            word = sortedwords[position]
+            if not word.startswith(prefix):
+                break
+            found |= words[word]
+        return found
+
+    def wordmatches(self, field: str, text: str) -> set[int]:
+        """Find the repeaters with words of a field starting like text.
+
+        The text is split into words the way the fields are, so W1-ABC matches
+        a call sign indexed as w1 and abc. Text of several words must also
+        appear in the field as written.
+
+        Args:
+            field (str): Indexed field name.
+            text (str): Lowercase text.
+
+        Returns:
+            set: Positions of the matching repeaters.
+        """
+        words = SEARCH_TOKEN.findall(text)
+        if not words:
+            return set()
+        found = self.prefixmatches(field, words[0])
+        for word in words[1:]:
+            if not found:
+                return found
+            found &= self.prefixmatches(field, word)
+        if len(words) > 1:
+            texts = self.texts[field]
+            found = {number for number in found if text in texts[number]}
+        return found
+
+    def substringmatches(self, field: str, text: str) -> set[int]:
+        """Find the repeaters with text anywhere in a field.
+
+        Candidates sharing every trigram of the text are checked against the
+        field, texts shorter than a trigram are checked against every row.
+
+        Args:
+            field (str): Indexed field name.
+            text (str): Lowercase text.
+
+        Returns:
+            set: Positions of the matching repeaters.
+        """
+        texts = self.texts[field]
+        if len(text) < 3:
+            return {number for number, value in enumerate(texts) if text in value}
+        pieces = self.pieces[field]
+        candidates: set[int] | None = None
+        for piece in sorted(trigrams(text), key=lambda p: len(pieces.get(p, ()))):
+            posting = pieces.get(piece)
+            if not posting:
+                return set()
+            candidates = posting if candidates is None else candidates & posting
+        return {number for number in candidates or () if text in texts[number]}
+
+    def termmatches(self, term: str) -> set[int]:
+        """Find the repeaters matching one query term.
+
+        Args:
+            term (str): Query term, [field:]text or [field:]*text.
+
+        Raises:
+            ValueError: If the term names a field that is not indexed.
+
+        Returns:
+            set: Positions of the matching repeaters.
+        """
+        fields, text = termfields(term)
+        found: set[int] = set()
+        for field in fields:
+            if text.startswith("*"):
+                found |= self.substringmatches(field, text[1:])
+            else:
+                found |= self.wordmatches(field, text)
+        return found
+
+    def search(self, query: str) -> list[Repeater]:
+        """Find the repeaters matching every term of a query.
+
+        Args:
+            query (str): Whitespace separated query terms, "" matches all.
+
+        Raises:
+            ValueError: If a term names a field that is not indexed.
+
+        Returns:
+            list: Matching repeaters in indexed order.
+        """
+        found: set[int] | None = None
+        for term in query.split():
+            matches = self.termmatches(term)
+            found = matches if found is None else found & matches
+            if not found:
+                return []
+        if found is None:
+            return list(self.repeaters)
+        return [self.repeaters[number] for number in sorted(found)]
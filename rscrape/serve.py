@@ -0,0 +1,526 @@
+"""Local HTTP/JSON API over the repeater scraper.
+
+Started with ``rscrape serve``. One long-running process keeps the pooled
+session, the response cache and the classified repeaters of recent queries
+in memory, so a repeated query is answered without fetching or parsing.
+The q= parameter searches those repeaters through a SearchIndex built once
+per kept result.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, TypeVar
+from urllib.parse import parse_qs, urlsplit
+
+from rscrape.search import SearchIndex, termfields
+from webscrape import (
+    BATCH_ALIASES,
+    CACHE_TTL,
+    CHIRP_HEADER,
+    DB_SOURCES,
+    REPEATER_HEADER,
+    JSONLinesSink,
+    Repeater,
+    ResponseCache,
+    StreamEntry,
+    classifyrepeaters,
+    createparser,
+    createsession,
+    fetchrepeaterrows,
+    nearestperfrequency,
+    parseflag,
+    recordfields,
+    repeaterrank,
+    selectrepeaters,
+    validatequery,
+)
+
+# Query parameters, named like the long command-line options
+QUERY_FIELDS = (
+    "city",
+    "state",
+    "radius",
+    "bands",
+    "filter",
+    "oneper",
+    "dbfilter",
+    "xnotes",
+    "search",
+    "amsmode",
+    "power",
+    "prefer",
+    "perfreq",
+)
+
+# Parameters that change what is fetched and classified, the others only
+# select from the classified repeaters
+FETCH_FIELDS = (
+    "city",
+    "state",
+    "radius",
+    "bands",
+    "dbfilter",
+    "xnotes",
+    "amsmode",
+    "power",
+    "prefer",
+)
+
+# Response formats and their content types
+RESPONSE_TYPES = {
+    "json": "application/json",
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "chirp": "text/csv; charset=utf-8",
+}
+
+T = TypeVar("T")
+
+SERVE_PORT = 8073
+SERVE_ENTRIES = 256  # queries whose classified repeaters are kept in memory
+RESPONSE_BUFFER = 65536  # characters written to the socket at a time
+
+
+class SingleFlight:
+    """Run a call once for every caller asking for the same key at once.
+
+    The first caller runs it, the others wait for and share its result or
+    its exception.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[Any, Future[Any]] = {}
+
+    def do(self, key: Any, call: Callable[[], T]) -> T:
+        """Run call, or wait for the run already in flight for key.
+
+        Args:
+            key: Hashable key of the call.
+            call (callable): Computes the result.
+
+        Returns:
+            The result of the call.
+        """
+        with self._lock:
+            leader = key not in self._calls
+            future = self._calls.setdefault(key, Future())
+        if leader:
+            try:
+                future.set_result(call())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+        result: T = future.result()
+        return result
+
+
+class RepeaterService:
+    """Classified repeaters of recent queries, fetched once per key.
+
+    Results are kept for ttl seconds, at most entries of them, least
+    recently used first out. Identical queries that arrive while one is
+    being fetched wait for it instead of fetching again.
+    """
+
+    def __init__(
+        self,
+        cache: ResponseCache | None = None,
+        ttl: float = CACHE_TTL,
+        entries: int = SERVE_ENTRIES,
+        DEBUG: bool = False,
+    ) -> None:
+        """Create the service.
+
+        Args:
+            cache (ResponseCache): Optional on-disk response cache.
+            ttl (float): Seconds classified repeaters are served from memory.
+            entries (int): Queries whose repeaters are kept in memory.
+            DEBUG (bool): Flag for debug printing.
+        """
+        self.session = createsession(len(DB_SOURCES))
+        self.cache = cache
+        self.ttl = ttl
+        self.entries = entries
+        self.DEBUG = DEBUG
+        self.flight = SingleFlight()
+        self.fetches = 0
+        self._lock = threading.Lock()
+        self._results: OrderedDict[Any, tuple[float, list[Repeater]]] = OrderedDict()
+        self._indexes: dict[Any, tuple[list[Repeater], SearchIndex]] = {}
+
+    def repeaters(self, query: dict[str, Any]) -> list[Repeater]:
+        """Get the classified repeaters of a query.
+
+        Args:
+            query (dict): Query fields, see QUERY_FIELDS.
+
+        Returns:
+            list: Repeaters in frequency order.
+        """
+        key = tuple(str(query[field]) for field in FETCH_FIELDS)
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None and result[0] > time.monotonic():
+                self._results.move_to_end(key)
+                return result[1]
+        return self.flight.do(key, lambda: self.fetch(key, query))
+
+    def search(self, query: dict[str, Any], text: str) -> list[Repeater]:
+        """Search the classified repeaters of a query.
+
+        The index of a result is built by the first search of it and used
+        until the result is fetched again or dropped.
+
+        Args:
+            query (dict): Query fields, see QUERY_FIELDS.
+            text (str): Search query, see SearchIndex.
+
+        Returns:
+            list: Matching repeaters in frequency order.
+        """
+        key = tuple(str(query[field]) for field in FETCH_FIELDS)
+        repeaters = self.repeaters(query)
+        with self._lock:
+            indexed = self._indexes.get(key)
+        if indexed is None or indexed[0] is not repeaters:
+            index = self.flight.do(
+                ("index", key), lambda: self.buildindex(key, repeaters)
+            )
+        else:
+            index = indexed[1]
+        return index.search(text)
+
+    def buildindex(
+        self, key: tuple[Any, ...], repeaters: list[Repeater]
+    ) -> SearchIndex:
+        """Index the repeaters kept under a key.
+
+        Args:
+            key (tuple): Key the repeaters are kept under.
+            repeaters (list): The kept repeaters.
+
+        Returns:
+            SearchIndex: Index of the repeaters.
+        """
+        index = SearchIndex(repeaters)
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None and result[1] is repeaters:
+                self._indexes[key] = (repeaters, index)
+        return index
+
+    def fetch(self, key: tuple[Any, ...], query: dict[str, Any]) -> list[Repeater]:
+        """Fetch, classify and keep the repeaters of a query.
+
+        Args:
+            key (tuple): Key the repeaters are kept under.
+            query (dict): Query fields.
+
+        Returns:
+            list: Repeaters in frequency order.
+        """
+        with self._lock:
+            self.fetches += 1
+        rows = fetchrepeaterrows(
+            self.session,
+            query["city"],
+            query["state"],
+            str(query["radius"]),
+            query["bands"],
+            0,
+            query["dbfilter"],
+            self.DEBUG,
+            self.cache,
+            prefer=query["prefer"],
+        )
+        repeaters = list(
+            classifyrepeaters(
+                rows,
+                parseflag(query["xnotes"]),
+                self.DEBUG,
+                query["power"],
+                query["amsmode"],
+            )
+        )
+        with self._lock:
+            self._results[key] = (time.monotonic() + self.ttl, repeaters)
+            self._results.move_to_end(key)
+            self._indexes.pop(key, None)
+            while len(self._results) > self.entries:
+                self._indexes.pop(self._results.popitem(last=False)[0], None)
+        return repeaters
+
+
+def parsequery(
+    url: str, defaults: dict[str, Any]
+) -> tuple[dict[str, Any], list[str], str]:
+    """Read and validate the query parameters of a request.
+
+    Args:
+        url (str): Request path with its query string.
+        defaults (dict): Command line defaults of every field.
+
+    Returns:
+        tuple: Query fields, with the index search as "q", mode filters and
+        response format.
+
+    Raises:
+        ValueError: Describing the first unknown or invalid parameter.
+    """
+    query = {field: defaults[field] for field in QUERY_FIELDS}
+    query["q"] = ""
+    fmt = "json"
+    for name, values in parse_qs(urlsplit(url).query).items():
+        name = BATCH_ALIASES.get(name, name)
+        if name == "format":
+            fmt = values[-1].lower()
+        elif name == "q":
+            query["q"] = values[-1]
+        elif name in QUERY_FIELDS:
+            query[name] = values[-1]
+        else:
+            raise ValueError(f"Unknown parameter '{name}'")
+    if fmt not in RESPONSE_TYPES:
+        raise ValueError(f"Invalid format '{fmt}'")
+    query["oneper"] = parseflag(query["oneper"])
+    query["xnotes"] = parseflag(query["xnotes"])
+    rfilter = ["all"] if not query["filter"] else query["filter"].lower().split(",")
+    validatequery(
+        query["state"],
+        str(query["radius"]),
+        query["bands"],
+        query["dbfilter"],
+        query["amsmode"],
+        rfilter,
+        query["prefer"] or "",
+        query["perfreq"] or 0,
+    )
+    query["prefer"] = query["prefer"] or ""
+    query["perfreq"] = 1 if query["oneper"] else int(query["perfreq"] or 0)
+    query["search"] = query["search"] or ""
+    for term in query["q"].split():
+        termfields(term)
+    return query, rfilter, fmt
+
+
+class ResponseStream:
+    """Text stream that writes to a socket in large encoded chunks."""
+
+    def __init__(self, wfile: Any) -> None:
+        self.wfile = wfile
+        self.parts: list[str] = []
+        self.size = 0
+
+    def write(self, text: str) -> None:
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= RESPONSE_BUFFER:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.parts:
+            self.wfile.write("".join(self.parts).encode("UTF8"))
+            self.parts = []
+            self.size = 0
+
+
+def writeresponse(entries: Iterable[StreamEntry], fmt: str, stream: Any) -> None:
+    """Stream selected repeaters in a response format.
+
+    Args:
+        entries (iterable): Selected repeaters.
+        fmt (str): Response format, one of RESPONSE_TYPES.
+        stream (ResponseStream): Stream to write to.
+    """
+    if fmt == "jsonl":
+        sink = JSONLinesSink(stream)
+        for entry in entries:
+            sink.write(entry)
+    elif fmt == "json":
+        separator = ""
+        stream.write("[")
+        for entry in entries:
+            if entry.output:
+                stream.write(separator + json.dumps(recordfields(entry.repeater)))
+                separator = ",\n"
+        stream.write("]\n")
+    else:
+        writer = csv.writer(stream)
+        if fmt == "chirp":
+            writer.writerow(CHIRP_HEADER)
+            for repeater, _, location in entries:
+                if location is not None:
+                    writer.writerow(repeater.chirprow(location))
+        else:
+            writer.writerow(REPEATER_HEADER)
+            for repeater, output, _ in entries:
+                if output:
+                    writer.writerow(repeater.row())
+    stream.flush()
+
+
+def createhandler(
+    service: RepeaterService, defaults: dict[str, Any]
+) -> type[BaseHTTPRequestHandler]:
+    """Build the request handler class of a service.
+
+    Args:
+        service (RepeaterService): Service answering the queries.
+        defaults (dict): Command line defaults of every field.
+
+    Returns:
+        type: Request handler for ThreadingHTTPServer.
+    """
+
+    class RepeaterHandler(BaseHTTPRequestHandler):
+        """GET /repeaters?city=...&q=...&format=json|jsonl|csv|chirp, GET /health."""
+
+        def do_GET(self) -> None:
+            path = urlsplit(self.path).path
+            if path == "/health":
+                self.sendjson(200, {"status": "ok", "fetches": service.fetches})
+                return
+            if path != "/repeaters":
+                self.sendjson(404, {"error": f"Unknown path '{path}'"})
+                return
+            try:
+                query, rfilter, fmt = parsequery(self.path, defaults)
+            except ValueError as e:
+                self.sendjson(400, {"error": str(e)})
+                return
+            try:
+                if query["q"]:
+                    repeaters = service.search(query, query["q"])
+                else:
+                    repeaters = service.repeaters(query)
+            except Exception as e:
+                logging.error(f"Error fetching data: {e}")
+                self.sendjson(502, {"error": str(e)})
+                return
+
+            if query["perfreq"]:
+                repeaters = nearestperfrequency(
+                    repeaters, query["perfreq"], repeaterrank
+                )
+            entries = selectrepeaters(
+                iter(repeaters), rfilter, fmt == "chirp", query["search"]
+            )
+            self.send_response(200)
+            self.send_header("Content-Type", RESPONSE_TYPES[fmt])
+            self.end_headers()
+            writeresponse(entries, fmt, ResponseStream(self.wfile))
+
+        def sendjson(self, status: int, body: dict[str, Any]) -> None:
+            data = json.dumps(body).encode("UTF8")
+            self.send_response(status)
+            self.send_header("Content-Type", RESPONSE_TYPES["json"])
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logging.info(format % args)
+
+    return RepeaterHandler
+
+
+def createserver(host: str, port: int, service: RepeaterService) -> ThreadingHTTPServer:
+    """Create the HTTP server of a service, one thread per request.
+
+    Args:
+        host (str): Address to listen on.
+        port (int): Port to listen on, 0 for any free port.
+        service (RepeaterService): Service answering the queries.
+
+    Returns:
+        ThreadingHTTPServer: The server, not yet serving.
+    """
+    defaults = vars(createparser().parse_args([]))
+    server = ThreadingHTTPServer((host, port), createhandler(service, defaults))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: list[str]) -> None:
+    """Serve the API until interrupted.
+
+    Args:
+        argv (list[str]): Command-line arguments after "serve".
+    """
+    defaults = vars(createparser().parse_args([]))
+    parser = argparse.ArgumentParser(
+        prog="rscrape serve",
+        description="Serve repeater queries over a local HTTP/JSON API",
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=SERVE_PORT,
+        help=f"Port to listen on (default: {SERVE_PORT})",
+    )
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=CACHE_TTL,
+        help=f"Seconds results are served from memory (default: {CACHE_TTL})",
+    )
+    parser.add_argument(
+        "--entries",
+        type=int,
+        default=SERVE_ENTRIES,
+        help=f"Queries whose results are kept in memory (default: {SERVE_ENTRIES})",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the on-disk response cache",
+    )
+    parser.add_argument(
+        "--cache-dir", default=defaults["cache_dir"], help="Response cache directory"
+    )
+    parser.add_argument("-d", "--debug", action="store_true", help="Enable debug mode")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        filename="webscrape.log",
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    cache = None
+    if not args.no_cache:
+        try:
+            cache = ResponseCache(
+                args.cache_dir,
+                ttl=defaults["cache_ttl"],
+                stale=defaults["cache_stale"],
+                maxsize=defaults["cache_size"] * 1024 * 1024,
+            )
+        except OSError as e:
+            logging.error(f"Response cache disabled: {e}")
+
+    service = RepeaterService(cache, args.ttl, args.entries, args.debug)
+    server = createserver(args.host, args.port, service)
+    print(f"Serving on http://{args.host}:{server.server_port}/repeaters")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,175 @@
+"""SQLite store of processed repeaters, accumulated across runs.
+
+Imported only when a run uses --sqlite.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import time
+from types import TracebackType
+from typing import Any
+
+from webscrape import MODE_BITS, ExportSink, StreamEntry
+
+# Rows sent to SQLite per executemany
+STORE_BATCH = 1000
+
+# Seconds a writer waits for another job's transaction on the same store
+STORE_TIMEOUT = 60.0
+
+# One row per repeater each source lists, the mode flags are 0/1 columns so
+# every mode gets a small partial index on state and frequency
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS repeaters (
+    call TEXT NOT NULL,
+    frequency REAL NOT NULL,
+    source TEXT NOT NULL,
+    city TEXT,
+    state TEXT,
+    offset REAL,
+    offset_dir TEXT,
+    distance REAL,
+    direction TEXT,
+    origin TEXT,
+    sponsor TEXT,
+    {modes},
+    ctcss REAL,
+    dcs INTEGER,
+    dmr_cc TEXT,
+    nxdn_ran TEXT,
+    p25_nac TEXT,
+    notes TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (call, frequency, source)
+);
+CREATE INDEX IF NOT EXISTS repeaters_frequency ON repeaters (frequency);
+CREATE INDEX IF NOT EXISTS repeaters_call ON repeaters (call);
+CREATE INDEX IF NOT EXISTS repeaters_state ON repeaters (state, frequency);
+{modeindexes}""".format(
+    modes=",\n    ".join(f"{mode} INTEGER NOT NULL" for mode in MODE_BITS),
+    modeindexes="".join(
+        f"CREATE INDEX IF NOT EXISTS repeaters_{mode} "
+        f"ON repeaters (state, frequency) WHERE {mode};\n"
+        for mode in MODE_BITS
+    ),
+)
+
+STORE_COLUMNS = (
+    "call",
+    "frequency",
+    "source",
+    "city",
+    "state",
+    "offset",
+    "offset_dir",
+    "distance",
+    "direction",
+    "origin",
+    "sponsor",
+    *MODE_BITS,
+    "ctcss",
+    "dcs",
+    "dmr_cc",
+    "nxdn_ran",
+    "p25_nac",
+    "notes",
+    "updated",
+)
+
+STORE_UPSERT = (
+    f"INSERT INTO repeaters ({', '.join(STORE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(STORE_COLUMNS))}) "
+    "ON CONFLICT (call, frequency, source) DO UPDATE SET "
+    + ", ".join(f"{column} = excluded.{column}" for column in STORE_COLUMNS[3:])
+)
+
+
+class RepeaterStore(ExportSink):
+    """SQLite database processed repeaters are upserted into.
+
+    Repeaters are keyed by call, frequency and source database, so runs from
+    many locations and batch jobs accumulate into one table, a repeater seen
+    again is updated in place. The database is in WAL mode, so it can be
+    read while jobs write to it, and every batch of rows is one short
+    transaction, so jobs writing the same file take turns instead of
+    failing.
+    """
+
+    def __init__(self, path: str, origin: str = "") -> None:
+        """Open the store, creating the table and indexes if needed.
+
+        Args:
+            path (str): Path of the SQLite database.
+            origin (str): Location the repeater distances are measured from.
+        """
+        self.origin = origin
+        self.rows: list[tuple[Any, ...]] = []
+        self.connection = sqlite3.connect(path, timeout=STORE_TIMEOUT)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.executescript(STORE_SCHEMA)
+
+    def write(self, entry: StreamEntry) -> None:
+        """Add an output repeater, those without a numeric frequency are skipped.
+
+        Args:
+            entry (StreamEntry): Selected repeater.
+        """
+        repeater = entry.repeater
+        if not entry.output or repeater.mhz != repeater.mhz:
+            return
+        modes = repeater.modes
+        self.rows.append(
+            (
+                repeater.call,
+                round(repeater.mhz, 4),
+                repeater.source,
+                repeater.city,
+                repeater.state,
+                float(repeater.offset or 0),
+                repeater.offset_dir,
+                None if repeater.miles != repeater.miles else repeater.miles,
+                repeater.direct,
+                self.origin,
+                repeater.sponsor,
+                *(int(bool(modes & bit)) for bit in MODE_BITS.values()),
+                repeater.pltone,
+                repeater.dcs,
+                repeater.dmr_cc or None,
+                repeater.nxdn_ran or None,
+                repeater.p25_nac or None,
+                repeater.notes,
+                time.time(),
+            )
+        )
+        if len(self.rows) >= STORE_BATCH:
+            self.flush()
+
+    def flush(self) -> None:
+        """Upsert the buffered repeaters in one transaction."""
+        if self.rows:
+            with self.connection:
+                self.connection.executemany(STORE_UPSERT, self.rows)
+            self.rows = []
+
+    def close(self, flush: bool = True) -> None:
+        """Upsert the remaining repeaters and close the store.
+
+        Args:
+            flush (bool): Upsert the buffered repeaters, or drop them.
+        """
+        try:
+            if flush:
+                self.flush()
+        finally:
+            self.connection.close()
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close(exc_type is None)
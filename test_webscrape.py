@@ -1,4 +1,12 @@
+import importlib.util
+import os
+import random
+import re
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 import unittest
 from typing import Any
 from unittest.mock import MagicMock, mock_open, patch
@@ -6,17 +14,126 @@ from unittest.mock import MagicMock, mock_open, patch
 import pandas as pd
 import requests
 
+from rscrape import cli
+from rscrape.archive import ResponseArchive
+from rscrape.frame import processrepeaterframe
 from webscrape import (
+    BAND_PLAN,
+    MODE_DMR,
+    MODE_DSTAR,
+    MODE_FM,
+    MODE_NXDN,
+    MODE_P25,
+    MODE_YSF,
+    VALID_DCS,
+    VALID_PLS,
+    BandPlan,
+    ModeFlags,
+    OffsetRange,
+    Repeater,
+    RepeaterTable,
+    ResponseCache,
+    StreamEntry,
+    cachekey,
     chirpbuild,
+    classifymodes,
+    classifyrepeaters,
+    classifyrepeatersinpool,
+    compilefilter,
+    createprocesspool,
+    createsession,
     determineoffset,
+    expanddbfilter,
+    extractrepeatertable,
+    fetchrepeaterrows,
+    fetchrepeatertable,
+    fetchrepeatertables,
+    fetchresponsetext,
     filteroutput,
     main,
+    mergerepeatertables,
+    nearestperfrequency,
+    parserepeatertable,
     processrepeaterdata,
+    readbandplan,
+    readbatchjobs,
+    repeaterrank,
+    rowrank,
+    runbatch,
+    selectrepeaters,
+    subsetrepeatertable,
     updatewebformdata,
+    validatequery,
+    writebatchsummary,
+    writerepeaters,
 )
 
+# Repeater with empty fields and no modes
+BLANK = Repeater._make([""] * len(Repeater._fields))._replace(modes=0)
+
+
+def searchmodes(plfield: str | None, notes: str) -> ModeFlags:
+    """Classify a repeater with one re.search per pattern, as rows once were."""
+    flags = dict.fromkeys(ModeFlags._fields, "")
+    tone = r"[6-9]{1}[0-9]{1}\.[0-9]{1}|[1-2]{1}[0-9]{2}\.[0-9]{1}"
+    if plfield is not None:
+        for field, pattern in (
+            ("nxdn", "nxdn"),
+            ("ysf", "ysf"),
+            ("dstar", "d-star"),
+            ("dmr", "dmr"),
+            ("p25", "p25"),
+        ):
+            if re.search(pattern, plfield, re.IGNORECASE):
+                flags[field] = "TRUE"
+    if re.search(r"ysf|fusion", notes, re.IGNORECASE):
+        flags["ysf"] = "TRUE"
+    if re.search("d-star", notes, re.IGNORECASE):
+        flags["dstar"] = "TRUE"
+    if re.search("nxdn", notes, re.IGNORECASE):
+        flags["nxdn"] = "TRUE"
+        code = re.search(r"RAN[0-9]{1,2}", notes)
+        if code:
+            flags["nxdn_ran"] = code.group(0)
+    if re.search("dmr", notes, re.IGNORECASE):
+        flags["dmr"] = "TRUE"
+        code = re.search(r"[C]{2,4}[0-9]{1,2}", notes)
+        if code:
+            flags["dmr_cc"] = code.group(0)
+    nac = re.search(r"(NAC\:|NAC)([0-9]{3,4}|)", notes)
+    if nac:
+        flags["p25"] = "TRUE"
+        flags["p25_nac"] = nac.group(1) + " " + (nac.group(2) or "UNKNOWN")
+    if plfield is not None:
+        for field in (plfield, notes):
+            pl = re.search(tone, field, re.IGNORECASE)
+            if pl and pl.group(0) in VALID_PLS:
+                flags.update(fm="TRUE", pltone=pl.group(0), tonemode="Tone")
+                break
+    if notes != "EMPTY":
+        for opened, pattern in (
+            (r"DCS\(", r"DCS\(([0-9]{1,3})\)"),
+            (r"D[0-9]{3}", r"D([0-9]{3})"),
+        ):
+            if re.search(opened, notes, re.IGNORECASE):
+                flags["fm"] = "TRUE"
+                code = re.search(pattern, notes, re.IGNORECASE)
+                if code and code.group(1).zfill(3) in VALID_DCS:
+                    flags.update(dcs=code.group(1).zfill(3), tonemode="DCS")
+    if not any(flags[f] for f in ("fm", "dmr", "nxdn", "p25", "dstar", "ysf")):
+        flags["fm"] = "TRUE"
+    return ModeFlags(**flags)
+
 
 class TestWebscrape(unittest.TestCase):
+    def setUp(self) -> None:
+        """Point the default response cache at a throwaway directory."""
+        self.cachedir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cachedir.cleanup)
+        env = patch.dict(os.environ, {"XDG_CACHE_HOME": self.cachedir.name})
+        env.start()
+        self.addCleanup(env.stop)
+
     def test_updatewebformdata(self) -> None:
         """Test updating form data with search parameters."""
         formdata = {"existing_key": "value"}
@@ -85,7 +202,7 @@ class TestWebscrape(unittest.TestCase):
         )
 
         self.assertEqual(len(repeater_list), 1)
-        repeater = repeater_list[0]
+        repeater = repeater_list[0].row()
         self.assertEqual(repeater[0], "City")  # City
         self.assertEqual(repeater[1], "ST")  # State
         self.assertEqual(repeater[2], 145.0)  # Freq
@@ -124,7 +241,7 @@ class TestWebscrape(unittest.TestCase):
         )
 
         self.assertEqual(len(repeater_list), 1)
-        repeater = repeater_list[0]
+        repeater = repeater_list[0].row()
         self.assertEqual(repeater[20], "TRUE")  # YSF
         self.assertEqual(repeater[22], "FM")  # Operating Mode for v2
         self.assertEqual(repeater[23], "Y")  # AMS for v2
@@ -160,7 +277,7 @@ class TestWebscrape(unittest.TestCase):
         )
 
         self.assertEqual(len(chirprepeaterlist), 1)
-        chirp_entry = chirprepeaterlist[0]
+        chirp_entry = chirprepeaterlist[0].chirprow(0)
         self.assertEqual(chirp_entry[0], "0")  # Location
         self.assertEqual(chirp_entry[1], "CALL")  # Name
         self.assertEqual(chirp_entry[2], "145.0")  # Frequency
@@ -261,7 +378,7 @@ class TestWebscrape(unittest.TestCase):
         )
 
         self.assertEqual(len(repeater_list), 1)
-        repeater = repeater_list[0]
+        repeater = repeater_list[0].row()
         self.assertEqual(repeater[0], "EMPTY")  # City
         self.assertEqual(repeater[1], "EMPTY")  # State
         self.assertEqual(repeater[2], "EMPTY")  # Freq
@@ -298,7 +415,7 @@ class TestWebscrape(unittest.TestCase):
         )
 
         self.assertEqual(len(repeater_list), 1)
-        repeater = repeater_list[0]
+        repeater = repeater_list[0].row()
         self.assertEqual(repeater[9], "TRUE")  # FM
         self.assertEqual(repeater[11], "023")  # DCS
         self.assertEqual(repeater[12], "DCS")  # Tone Mode
@@ -336,7 +453,7 @@ class TestWebscrape(unittest.TestCase):
         )
 
         self.assertEqual(len(repeater_list), 1)
-        repeater = repeater_list[0]
+        repeater = repeater_list[0].row()
         self.assertEqual(repeater[24], "City,ST,CALL,Extra Notes")  # Extended notes
 
     def test_determineoffset_various_bands(self) -> None:
@@ -389,17 +506,14 @@ class TestWebscrape(unittest.TestCase):
     def test_filteroutput_multiple_modes(self) -> None:
         """Test filtering for various modes."""
         rfilter = ["fm", "ysf"]
-        repeater = [""] * 25
-        repeater[9] = "TRUE"  # FM
-        repeater[20] = "TRUE"  # YSF
+        repeater = BLANK._replace(modes=MODE_FM | MODE_YSF)
         repeater_list: list[list[Any]] = []
         filteroutput(rfilter, repeater, repeater_list)
         self.assertEqual(len(repeater_list), 1)
 
         # Test no match
         repeater_list = []
-        repeater[9] = ""  # No FM
-        repeater[20] = ""  # No YSF
+        repeater = BLANK  # No FM, no YSF
         filteroutput(rfilter, repeater, repeater_list)
         self.assertEqual(len(repeater_list), 0)
 
@@ -412,14 +526,13 @@ class TestWebscrape(unittest.TestCase):
     def test_filteroutput_single_mode(self) -> None:
         """Test filtering for single mode like DMR."""
         rfilter = ["dmr"]
-        repeater = [""] * 25
-        repeater[13] = "TRUE"  # DMR
+        repeater = BLANK._replace(modes=MODE_DMR)
         repeater_list: list[list[Any]] = []
         filteroutput(rfilter, repeater, repeater_list)
         self.assertEqual(len(repeater_list), 1)
 
         repeater_list = []
-        repeater[13] = ""
+        repeater = BLANK
         filteroutput(rfilter, repeater, repeater_list)
         self.assertEqual(len(repeater_list), 0)
 
@@ -487,7 +600,6 @@ class TestWebscrape(unittest.TestCase):
 
     @patch("requests.Session.post")
     @patch("pandas.read_html")
-    @patch("sys.argv", ["webscrape.py", "-d"])  # Debug mode
     def test_main_debug_logging(
         self, mock_read_html: MagicMock, mock_post: MagicMock
     ) -> None:
@@ -507,7 +619,8 @@ class TestWebscrape(unittest.TestCase):
             mock_df,
         ]  # For both nerep and nyrep
 
-        main(sys.argv[1:])
+        # Debug mode, writing into the test's directory
+        main(["-d", "-o", os.path.join(self.cachedir.name, "repeaters.csv")])
 
 
     def test_processrepeaterdata_digital_modes_comprehensive(self) -> None:
@@ -522,7 +635,7 @@ class TestWebscrape(unittest.TestCase):
         )
         
         self.assertEqual(len(repeater_list), 1)
-        repeater = repeater_list[0]
+        repeater = repeater_list[0].row()
         self.assertEqual(repeater[13], "TRUE")  # DMR detected
         self.assertEqual(repeater[14], "CCC1")  # DMR CC from notes
 
@@ -537,7 +650,7 @@ class TestWebscrape(unittest.TestCase):
         )
         
         self.assertEqual(len(repeater_list), 1)
-        repeater = repeater_list[0]
+        repeater = repeater_list[0].row()
         self.assertEqual(repeater[17], "TRUE")  # P25
         self.assertEqual(repeater[18], "NAC 293")   # P25 NAC (includes prefix)
 
@@ -552,7 +665,7 @@ class TestWebscrape(unittest.TestCase):
         )
         
         self.assertEqual(len(repeater_list), 1)
-        repeater = repeater_list[0]
+        repeater = repeater_list[0].row()
         self.assertEqual(repeater[15], "TRUE")  # NXDN detected
         self.assertEqual(repeater[16], "RAN01")  # NXDN RAN from notes
 
@@ -567,7 +680,7 @@ class TestWebscrape(unittest.TestCase):
         )
         
         self.assertEqual(len(repeater_list), 1)
-        repeater = repeater_list[0]
+        repeater = repeater_list[0].row()
         self.assertEqual(repeater[19], "TRUE")  # D-STAR
 
     def test_processrepeaterdata_tone_edge_cases(self) -> None:
@@ -590,7 +703,7 @@ class TestWebscrape(unittest.TestCase):
                 )
                 
                 self.assertEqual(len(repeater_list), 1)
-                repeater = repeater_list[0]
+                repeater = repeater_list[0].row()
                 self.assertEqual(repeater[10], expected_tone)    # CTCSS
                 self.assertEqual(repeater[12], expected_mode)    # Tone Mode
 
@@ -613,7 +726,7 @@ class TestWebscrape(unittest.TestCase):
                 )
                 
                 self.assertEqual(len(repeater_list), 1)
-                repeater = repeater_list[0]
+                repeater = repeater_list[0].row()
                 self.assertEqual(repeater[2], expected_freq)
 
     def test_processrepeaterdata_distance_direction_parsing(self) -> None:
@@ -635,7 +748,7 @@ class TestWebscrape(unittest.TestCase):
                 )
                 
                 self.assertEqual(len(repeater_list), 1)
-                repeater = repeater_list[0]
+                repeater = repeater_list[0].row()
                 self.assertEqual(repeater[6], expected_dist)  # Distance
                 self.assertEqual(repeater[7], expected_dir)   # Direction
 
@@ -727,13 +840,9 @@ class TestWebscrape(unittest.TestCase):
     def test_filteroutput_all_digital_modes(self) -> None:
         """Test filtering for all supported digital modes."""
         # Create a repeater with all modes enabled
-        repeater = [""] * 25
-        repeater[9] = "TRUE"   # FM
-        repeater[13] = "TRUE"  # DMR
-        repeater[15] = "TRUE"  # NXDN
-        repeater[17] = "TRUE"  # P25
-        repeater[19] = "TRUE"  # D-STAR
-        repeater[20] = "TRUE"  # YSF
+        repeater = BLANK._replace(
+            modes=MODE_FM | MODE_DMR | MODE_NXDN | MODE_P25 | MODE_DSTAR | MODE_YSF
+        )
         
         # Test each mode individually
         modes = ["fm", "dmr", "nxdn", "p25", "dstar", "ysf"]
@@ -745,10 +854,7 @@ class TestWebscrape(unittest.TestCase):
 
     def test_filteroutput_mixed_mode_combinations(self) -> None:
         """Test various combinations of mode filters."""
-        repeater = [""] * 25
-        repeater[9] = "TRUE"   # FM
-        repeater[13] = "TRUE"  # DMR
-        repeater[20] = "TRUE"  # YSF
+        repeater = BLANK._replace(modes=MODE_FM | MODE_DMR | MODE_YSF)
         
         test_combinations = [
             (["fm", "dmr"], True),        # Should match (has both)
@@ -870,6 +976,1779 @@ class TestWebscrape(unittest.TestCase):
         # Test with None values (converted to nan) - but this will fail on regex, so skip this test
         # The actual implementation expects string values for regex parsing
 
+    def test_expanddbfilter(self) -> None:
+        """Test expansion of single, combined and comma-separated dbfilters."""
+        self.assertEqual(expanddbfilter("nesmc"), ["nesmc"])
+        self.assertEqual(expanddbfilter("neny"), ["nerep", "nyrep"])
+        self.assertEqual(expanddbfilter("nesct"), ["nesmc", "csma"])
+        self.assertEqual(
+            expanddbfilter("nerep,nesmc,csma,nyrep"),
+            ["nerep", "nesmc", "csma", "nyrep"],
+        )
+        self.assertEqual(expanddbfilter("neny,nerep,csma"), ["nerep", "nyrep", "csma"])
+
+        with self.assertRaises(ValueError):
+            expanddbfilter("nerep,bogus")
+
+    @patch("requests.Session.post")
+    @patch("pandas.read_html")
+    def test_fetchrepeatertables_concurrent_sources(
+        self, mock_read_html: MagicMock, mock_post: MagicMock
+    ) -> None:
+        """Test every source is posted with its own dbfilter and kept in order."""
+        header = ["LOC", "FREQ", "PL", "CALL", "DIST/DIR", "SPONSOR", "NOTES"]
+
+        def fake_post(url: str, data: dict[str, str], timeout: int) -> MagicMock:
+            response = MagicMock()
+            response.text = data["dbfilter"]
+            return response
+
+        def fake_read_html(html: Any) -> list[pd.DataFrame]:
+            source = html.getvalue()
+            data_row = ["City, ST", "145.0", "", source, "5.0N", "", ""]
+            return [pd.DataFrame(), pd.DataFrame([header, data_row])]
+
+        mock_post.side_effect = fake_post
+        mock_read_html.side_effect = fake_read_html
+
+        formdata: dict[str, str] = {"task": "rsearch"}
+        sources = ["nerep", "nesmc", "csma", "nyrep"]
+        tables = fetchrepeatertables(
+            requests.Session(), formdata, "Boston", "MA", "25", "144", "", sources
+        )
+
+        self.assertEqual([table.rows[0][3] for table in tables], sources)
+        posted = sorted(c.kwargs["data"]["dbfilter"] for c in mock_post.call_args_list)
+        self.assertEqual(posted, sorted(sources))
+        self.assertEqual(formdata, {"task": "rsearch"})  # Base form untouched
+
+    @patch("requests.Session.post")
+    @patch("pandas.read_html")
+    def test_fetchrepeatertables_layout_change(
+        self, mock_read_html: MagicMock, mock_post: MagicMock
+    ) -> None:
+        """Test a page without the repeater table raises instead of exiting."""
+        mock_post.return_value = MagicMock(text="<html></html>")
+        mock_read_html.return_value = [pd.DataFrame()]
+
+        with self.assertRaises(ValueError):
+            fetchrepeatertables(
+                requests.Session(), {}, "Boston", "MA", "25", "144", "", ["nerep"]
+            )
+
+    def test_mergerepeatertables(self) -> None:
+        """Test merged sources are sorted by FREQ with duplicates dropped."""
+        header = ("LOC", "FREQ", "CALL")
+        first = RepeaterTable(
+            header, [("A, MA", "146.940", "W1AAA"), ("B, MA", "145.150", "W1BBB")]
+        )
+        second = RepeaterTable(
+            header, [("B, MA", "145.150", "W1BBB"), ("C, NY", "146.610", "W2CCC")]
+        )
+
+        merged = mergerepeatertables([first, second])
+        self.assertEqual([row[2] for row in merged], ["W1BBB", "W2CCC", "W1AAA"])
+
+        single = mergerepeatertables([first])
+        self.assertEqual(
+            single, [["B, MA", "145.150", "W1BBB"], ["A, MA", "146.940", "W1AAA"]]
+        )
+
+        # Empty frequencies sort last
+        blank = RepeaterTable(
+            header, [("D, MA", float("nan"), "W1DDD"), ("E, MA", "29.620", "W1EEE")]
+        )
+        self.assertEqual(
+            [row[2] for row in mergerepeatertables([blank])], ["W1EEE", "W1DDD"]
+        )
+
+    def test_mergerepeatertables_numeric_precedence(self) -> None:
+        """Test sources merge in numeric FREQ order and the preferred duplicate wins."""
+        header = ("LOC", "FREQ", "CALL")
+        first = RepeaterTable(
+            header,
+            [
+                ("A, MA", "29.620", "W1AAA"),
+                ("B, MA", "146.94", "w1bbb"),
+                ("C, MA", "448.000", "W1CCC"),
+            ],
+        )
+        # Not sorted as published, and one repeater listed at a rounded frequency
+        second = RepeaterTable(
+            header,
+            [
+                ("C, NY", "1284.000", "W2DDD"),
+                ("B, NY", "146.9403", "W1BBB"),
+                ("E, NY", "53.010", "W2EEE"),
+            ],
+        )
+
+        merged = mergerepeatertables([first, second], ["nerep", "nyrep"])
+        self.assertEqual(
+            [row[1] for row in merged],
+            ["29.620", "53.010", "146.94", "448.000", "1284.000"],
+        )
+
+        preferred = mergerepeatertables([first, second], ["nerep", "nyrep"], ["nyrep"])
+        self.assertEqual([row[0] for row in preferred][2], "B, NY")
+        self.assertEqual(len(preferred), 5)
+
+        # Outside the tolerance both entries are kept
+        apart = mergerepeatertables(
+            [first, second], ["nerep", "nyrep"], tolerance=0.0001
+        )
+        self.assertEqual(len(apart), 6)
+
+        # Listings are compared with the kept row, so they do not chain
+        tables = [
+            RepeaterTable(header, [("B, MA", freq, "W1BBB")])
+            for freq in ("146.9400", "146.9404", "146.9408")
+        ]
+        merged = mergerepeatertables(tables, ["nerep", "nesmc", "nyrep"])
+        self.assertEqual([row[1] for row in merged], ["146.9400", "146.9408"])
+
+        with self.assertRaisesRegex(ValueError, "Invalid prefer"):
+            validatequery("MA", "25", "144", "neny", "v1", prefer="bogus")
+
+    @patch("requests.Session.post")
+    @patch("pandas.read_html")
+    @patch("builtins.open", new_callable=mock_open)
+    @patch(
+        "sys.argv",
+        ["webscrape.py", "-c", "Boston", "-s", "MA", "-q", "nerep,nesmc,csma,nyrep"],
+    )
+    def test_main_federated_dbfilter(
+        self, mock_file: MagicMock, mock_read_html: MagicMock, mock_post: MagicMock
+    ) -> None:
+        """Test main queries every database in a comma-separated dbfilter."""
+        mock_post.return_value = MagicMock(text="<html></html>")
+        header = ["LOC", "FREQ", "PL", "CALL", "DIST/DIR", "SPONSOR", "NOTES"]
+        data_row = ["City, ST", "145.0", "100.0", "CALL", "5.0N", "Sponsor", "Notes"]
+        mock_read_html.side_effect = lambda html: [
+            pd.DataFrame(),
+            pd.DataFrame([header, data_row]),
+        ]
+
+        main(sys.argv[1:])
+
+        self.assertEqual(mock_post.call_count, 4)
+
+        with patch("sys.argv", ["webscrape.py", "-q", "nerep,bogus"]):
+            with self.assertRaises(SystemExit):
+                main(sys.argv[1:])
+
+    def test_cachekey_normalization(self) -> None:
+        """Test equivalent queries share a cache key and different ones do not."""
+        base = {"loca": "Boston, MA", "radi": "25", "band": "144,440,", "freq": ""}
+        same = {"loca": " boston,  MA", "radi": "25.0", "band": "440,144", "freq": ""}
+        self.assertEqual(cachekey(base), cachekey(same))
+
+        # Fields outside the key are ignored
+        self.assertEqual(cachekey(base), cachekey({**base, "final": "Go!"}))
+
+        self.assertNotEqual(cachekey(base), cachekey({**base, "radi": "50"}))
+        self.assertNotEqual(cachekey(base), cachekey({**base, "dbfilter": "nyrep"}))
+
+    def test_responsecache_ttl_and_refresh(self) -> None:
+        """Test fresh, stale, expired and refresh lookups."""
+        formdata = {"loca": "Boston, MA", "radi": "25", "band": "144,"}
+        cache = ResponseCache(self.cachedir.name, ttl=10, stale=100)
+        self.assertIsNone(cache.get(formdata))
+
+        cache.put(formdata, "<html>cached</html>")
+        self.assertEqual(cache.get(formdata), ("<html>cached</html>", True))
+
+        with patch("time.time", return_value=time.time() + 50):
+            self.assertEqual(cache.get(formdata), ("<html>cached</html>", False))
+        with patch("time.time", return_value=time.time() + 500):
+            self.assertIsNone(cache.get(formdata))
+
+        refreshing = ResponseCache(self.cachedir.name, refresh=True)
+        self.assertIsNone(refreshing.get(formdata))
+
+    def test_responsecache_eviction(self) -> None:
+        """Test least recently used entries are evicted over the size limit."""
+        cache = ResponseCache(self.cachedir.name, maxsize=800)
+        forms = [{"loca": "Boston, MA", "radi": str(r)} for r in (10, 20, 30)]
+        for i, formdata in enumerate(forms):
+            # Hex of random bytes only compresses about 2:1, roughly 550 bytes each
+            cache.put(formdata, os.urandom(512).hex())
+            stamp = time.time() - 100 + i
+            os.utime(
+                os.path.join(self.cachedir.name, cachekey(formdata) + ".json"),
+                (stamp, stamp),
+            )
+
+        cache.evict()
+        self.assertIsNone(cache.get(forms[0]))
+        self.assertIsNone(cache.get(forms[1]))
+        self.assertIsNotNone(cache.get(forms[2]))
+
+    @patch("requests.Session.post")
+    def test_fetchresponsetext_cache(self, mock_post: MagicMock) -> None:
+        """Test responses are served from the cache and stale ones revalidated."""
+        mock_post.return_value = MagicMock(text="<html>live</html>", ok=True)
+        formdata = {"loca": "Boston, MA", "radi": "25", "band": "144,"}
+        cache = ResponseCache(self.cachedir.name, ttl=10, stale=100)
+        session = requests.Session()
+
+        self.assertEqual(
+            fetchresponsetext(session, formdata, cache), "<html>live</html>"
+        )
+        self.assertEqual(
+            fetchresponsetext(session, formdata, cache), "<html>live</html>"
+        )
+        self.assertEqual(mock_post.call_count, 1)
+
+        # Stale entries are served immediately and refreshed in the background
+        cache.put(formdata, "<html>old</html>")
+        with patch.object(cache, "revalidate") as mock_revalidate:
+            with patch("time.time", return_value=time.time() + 50):
+                text = fetchresponsetext(session, formdata, cache)
+        self.assertEqual(text, "<html>old</html>")
+        mock_revalidate.assert_called_once_with(session, formdata)
+
+        cache.revalidate(session, formdata)
+        for thread in threading.enumerate():
+            if thread.name.startswith("revalidate-"):
+                thread.join()
+        self.assertEqual(cache.get(formdata), ("<html>live</html>", True))
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch("requests.Session.post")
+    @patch("pandas.read_html")
+    def test_main_cache_options(
+        self, mock_read_html: MagicMock, mock_post: MagicMock
+    ) -> None:
+        """Test main reuses cached responses unless --no-cache or --refresh."""
+        mock_post.return_value = MagicMock(text="<html></html>", ok=True)
+        header = ["LOC", "FREQ", "PL", "CALL", "DIST/DIR", "SPONSOR", "NOTES"]
+        data_row = ["City, ST", "145.0", "100.0", "CALL", "5.0N", "Sponsor", "Notes"]
+        mock_read_html.side_effect = lambda html: [
+            pd.DataFrame(),
+            pd.DataFrame([header, data_row]),
+        ]
+
+        argv = [
+            "webscrape.py",
+            "-q",
+            "nerep",
+            "-o",
+            os.path.join(self.cachedir.name, "out.csv"),
+        ]
+        expected_calls = [1, 1, 2, 3]
+        for extra, calls in zip(
+            [[], [], ["--refresh"], ["--no-cache"]], expected_calls, strict=True
+        ):
+            with self.subTest(options=extra):
+                with patch("sys.argv", argv + extra):
+                    main(sys.argv[1:])
+                self.assertEqual(mock_post.call_count, calls)
+
+    def test_readbatchjobs_csv_and_jsonl(self) -> None:
+        """Test batch jobs are read from CSV and JSON Lines files."""
+        csvpath = os.path.join(self.cachedir.name, "jobs.csv")
+        with open(csvpath, "w", encoding="UTF8") as f:
+            f.write("city,state,radius,bands,filters,output\n")
+            f.write("Boston,MA,25,144,,boston.csv\n")
+            f.write("New Bedford,MA,35,440,dmr,nb.csv\n")
+        jobs = readbatchjobs(csvpath)
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(
+            jobs[0],
+            {
+                "city": "Boston",
+                "state": "MA",
+                "radius": "25",
+                "bands": "144",
+                "outputfile": "boston.csv",
+            },
+        )
+        self.assertEqual(jobs[1]["filter"], "dmr")
+
+        jsonpath = os.path.join(self.cachedir.name, "jobs.jsonl")
+        with open(jsonpath, "w", encoding="UTF8") as f:
+            f.write(
+                '{"city": "Boston", "state": "MA", "radius": 25, "chirp": true}\n\n'
+            )
+        self.assertEqual(
+            readbatchjobs(jsonpath),
+            [{"city": "Boston", "state": "MA", "radius": "25", "chirp": True}],
+        )
+
+        with open(jsonpath, "w", encoding="UTF8") as f:
+            f.write('{"city": "Boston", "colour": "blue"}\n')
+        with self.assertRaises(ValueError):
+            readbatchjobs(jsonpath)
+
+    @patch("requests.Session.post")
+    @patch("pandas.read_html")
+    def test_runbatch_continues_after_failures(
+        self, mock_read_html: MagicMock, mock_post: MagicMock
+    ) -> None:
+        """Test batch jobs share a session, write outputs and record failures."""
+        mock_post.return_value = MagicMock(text="<html></html>", ok=True)
+        header = ["LOC", "FREQ", "PL", "CALL", "DIST/DIR", "SPONSOR", "NOTES"]
+        data_row = ["City, ST", "145.0", "100.0", "CALL", "5.0N", "Sponsor", "Notes"]
+        mock_read_html.side_effect = lambda html: [
+            pd.DataFrame(),
+            pd.DataFrame([header, data_row]),
+        ]
+
+        out = self.cachedir.name
+        defaults = {
+            "city": "Providence",
+            "state": "RI",
+            "radius": 50,
+            "bands": "144,440",
+            "filter": None,
+            "outputfile": "repeaters.csv",
+            "oneper": False,
+            "chirp": False,
+            "dbfilter": "nerep",
+            "xnotes": False,
+            "search": "",
+            "amsmode": "v1",
+            "power": "Low",
+        }
+        jobs = [
+            {
+                "city": "Boston",
+                "state": "MA",
+                "outputfile": os.path.join(out, "boston.csv"),
+                "chirp": "yes",
+            },
+            {
+                "city": "Nowhere",
+                "state": "Mass",
+                "outputfile": os.path.join(out, "bad.csv"),
+            },
+            {
+                "city": "Worcester",
+                "state": "MA",
+                "outputfile": os.path.join(out, "boston.csv"),
+            },
+            {"city": "New Bedford", "state": "MA"},
+        ]
+
+        cwd = os.getcwd()
+        os.chdir(out)
+        try:
+            results = runbatch(jobs, defaults, 2)
+        finally:
+            os.chdir(cwd)
+
+        self.assertEqual(
+            [r["status"] for r in results], ["ok", "failed", "failed", "ok"]
+        )
+        self.assertEqual(results[0]["repeaters"], 1)
+        self.assertIn("two-letter", results[1]["error"])
+        self.assertIn("earlier job", results[2]["error"])
+        self.assertTrue(os.path.exists(os.path.join(out, "boston.csv")))
+        self.assertTrue(os.path.exists(os.path.join(out, "CHIRP_boston.csv")))
+        self.assertTrue(os.path.exists(os.path.join(out, "New_Bedford_MA.csv")))
+        self.assertEqual(mock_post.call_count, 2)
+
+        summary = os.path.join(out, "summary.csv")
+        writebatchsummary(results, summary)
+        with open(summary, encoding="UTF8") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(
+            lines[0], "Job,City,State,Output,Status,Repeaters,Seconds,Error"
+        )
+        self.assertEqual(len(lines), 5)
+
+    @patch("requests.Session.post")
+    @patch("pandas.read_html")
+    def test_main_batch_mode(
+        self, mock_read_html: MagicMock, mock_post: MagicMock
+    ) -> None:
+        """Test main runs a batch file and exits non-zero only after all jobs."""
+        mock_post.side_effect = requests.exceptions.RequestException("Network error")
+        jobsfile = os.path.join(self.cachedir.name, "jobs.jsonl")
+        with open(jobsfile, "w", encoding="UTF8") as f:
+            for city in ("Boston", "Worcester"):
+                output = os.path.join(self.cachedir.name, city + ".csv")
+                f.write(f'{{"city": "{city}", "state": "MA", "output": "{output}"}}\n')
+        summary = os.path.join(self.cachedir.name, "summary.csv")
+
+        with patch(
+            "sys.argv",
+            ["webscrape.py", "--no-cache", "--batch", jobsfile, "--summary", summary],
+        ):
+            with self.assertRaises(SystemExit):
+                main(sys.argv[1:])
+
+        # Both jobs were attempted (two sources each) and summarised
+        self.assertEqual(mock_post.call_count, 4)
+        with open(summary, encoding="UTF8") as f:
+            self.assertEqual(f.read().count("failed"), 2)
+
+    @patch("requests.Session.post")
+    def test_record_and_replay_sessions(self, mock_post: MagicMock) -> None:
+        """Test recorded responses are replayed by normalized form data."""
+        archivedir = os.path.join(self.cachedir.name, "archive")
+        live = requests.Response()
+        live.status_code = 200
+        live._content = b"<html>recorded</html>"
+        live.encoding = "UTF8"
+        mock_post.return_value = live
+
+        formdata = {
+            "loca": "Boston, MA",
+            "radi": "25",
+            "band": "144,",
+            "dbfilter": "nerep",
+        }
+        recorder = createsession(1, record=archivedir)
+        self.assertEqual(
+            recorder.post("http://example", data=formdata).text, "<html>recorded</html>"
+        )
+        self.assertTrue(os.path.exists(os.path.join(archivedir, "responses.jsonl.gz")))
+
+        mock_post.reset_mock()
+        replayer = createsession(1, replay=archivedir)
+        replayed = replayer.post(
+            "http://example", data={**formdata, "loca": "boston, MA"}
+        )
+        self.assertEqual(replayed.text, "<html>recorded</html>")
+        self.assertTrue(replayed.ok)
+        mock_post.assert_not_called()
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            replayer.post("http://example", data={**formdata, "radi": "50"})
+
+        self.assertEqual(len(ResponseArchive(archivedir).responses()), 1)
+
+    @patch("requests.Session.post")
+    def test_main_record_then_replay(self, mock_post: MagicMock) -> None:
+        """Test a replayed run reproduces the recorded run's output offline."""
+        page = (
+            "<html><table><tr><td>menu</td></tr></table><table>"
+            "<tr><td>LOC</td><td>FREQ</td><td>PL</td><td>CALL</td><td>DIST/DIR</td><td>SPONSOR</td><td>NOTES</td></tr>"
+            "<tr><td>Boston, MA</td><td>145.230</td><td>88.5</td><td>W1BOS</td><td>2.0N</td><td>Club</td><td>DMR CC1</td></tr>"
+            "</table></html>"
+        )
+        mock_post.return_value = MagicMock(text=page, status_code=200, ok=True)
+        archivedir = os.path.join(self.cachedir.name, "archive")
+        recorded = os.path.join(self.cachedir.name, "recorded.csv")
+        replayed = os.path.join(self.cachedir.name, "replayed.csv")
+
+        with patch(
+            "sys.argv",
+            [
+                "webscrape.py",
+                "-c",
+                "Boston",
+                "-s",
+                "MA",
+                "--record",
+                archivedir,
+                "-o",
+                recorded,
+            ],
+        ):
+            main(sys.argv[1:])
+        self.assertEqual(mock_post.call_count, 2)
+
+        mock_post.side_effect = requests.exceptions.RequestException("offline")
+        with patch(
+            "sys.argv",
+            [
+                "webscrape.py",
+                "-c",
+                "Boston",
+                "-s",
+                "MA",
+                "--replay",
+                archivedir,
+                "-o",
+                replayed,
+            ],
+        ):
+            main(sys.argv[1:])
+        self.assertEqual(mock_post.call_count, 2)
+
+        with open(recorded, encoding="UTF8") as f, open(replayed, encoding="UTF8") as g:
+            self.assertEqual(f.read(), g.read())
+
+        # A query that was never recorded fails instead of going to the network
+        with patch(
+            "sys.argv",
+            [
+                "webscrape.py",
+                "-c",
+                "Salem",
+                "-s",
+                "MA",
+                "--replay",
+                archivedir,
+                "-o",
+                replayed,
+            ],
+        ):
+            with self.assertRaises(SystemExit):
+                main(sys.argv[1:])
+
+    def test_subsetrepeatertable(self) -> None:
+        """Test a broader table is narrowed by parsed distance and band."""
+        header = ("LOC", "FREQ", "PL", "CALL", "DIST/DIR", "SPONSOR", "NOTES")
+        rows = [
+            ("A, MA", "145.230", "", "W1AAA", "10.0N", "", ""),
+            ("B, MA", "146.940", "", "W1BBB", "40.5SW", "", ""),
+            ("C, MA", "444.100", "", "W1CCC", "5.2E", "", ""),
+            ("D, MA", "53.010", "", "W1DDD", "24.9NE", "", ""),
+        ]
+        table = RepeaterTable(header, list(rows))
+
+        subset = subsetrepeatertable(table, {"radi": "25", "band": "144,"})
+        assert subset is not None
+        self.assertEqual([row[3] for row in subset.rows], ["W1AAA"])
+
+        subset = subsetrepeatertable(table, {"radi": "25", "band": "50,440,"})
+        assert subset is not None
+        self.assertEqual([row[3] for row in subset.rows], ["W1CCC", "W1DDD"])
+
+        # Unparseable distances make the subset unreliable
+        rows[1] = ("B, MA", "146.940", "", "W1BBB", float("nan"), "", "")
+        self.assertIsNone(
+            subsetrepeatertable(
+                RepeaterTable(header, rows), {"radi": "25", "band": "144,"}
+            )
+        )
+        rows[1] = ("B, MA", "146.940", "", "W1BBB", "12-3", "", "")
+        self.assertIsNone(
+            subsetrepeatertable(
+                RepeaterTable(header, rows), {"radi": "25", "band": "144,"}
+            )
+        )
+
+        # Distance is found by header, not position
+        order = (4, 0, 1, 2, 3, 5, 6)
+        table = RepeaterTable(
+            tuple(header[i] for i in order),
+            [tuple(row[i] for i in order) for row in table.rows],
+        )
+        subset = subsetrepeatertable(table, {"radi": "25", "band": "144,"})
+        assert subset is not None
+        self.assertEqual([row[4] for row in subset.rows], ["W1AAA"])
+
+    @patch("requests.Session.post")
+    def test_fetchrepeatertable_subsumed_query(self, mock_post: MagicMock) -> None:
+        """Test a narrower query is answered from a broader cached one."""
+        page = (
+            "<html><table><tr><td>menu</td></tr></table><table>"
+            "<tr><td>LOC</td><td>FREQ</td><td>PL</td><td>CALL</td><td>DIST/DIR</td><td>SPONSOR</td><td>NOTES</td></tr>"
+            "<tr><td>A, MA</td><td>145.230</td><td>88.5</td><td>W1AAA</td><td>10.0N</td><td></td><td></td></tr>"
+            "<tr><td>B, MA</td><td>146.940</td><td>88.5</td><td>W1BBB</td><td>40.5SW</td><td></td><td></td></tr>"
+            "<tr><td>C, MA</td><td>444.100</td><td>88.5</td><td>W1CCC</td><td>5.2E</td><td></td><td></td></tr>"
+            "</table></html>"
+        )
+        mock_post.return_value = MagicMock(text=page, ok=True)
+        cache = ResponseCache(self.cachedir.name)
+        session = requests.Session()
+        base = {"loca": "Boston, MA", "freq": "", "dbfilter": "nerep"}
+
+        broad = fetchrepeatertable(
+            session, {**base, "radi": "50", "band": "144,440,"}, cache=cache
+        )
+        self.assertEqual(len(broad.rows), 3)
+        self.assertEqual(mock_post.call_count, 1)
+
+        narrow = fetchrepeatertable(
+            session, {**base, "radi": "25", "band": "144,"}, cache=cache
+        )
+        self.assertEqual([row[3] for row in narrow.rows], ["W1AAA"])
+        self.assertEqual(mock_post.call_count, 1)
+
+        # Larger radius, other bands, other database or --refresh go to the network
+        for extra in (
+            {"radi": "75", "band": "144,"},
+            {"radi": "25", "band": "222,"},
+            {"radi": "25", "band": "144,", "dbfilter": "nyrep"},
+        ):
+            with self.subTest(query=extra):
+                calls = mock_post.call_count
+                fetchrepeatertable(session, {**base, **extra}, cache=cache)
+                self.assertEqual(mock_post.call_count, calls + 1)
+
+        refreshing = ResponseCache(self.cachedir.name, refresh=True)
+        calls = mock_post.call_count
+        fetchrepeatertable(
+            session, {**base, "radi": "10", "band": "440,"}, cache=refreshing
+        )
+        self.assertEqual(mock_post.call_count, calls + 1)
+
+    def test_extractrepeatertable_matches_read_html(self) -> None:
+        """Test the lxml extractor returns the same rows as the read_html path."""
+        page = (
+            "<html><body><table><tr><td>Search <b>results</b></td></tr></table>"
+            "<table>"
+            "<tr><td>LOC</td><td>FREQ</td><td>PL</td><td>CALL</td><td>DIST/DIR</td><td>SPONSOR</td><td>NOTES</td></tr>"
+            "<tr><td>Boston, MA</td><td>145.230</td><td>88.5</td><td>W1BOS</td><td>2.0N</td><td>Boston  Club</td><td>DMR<br>CC1</td></tr>"
+            "<tr><td>Salem, MA</td><td>146.700</td><td></td><td>W1SAL</td><td>14.1NE</td><td></td><td>\n  Fusion  </td></tr>"
+            "<tr><td></td><td></td><td></td><td></td><td></td><td></td><td></td></tr>"
+            '<tr><td>Lynn, MA</td><td>444.000</td><td colspan="2">YSF</td><td>5.2E</td><td>Club</td><td>Notes</td></tr>'
+            "</table></body></html>"
+        )
+
+        table = extractrepeatertable(page)
+        assert table is not None
+        self.assertEqual(
+            table.header, ("LOC", "FREQ", "PL", "CALL", "DIST/DIR", "SPONSOR", "NOTES")
+        )
+
+        df = parserepeatertable(page)
+        expected = df.values.tolist()
+        self.assertEqual(len(table.rows), len(expected))
+        for row, want in zip(table.rows, expected, strict=True):
+            self.assertEqual([str(v) for v in row], [str(v) for v in want])
+
+    def test_extractrepeatertable_layout_change(self) -> None:
+        """Test pages without a recognisable repeater table are left to read_html."""
+        self.assertIsNone(extractrepeatertable(""))
+        self.assertIsNone(
+            extractrepeatertable("<html><table><tr><td>x</td></tr></table></html>")
+        )
+        self.assertIsNone(
+            extractrepeatertable(
+                "<table><tr><td>FREQ</td><td>CALL</td></tr><tr><td>1</td><td>2</td><td>3</td></tr></table>"
+            )
+        )
+
+    @patch("requests.Session.post")
+    @patch("pandas.read_html")
+    def test_fetchrepeatertable_skips_read_html(
+        self, mock_read_html: MagicMock, mock_post: MagicMock
+    ) -> None:
+        """Test read_html is only used when the extractor cannot find the table."""
+        mock_post.return_value = MagicMock(
+            text="<table><tr><td>LOC</td><td>FREQ</td><td>CALL</td></tr><tr><td>A, MA</td><td>145.230</td><td>W1AAA</td></tr></table>"
+        )
+        table = fetchrepeatertable(requests.Session(), {"dbfilter": "nerep"})
+        self.assertEqual(table.rows, [("A, MA", "145.230", "W1AAA")])
+        mock_read_html.assert_not_called()
+
+        mock_post.return_value = MagicMock(text="<html><p>moved</p></html>")
+        header = ["LOC", "FREQ", "CALL"]
+        mock_read_html.return_value = [
+            pd.DataFrame(),
+            pd.DataFrame([header, ["A, MA", "145.230", "W1AAA"]]),
+        ]
+        table = fetchrepeatertable(requests.Session(), {"dbfilter": "nerep"})
+        self.assertEqual(table.header, ("LOC", "FREQ", "CALL"))
+        self.assertEqual(table.rows, [("A, MA", "145.230", "W1AAA")])
+        mock_read_html.assert_called_once()
+
+    def test_import_time_budget(self) -> None:
+        """Test importing webscrape stays within budget and skips heavy modules."""
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import webscrape"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        imported = {}
+        for line in result.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                _self, cumulative, name = line[len("import time:") :].split("|")
+                if cumulative.strip().isdigit():
+                    imported[name.strip()] = int(cumulative)
+
+        for heavy in ("pandas", "requests", "lxml", "numpy"):
+            self.assertNotIn(heavy, imported)
+        self.assertLess(imported["webscrape"], 150_000)  # microseconds
+
+    def test_query_without_pandas(self) -> None:
+        """Test a normal query never imports pandas."""
+        output = os.path.join(self.cachedir.name, "out.csv")
+        page = (
+            "<table><tr><td>LOC</td><td>FREQ</td><td>PL</td><td>CALL</td><td>DIST/DIR</td><td>SPONSOR</td><td>NOTES</td></tr>"
+            "<tr><td>Boston, MA</td><td>145.230</td><td>88.5</td><td>W1BOS</td><td>2.0N</td><td>Club</td><td>Notes</td></tr></table>"
+        )
+        script = (
+            "import sys\n"
+            "from unittest.mock import MagicMock, patch\n"
+            "import webscrape\n"
+            f"response = MagicMock(text={page!r}, ok=True)\n"
+            "with patch('requests.Session.post', return_value=response):\n"
+            f"    webscrape.main(['-q', 'nerep', '--no-cache', '-o', {output!r}])\n"
+            "print('pandas' in sys.modules)\n"
+        )
+        env = {**os.environ, "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=self.cachedir.name,
+            env=env,
+        )
+        self.assertEqual(result.stdout.strip(), "False")
+        with open(output, encoding="UTF8") as f:
+            self.assertIn("W1BOS", f.read())
+
+    def test_cli_main_passes_arguments(self) -> None:
+        """Test the console script hands its arguments to webscrape.main."""
+        with patch("webscrape.main") as mock_main:
+            cli.main(["-c", "Boston", "-s", "MA"])
+        mock_main.assert_called_once_with(["-c", "Boston", "-s", "MA"])
+
+        with patch("webscrape.main") as mock_main, patch("sys.argv", ["rscrape", "-d"]):
+            cli.main()
+        mock_main.assert_called_once_with(["-d"])
+
+    def test_classifymodes_matches_regex_searches(self) -> None:
+        """Test the single-scan classifier against per-pattern searches."""
+        tokens = (
+            "DMR dmr CC1 CC12 CCC3 CCCCC9 NXDN Nxdn RAN1 RAN12 NAC NAC: NAC293 "
+            "NAC:1234 P25 p25 YSF Fusion D-STAR d-star DCS(023) dcs(23) DCS( "
+            "DCS(999) D023 d754 D999 D0231 100.0 88.5 123.4 99.9 D123.0 CC123.0 "
+            "RAN1100.0 EMPTY Net Tue 8pm , ("
+        ).split()
+        rng = random.Random(8)
+        for _ in range(5000):
+            plfield = rng.choice([None, "", " ".join(rng.sample(tokens, 2))])
+            notes = " ".join(rng.choices(tokens, k=rng.randint(1, 6)))
+            with self.subTest(plfield=plfield, notes=notes):
+                self.assertEqual(
+                    classifymodes(plfield, notes), searchmodes(plfield, notes)
+                )
+
+        # Overlapping matches are each seen
+        modes = classifymodes("CSQ", "DMR D123.0 CCC12")
+        self.assertEqual(modes.pltone, "123.0")
+        self.assertEqual(modes.dmr_cc, "CCC12")
+        self.assertEqual(classifymodes(None, "EMPTY").fm, "TRUE")
+
+    def test_repeater_typed_fields(self) -> None:
+        """Test repeaters keep typed fields and build rows only when asked."""
+        rpters = [
+            ["Boston, MA", "146.940", "100.0", "W1AW", "12.3NE", "ARRL", "DMR CC1"],
+            ["Salem, NH", "442.500", "nan", "N1XYZ", "4.0S", "nan", "DCS(23)"],
+        ]
+        repeater_list: list[Repeater] = []
+        chirprepeaterlist: list[Repeater] = []
+        processrepeaterdata(
+            rpters,
+            repeater_list,
+            ["all"],
+            True,
+            0,
+            [],
+            chirprepeaterlist,
+            "",
+            False,
+            False,
+            "Low",
+            "v1",
+        )
+
+        boston, salem = repeater_list
+        self.assertEqual(boston.mhz, 146.94)
+        self.assertEqual(boston.offset, -0.6)
+        self.assertEqual(boston.miles, 12.3)
+        self.assertEqual(boston.pltone, 100.0)
+        self.assertIsNone(boston.dcs)
+        self.assertEqual(boston.modes, MODE_FM | MODE_DMR)
+        self.assertEqual(salem.dcs, 23)
+        self.assertEqual(salem.modes, MODE_FM)
+        self.assertEqual(
+            boston.row(),
+            [
+                "Boston",
+                "MA",
+                "146.940",
+                "-0.6",
+                "-",
+                "W1AW",
+                "12.3",
+                "NE",
+                "ARRL",
+                "TRUE",
+                "100.0",
+                "",
+                "Tone",
+                "TRUE",
+                "CC1",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "Low",
+                "FM",
+                "N",
+                "DMR CC1",
+            ],
+        )
+        self.assertEqual(salem.row()[11:13], ["023", "DCS"])
+        self.assertEqual(
+            [repeater.chirprow(n)[:9] for n, repeater in enumerate(chirprepeaterlist)],
+            [
+                [
+                    "0",
+                    "W1AW",
+                    "146.940",
+                    "-",
+                    "0.600000",
+                    "Tone",
+                    "100.0",
+                    "100.0",
+                    "023",
+                ],
+                [
+                    "1",
+                    "N1XYZ",
+                    "442.500",
+                    "+",
+                    "5.000000",
+                    "DTCS",
+                    "88.5",
+                    "88.5",
+                    "023",
+                ],
+            ],
+        )
+
+        # Filters only test mode bits
+        for rfilter, expected in (
+            (["dmr"], [boston]),
+            (["ysf"], []),
+            (["fm"], [boston, salem]),
+        ):
+            filtered: list[Repeater] = []
+            for repeater in repeater_list:
+                filteroutput(rfilter, repeater, filtered)
+            self.assertEqual(filtered, expected)
+
+    def test_compilefilter_and_not(self) -> None:
+        """Test filter plans combine modes with or, and and not."""
+        fm_dmr = BLANK._replace(modes=MODE_FM | MODE_DMR)
+        dmr = BLANK._replace(modes=MODE_DMR)
+        ysf = BLANK._replace(modes=MODE_YSF)
+        for rfilter, expected in (
+            (["dmr"], [fm_dmr, dmr]),
+            (["dmr+!fm"], [dmr]),
+            (["dmr+fm"], [fm_dmr]),
+            (["!dmr"], [ysf]),
+            (["dmr+!fm", "ysf"], [dmr, ysf]),
+            (["all"], [fm_dmr, dmr, ysf]),
+            (["fm", ""], [fm_dmr]),
+        ):
+            with self.subTest(rfilter=rfilter):
+                plan = compilefilter(rfilter)
+                repeater_list: list[Repeater] = []
+                for repeater in (fm_dmr, dmr, ysf):
+                    filteroutput(plan, repeater, repeater_list)
+                self.assertEqual(repeater_list, expected)
+
+        for rfilter in (["dmrr"], ["dmr+"], ["!"]):
+            with self.subTest(rfilter=rfilter):
+                with self.assertRaises(ValueError):
+                    compilefilter(rfilter)
+        with self.assertRaises(SystemExit):
+            main(["-c", "Boston", "-s", "MA", "-f", "dmr,fn"])
+
+    def test_bandplan_lookups(self) -> None:
+        """Test band plan lookups at range edges, one by one and vectorized."""
+        freqs = [50.0, 51.0, 51.99, 51.995, 52.0, 144.5, 144.51, 144.89, 146.5]
+        freqs += [146.505, 224.0, 444.99, 444.995, 445.0, 928.0, 928.5, float("nan")]
+        expected = [
+            (0, "off"),
+            (-0.5, "-"),
+            (-0.5, "-"),
+            (0, "off"),
+            (-1.0, "-"),
+            (0, "off"),
+            (0.6, "+"),
+            (0.6, "+"),
+            (-1.5, "-"),
+            (0, "off"),
+            (-1.6, "-"),
+            (5.0, "+"),
+            (0, "off"),
+            (-5.0, "-"),
+            (-25.0, "-"),
+            (0, "off"),
+            (0, "off"),
+        ]
+        self.assertEqual([BAND_PLAN.offset(freq) for freq in freqs], expected)
+        offsets, directions = BAND_PLAN.offsets(freqs)
+        self.assertEqual(
+            list(zip(offsets.tolist(), directions.tolist(), strict=True)), expected
+        )
+        self.assertEqual(determineoffset("EMPTY"), {"offset": 0, "offset_dir": "off"})
+
+        plan = BandPlan(BAND_PLAN.ranges)
+        plan.update(
+            [OffsetRange(222, 225, -1.6, "-"), OffsetRange(1282, 1288, -12, "-")]
+        )
+        self.assertEqual(plan.offset(222.5), (-1.6, "-"))
+        self.assertEqual(plan.offset(1284.0), (-12, "-"))
+        self.assertEqual(len(plan.ranges), len(BAND_PLAN.ranges) + 1)
+        with self.assertRaises(ValueError):
+            BandPlan([OffsetRange(144, 146, 0.6, "+"), OffsetRange(145, 147, 0.6, "+")])
+
+    @patch("requests.Session.post")
+    def test_main_band_plan(self, mock_post: MagicMock) -> None:
+        """Test --band-plan adds offsets from a CSV file."""
+        mock_post.return_value = MagicMock(
+            ok=True,
+            text="<table><tr><td>LOC</td><td>FREQ</td><td>PL</td><td>CALL</td>"
+            "<td>DIST</td><td>SPONSOR</td><td>NOTES</td></tr>"
+            "<tr><td>Boston, MA</td><td>1284.000</td><td>100.0</td><td>W1AW</td>"
+            "<td>1.0N</td><td>ARRL</td><td></td></tr></table>",
+        )
+        self.addCleanup(BAND_PLAN.setranges, BAND_PLAN.ranges)
+        bandplan = os.path.join(self.cachedir.name, "bandplan.csv")
+        output = os.path.join(self.cachedir.name, "out.csv")
+        with open(bandplan, "w", encoding="UTF8") as f:
+            f.write("low,high,offset\n1282,1288,-12\n")
+        main(["--no-cache", "-b", "1296", "-o", output, "--band-plan", bandplan])
+        with open(output, encoding="UTF8") as f:
+            self.assertIn("1284.000,-12.0,-,W1AW", f.read())
+
+        with open(bandplan, "w", encoding="UTF8") as f:
+            f.write("low,high\n1282,1288\n")
+        with self.assertRaises(ValueError):
+            readbandplan(bandplan)
+        with self.assertRaises(SystemExit):
+            main(["--no-cache", "-o", output, "--band-plan", bandplan])
+
+    @patch("requests.Session.post")
+    def test_script_band_plan_columnar(self, mock_post: MagicMock) -> None:
+        """Test python webscrape.py shares its band plan with rscrape.frame."""
+        import runpy
+
+        mock_post.return_value = MagicMock(
+            ok=True,
+            text="<table><tr><td>LOC</td><td>FREQ</td><td>PL</td><td>CALL</td>"
+            "<td>DIST</td><td>SPONSOR</td><td>NOTES</td></tr>"
+            "<tr><td>Boston, MA</td><td>1284.000</td><td>100.0</td><td>W1AW</td>"
+            "<td>1.0N</td><td>ARRL</td><td></td></tr></table>",
+        )
+        self.addCleanup(BAND_PLAN.setranges, BAND_PLAN.ranges)
+        bandplan = os.path.join(self.cachedir.name, "bandplan.csv")
+        output = os.path.join(self.cachedir.name, "out.csv")
+        with open(bandplan, "w", encoding="UTF8") as f:
+            f.write("low,high,offset\n1282,1288,-12\n")
+        argv = ["webscrape.py", "--no-cache", "-q", "nerep", "-b", "1296", "-o", output]
+        script = os.path.join(os.path.dirname(__file__), "webscrape.py")
+        with patch.object(sys, "argv", argv + ["--band-plan", bandplan, "--columnar"]):
+            runpy.run_path(script, run_name="__main__")
+        with open(output, encoding="UTF8") as f:
+            self.assertIn("1284.000,-12.0,-,W1AW", f.read())
+
+    def test_writerepeaters_streams(self) -> None:
+        """Test rows reach the files while later rows are still being read."""
+        output = os.path.join(self.cachedir.name, "out.csv")
+        chirpfile = os.path.join(self.cachedir.name, "CHIRP_out.csv")
+        sizes: list[int] = []
+
+        def rows() -> Any:
+            for number in range(2000):
+                sizes.append(os.path.getsize(output) if number else 0)
+                pl = "DMR" if number % 2 else "100.0"
+                call = f"W{number}"
+                yield ["Boston, MA", "146.940", pl, call, "1.0N", "ARRL", "Notes"]
+
+        repeaters = classifyrepeaters(rows(), False, False, "Low", "v1")
+        entries = selectrepeaters(repeaters, ["dmr"], True, "")
+        count = writerepeaters(entries, output, chirpfile)
+
+        self.assertEqual(count, 1000)
+        # Rows are on disk after the first few hundred raw rows
+        self.assertGreater(sizes[500], 0)
+        with open(output, encoding="UTF8") as f:
+            self.assertEqual(f.read().splitlines()[1].split(",")[5], "W1")
+        with open(chirpfile, encoding="UTF8") as f:
+            chirprows = f.read().splitlines()[1:]
+        self.assertEqual(len(chirprows), 1000)
+        self.assertEqual(chirprows[-1].split(",")[:2], ["999", "W1998"])
+
+    def test_classifyrepeatersinpool_keeps_order(self) -> None:
+        """Test worker processes classify chunks into the same ordered repeaters."""
+        rng = random.Random(14)
+        rpters = [
+            [
+                rng.choice(["Boston, MA", "Salem, NH", float("nan")]),
+                rng.choice(["146.940", "442.500", "1284.000"]),
+                rng.choice([float("nan"), "100.0", "DMR"]),
+                f"W{number}",
+                rng.choice(["12.3NE", "1.2"]),
+                "ARRL",
+                rng.choice([float("nan"), "Fusion", "NXDN RAN1", "DCS(023)"]),
+            ]
+            for number in range(100)
+        ]
+        self.addCleanup(BAND_PLAN.setranges, BAND_PLAN.ranges)
+        BAND_PLAN.update([OffsetRange(1282, 1288, -12, "-")])
+
+        expected = list(classifyrepeaters(rpters, True, False, "Low", "v2"))
+        with createprocesspool(2) as pool:
+            repeaters = list(
+                classifyrepeatersinpool(pool, rpters, True, False, "Low", "v2", 7)
+            )
+        self.assertEqual([r.row() for r in repeaters], [r.row() for r in expected])
+        self.assertIn(-12, [r.offset for r in repeaters])
+
+    def test_processrepeaterframe_matches_rows(self) -> None:
+        """Test the columnar path writes exactly the rows of the row path."""
+        rng = random.Random(9)
+        notes = (
+            "DMR CC1 NXDN RAN12 NAC NAC:293 Fusion D-STAR DCS(023) DCS( D754 "
+            "100.0 88.5 123.4 maintenance EchoLink Net W1AW NN 1"
+        ).split()
+        rpters = [
+            [
+                rng.choice(["Boston, MA", "Salem, NH", "x", float("nan")]),
+                rng.choice(["146.940", "442.500", "53.1", "1282.000"]),
+                rng.choice([float("nan"), "100.0", "DMR", "D-STAR 88.5", "CSQ"]),
+                rng.choice(["W1AW", "N1XYZ", float("nan")]),
+                rng.choice(["12.3NE", "1.2", "4.0S"]),
+                rng.choice(["ARRL", float("nan")]),
+                rng.choice([float("nan"), " ".join(rng.choices(notes, k=4))]),
+            ]
+            for _ in range(400)
+        ]
+        for rfilter, searchfilter, exnotes, ams_mode in (
+            (["all"], "", False, "v1"),
+            (["fm", "dmr"], "", True, "v2"),
+            (["ysf", "p25", "nxdn", "dstar"], "W1", False, "v1"),
+            (["all"], "1", True, "v1"),
+            (["all"], "NN", False, "v2"),
+            (["dmr+!fm", "ysf+fm"], "", False, "v1"),
+        ):
+            with self.subTest(rfilter=rfilter, searchfilter=searchfilter):
+                rows: list[Repeater] = []
+                chirps: list[Repeater] = []
+                processrepeaterdata(
+                    rpters,
+                    rows,
+                    rfilter,
+                    True,
+                    0,
+                    [],
+                    chirps,
+                    searchfilter,
+                    exnotes,
+                    False,
+                    "Low",
+                    ams_mode,
+                )
+                frame: list[Repeater] = []
+                framechirps: list[Repeater] = []
+                processrepeaterframe(
+                    rpters,
+                    frame,
+                    rfilter,
+                    True,
+                    framechirps,
+                    searchfilter,
+                    exnotes,
+                    False,
+                    "Low",
+                    ams_mode,
+                )
+                self.assertEqual(frame, rows)
+                self.assertEqual(framechirps, chirps)
+
+    @patch("requests.Session.post")
+    def test_main_columnar(self, mock_post: MagicMock) -> None:
+        """Test --columnar, --processes and --threads write the row path's files."""
+        mock_post.return_value = MagicMock(
+            ok=True,
+            text="<table><tr><td>LOC</td><td>FREQ</td><td>PL</td><td>CALL</td>"
+            "<td>DIST</td><td>SPONSOR</td><td>NOTES</td></tr>"
+            "<tr><td>Boston, MA</td><td>146.940</td><td>100.0</td><td>W1AW</td>"
+            "<td>1.0N</td><td>ARRL</td><td>DMR CC1</td></tr>"
+            "<tr><td>Salem, NH</td><td>147.000</td><td>88.5</td><td>N1XYZ</td>"
+            "<td>4.0S</td><td></td><td></td></tr></table>",
+        )
+        outputs = {}
+        options = ([], ["--columnar"], ["--processes", "2"], ["--threads", "2"])
+        for index, option in enumerate(options):
+            output = os.path.join(self.cachedir.name, f"out{index}.csv")
+            main(["--no-cache", "-q", "nerep", "-p", "-o", output] + option)
+            chirpfile = os.path.join(self.cachedir.name, f"CHIRP_out{index}.csv")
+            with (
+                open(output, encoding="UTF8") as f,
+                open(chirpfile, encoding="UTF8") as g,
+            ):
+                outputs[index] = (f.read(), g.read())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+        self.assertEqual(outputs[0], outputs[3])
+        self.assertIn("CC1", outputs[1][0])
+
+    def test_main_threads_and_processes_conflict(self) -> None:
+        """Test --threads cannot be combined with --processes."""
+        with self.assertRaises(SystemExit):
+            main(["-q", "nerep", "--processes", "2", "--threads", "2"])
+
+    def test_classifyrepeatersinpool_threads(self) -> None:
+        """Test worker threads classify the same ordered repeaters and benchmark."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        from rscrape.bench import syntheticrows, timeclassify
+
+        rpters = syntheticrows(500, seed=15)
+        expected = list(classifyrepeaters(rpters, True, False, "Low", "v2"))
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            repeaters = list(
+                classifyrepeatersinpool(pool, rpters, True, False, "Low", "v2", 9)
+            )
+        self.assertEqual([r.row() for r in repeaters], [r.row() for r in expected])
+        self.assertEqual(syntheticrows(5, seed=15), rpters[:5])
+        self.assertGreater(timeclassify(rpters[:50], 2, 1), 0)
+
+    def test_searchindex_queries(self) -> None:
+        """Test indexed searches are case insensitive, prefix and field scoped."""
+        from rscrape.search import SearchIndex
+
+        repeaters = list(
+            classifyrepeaters(
+                [
+                    [
+                        "Boston, MA",
+                        "146.940",
+                        "DMR",
+                        "NB1RI",
+                        "1.0N",
+                        "ARRL",
+                        "Brandmeister",
+                    ],
+                    [
+                        "Salem, NH",
+                        "147.000",
+                        "88.5",
+                        "W1AW",
+                        "2.0S",
+                        "NB1RI Club",
+                        "Fusion",
+                    ],
+                    [
+                        "Keene, NH",
+                        "442.500",
+                        "100.0",
+                        "W1XYZ",
+                        "3.0E",
+                        float("nan"),
+                        "NAC:293",
+                    ],
+                    ["Derry, NH", "443.100", "D-STAR", "W1-ABC", "4.0W", "Mt-Club", ""],
+                ],
+                False,
+                False,
+                "Low",
+                "v1",
+            )
+        )
+        index = SearchIndex(repeaters)
+
+        def calls(query: str) -> list[str]:
+            return [r.call for r in index.search(query)]
+
+        self.assertEqual(len(index), 4)
+        self.assertEqual(calls("nb1ri"), ["NB1RI", "W1AW"])
+        self.assertEqual(calls("call:NB1"), ["NB1RI"])
+        self.assertEqual(calls("sponsor:nb1ri"), ["W1AW"])
+        self.assertEqual(calls("W1"), ["W1AW", "W1XYZ", "W1-ABC"])
+        self.assertEqual(calls("w1 state:nh"), ["W1AW", "W1XYZ", "W1-ABC"])
+        self.assertEqual(calls("w1 city:boston"), [])
+        self.assertEqual(calls("notes:*MEISTER"), ["NB1RI"])
+        self.assertEqual(calls("notes:meister"), [])
+        self.assertEqual(calls("notes:*nac:293"), ["W1XYZ"])
+        self.assertEqual(calls("freq:146.9"), ["NB1RI"])
+        # Hyphenated terms are split into words like the fields
+        self.assertEqual(calls("call:W1-ABC"), ["W1-ABC"])
+        self.assertEqual(calls("call:w1-a"), ["W1-ABC"])
+        self.assertEqual(calls("sponsor:mt-cl"), ["W1-ABC"])
+        self.assertEqual(calls("call:abc-w1"), [])
+        self.assertEqual(calls(""), ["NB1RI", "W1AW", "W1XYZ", "W1-ABC"])
+        with self.assertRaisesRegex(ValueError, "Invalid search field"):
+            index.search("band:2m")
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow not installed")
+    def test_writerepeaters_parquet_arrow(self) -> None:
+        """Test --format writes typed Parquet and Arrow files next to the CSV."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rpters = [
+            ["Boston, MA", "146.940", "100.0", "W1AW", "1.0N", "ARRL", "DMR CC1"],
+            [
+                "Salem, NH",
+                "147.000",
+                "D754",
+                "N1XYZ",
+                "4.0S",
+                float("nan"),
+                float("nan"),
+            ],
+            ["Keene, NH", "EMPTY", "NXDN", "W1RAN", "2.5E", "ARES", "NXDN RAN12"],
+        ]
+        repeaters = classifyrepeaters(rpters, False, False, "Low", "v1")
+        entries = selectrepeaters(repeaters, ["all"], False, "")
+        output = os.path.join(self.cachedir.name, "out.csv")
+        self.assertEqual(writerepeaters(entries, output, None, "csv,parquet,arrow"), 3)
+
+        table = pq.read_table(os.path.join(self.cachedir.name, "out.parquet"))
+        with pa.ipc.open_file(os.path.join(self.cachedir.name, "out.arrow")) as reader:
+            self.assertTrue(reader.read_all().equals(table))
+        frame = table.to_pandas()
+        written = pd.read_csv(output, dtype=str, keep_default_na=False)
+        self.assertEqual(list(frame.columns), list(written.columns))
+        self.assertEqual(frame["Frequency"].tolist()[:2], [146.94, 147.0])
+        self.assertTrue(pd.isna(frame["Frequency"][2]))
+        self.assertEqual(frame["Distance"].tolist(), [1.0, 4.0, 2.5])
+        self.assertEqual(frame["DMR"].tolist(), [True, False, False])
+        self.assertEqual(frame["CTCSS"].tolist()[0], 100.0)
+        self.assertEqual(str(frame["State"].dtype), "category")
+        self.assertEqual(frame["Name"].tolist(), written["Name"].tolist())
+        self.assertEqual(frame["Sponsor"][1], "EMPTY")
+        self.assertTrue(pd.isna(frame["DCS"][0]))
+
+        # Dictionaries grow across record batches
+        from rscrape.export import RecordWriter
+
+        path = os.path.join(self.cachedir.name, "batches.arrow")
+        with RecordWriter(path, "arrow", batch=2) as writer:
+            for repeater in classifyrepeaters(rpters * 3, False, False, "Low", "v1"):
+                writer.write(StreamEntry(repeater, True, None))
+        with pa.ipc.open_file(path) as reader:
+            batches = reader.read_all()
+        self.assertEqual(batches.num_rows, 9)
+        self.assertEqual(
+            batches.column("City").to_pylist()[-3:], ["Boston", "Salem", "Keene"]
+        )
+
+        with self.assertRaises(SystemExit):
+            main(["-q", "nerep", "--format", "xlsx"])
+
+    def test_writerepeaters_sqlite_upsert(self) -> None:
+        """Test --sqlite upserts repeaters by call, frequency and source."""
+        import sqlite3
+
+        header = ("LOC", "FREQ", "PL", "CALL", "DIST", "SPONSOR", "NOTES")
+        nerep = RepeaterTable(
+            header,
+            [
+                (
+                    "Boston, MA",
+                    "146.940",
+                    "100.0",
+                    "W1AW",
+                    "1.0N",
+                    "ARRL",
+                    float("nan"),
+                ),
+                ("Salem, MA", "443.000", "DMR", "N1DMR", "4.0S", "ARES", "DMR CC1"),
+            ],
+        )
+        nyrep = RepeaterTable(
+            header, [("Albany, NY", "444.100", "DMR", "W2DMR", "90.0W", "ARES", "CC2")]
+        )
+        store = os.path.join(self.cachedir.name, "repeaters.db")
+        output = os.path.join(self.cachedir.name, "out.csv")
+
+        def run(tables: list[RepeaterTable], sources: list[str], origin: str) -> int:
+            rpters = mergerepeatertables(tables, sources)
+            repeaters = classifyrepeaters(rpters, False, False, "Low", "v1")
+            entries = selectrepeaters(repeaters, ["all"], False, "")
+            return writerepeaters(entries, output, None, "csv", store, origin)
+
+        self.assertEqual(run([nerep, nyrep], ["nerep", "nyrep"], "Boston, MA"), 3)
+        self.assertEqual(run([nerep], ["nerep"], "Salem, MA"), 2)
+
+        with sqlite3.connect(store) as connection:
+            rows = connection.execute(
+                "SELECT call, frequency, source, origin, dmr FROM repeaters ORDER BY frequency"
+            ).fetchall()
+            self.assertEqual(
+                rows,
+                [
+                    ("W1AW", 146.94, "nerep", "Salem, MA", 0),
+                    ("N1DMR", 443.0, "nerep", "Salem, MA", 1),
+                    ("W2DMR", 444.1, "nyrep", "Boston, MA", 1),
+                ],
+            )
+            query = (
+                "SELECT call FROM repeaters WHERE dmr AND state = 'MA' "
+                "AND frequency BETWEEN 420 AND 450"
+            )
+            self.assertEqual(connection.execute(query).fetchall(), [("N1DMR",)])
+            plan = str(connection.execute("EXPLAIN QUERY PLAN " + query).fetchall())
+            self.assertIn("repeaters_dmr", plan)
+            self.assertEqual(
+                connection.execute("PRAGMA journal_mode").fetchone(), ("wal",)
+            )
+
+    def test_writerepeaters_fans_out_to_sinks(self) -> None:
+        """Test one pass feeds CSV, CHIRP, JSON Lines, GeoJSON and registered sinks."""
+        import io
+        import json
+
+        from webscrape import (
+            EXPORT_DESTINATIONS,
+            EXPORTERS,
+            ExportSink,
+            createparser,
+            registerexporter,
+        )
+
+        class CountingSink(ExportSink):
+            entries: list[StreamEntry] = []
+
+            def write(self, entry: StreamEntry) -> None:
+                self.entries.append(entry)
+
+        class ForgetfulSink(ExportSink):
+            pass
+
+        # A sink without write fails when it is opened, not while writing
+        with self.assertRaises(TypeError):
+            ForgetfulSink()  # type: ignore[abstract]
+
+        self.addCleanup(EXPORTERS.pop, "counting")
+        self.addCleanup(EXPORT_DESTINATIONS.pop, "counting")
+        registerexporter("counting", lambda target: CountingSink(), "a counter")
+
+        # --help lists every registered format and where it goes
+        usage = " ".join(createparser().format_help().split())
+        self.assertIn("jsonl (stdout), geojson (<output>.geojson)", usage)
+        self.assertIn("counting (a counter)", usage)
+        self.assertNotIn("sqlite (", usage)
+
+        reads = []
+
+        def rows() -> Any:
+            for number, pl in enumerate(["100.0", "DMR", "88.5"]):
+                reads.append(number)
+                yield [
+                    "Boston, MA",
+                    "146.940",
+                    pl,
+                    f"W{number}",
+                    "1.0N",
+                    "ARRL",
+                    "Notes",
+                ]
+
+        repeaters = classifyrepeaters(rows(), False, False, "Low", "v1")
+        entries = selectrepeaters(repeaters, ["fm"], True, "")
+        output = os.path.join(self.cachedir.name, "out.csv")
+        chirpfile = os.path.join(self.cachedir.name, "CHIRP_out.csv")
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            count = writerepeaters(
+                entries, output, chirpfile, "csv,jsonl,geojson,counting"
+            )
+
+        self.assertEqual(count, 2)
+        self.assertEqual(reads, [0, 1, 2])
+        self.assertEqual(len(CountingSink.entries), 2)
+        lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([line["call"] for line in lines], ["W0", "W2"])
+        self.assertEqual(lines[0]["modes"], ["fm"])
+        self.assertEqual(lines[0]["mhz"], 146.94)
+        with open(
+            os.path.join(self.cachedir.name, "out.geojson"), encoding="UTF8"
+        ) as f:
+            collection = json.load(f)
+        self.assertEqual(collection["type"], "FeatureCollection")
+        self.assertEqual(
+            [f["properties"]["call"] for f in collection["features"]], ["W0", "W2"]
+        )
+        with open(chirpfile, encoding="UTF8") as f:
+            self.assertEqual(len(f.read().splitlines()), 3)
+
+        with self.assertRaisesRegex(ValueError, "Invalid format 'sqlite'"):
+            writerepeaters(iter([]), output, None, "sqlite")
+
+    @patch("requests.Session.post")
+    def test_serve_api(self, mock_post: MagicMock) -> None:
+        """Test the HTTP API answers repeated queries from memory in every format."""
+        import json
+        import urllib.error
+        import urllib.request
+
+        from rscrape.serve import RepeaterService, createserver
+
+        mock_post.return_value = MagicMock(
+            ok=True,
+            text="<table><tr><td>LOC</td><td>FREQ</td><td>PL</td><td>CALL</td>"
+            "<td>DIST</td><td>SPONSOR</td><td>NOTES</td></tr>"
+            "<tr><td>Boston, MA</td><td>146.940</td><td>100.0</td><td>W1AW</td>"
+            "<td>1.0N</td><td>ARRL</td><td>DMR CC1</td></tr>"
+            "<tr><td>Salem, NH</td><td>147.000</td><td>DMR</td><td>N1XYZ</td>"
+            "<td>4.0S</td><td></td><td></td></tr></table>",
+        )
+        service = RepeaterService(None)
+        server = createserver("127.0.0.1", 0, service)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base = f"http://127.0.0.1:{server.server_port}"
+
+        def get(path: str) -> tuple[int, str]:
+            try:
+                with urllib.request.urlopen(base + path) as response:
+                    return response.status, response.read().decode("UTF8")
+            except urllib.error.HTTPError as e:
+                return e.code, e.read().decode("UTF8")
+
+        query = "/repeaters?city=Boston&state=MA&radius=25&dbfilter=nerep"
+        status, body = get(query)
+        self.assertEqual(status, 200)
+        self.assertEqual([r["call"] for r in json.loads(body)], ["W1AW", "N1XYZ"])
+
+        status, body = get(query + "&format=csv&filter=dmr%2B!fm")
+        self.assertEqual(body.splitlines()[0].split(",")[0], "City")
+        self.assertEqual(
+            [line.split(",")[5] for line in body.splitlines()[1:]], ["N1XYZ"]
+        )
+        status, body = get(query + "&format=chirp")
+        self.assertEqual(body.splitlines()[1].split(",")[:2], ["0", "W1AW"])
+        status, body = get(query + "&format=jsonl&search=W1AW")
+        self.assertEqual(len(body.splitlines()), 1)
+        status, body = get(query + "&q=call%3An1")
+        self.assertEqual([r["call"] for r in json.loads(body)], ["N1XYZ"])
+        status, body = get(query + "&q=notes%3Acc1+boston&format=csv")
+        self.assertEqual(
+            [line.split(",")[5] for line in body.splitlines()[1:]], ["W1AW"]
+        )
+        self.assertEqual(get(query + "&q=band%3A2m")[0], 400)
+        # Every query above was answered from the first fetch
+        self.assertEqual(service.fetches, 1)
+        self.assertEqual(mock_post.call_count, 1)
+
+        self.assertEqual(get("/repeaters?state=Massachusetts")[0], 400)
+        self.assertEqual(get("/repeaters?colour=red")[0], 400)
+        self.assertEqual(get("/elsewhere")[0], 404)
+        self.assertEqual(json.loads(get("/health")[1])["status"], "ok")
+
+    def test_singleflight_coalesces_calls(self) -> None:
+        """Test concurrent identical calls run once and share the result."""
+        from rscrape.serve import SingleFlight
+
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def call() -> int:
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 42
+
+        results: list[int] = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do("key", call)))
+            for _ in range(5)
+        ]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(len(calls), 1)
+        # A later call runs again
+        self.assertEqual(flight.do("key", lambda: 7), 7)
+
+    def test_mirror_answers_radius_queries(self) -> None:
+        """Test the mirror computes distance and direction from city positions."""
+        from rscrape.mirror import RepeaterMirror, formatdistdir, locate
+
+        nan = float("nan")
+        header = ("LOC", "FREQ", "PL", "CALL", "DIST/DIR", "SPONSOR", "NOTES")
+        nerep = RepeaterTable(
+            header,
+            [
+                ("Boston, MA", "146.820", "127.3", "W1BOS", "35.0E", nan, nan),
+                ("Providence, RI", "442.500", "100.0", "W1PVD", "40.0S", "Club", nan),
+                ("Nowhere Town, MA", "147.000", "88.5", "W1NWH", "10.0N", nan, nan),
+                ("Nowhere Else, MA", "147.090", "88.5", "W1XXX", nan, nan, nan),
+                # Directions and distances no database publishes are left out
+                ("Nowhere Odd, MA", "147.120", "88.5", "W1YYY", "12.0EW", nan, nan),
+                ("Nowhere Dash, MA", "147.150", "88.5", "W1ZZZ", "12-3N", nan, nan),
+            ],
+        )
+        nyrep = RepeaterTable(
+            header, [("Albany, NY", "145.110", "100.0", "W2ALB", "140.0W", nan, nan)]
+        )
+        RepeaterMirror.fromtables([nerep, nyrep], ["nerep", "nyrep"]).save(
+            self.cachedir.name
+        )
+        mirror = RepeaterMirror.load(self.cachedir.name)
+        self.assertEqual(len(mirror.entries), 4)
+
+        self.assertEqual(locate("E. Providence", "ri"), locate("East Providence", "RI"))
+        self.assertIsNone(locate("Providence", "MA"))
+        self.assertEqual(formatdistdir(0.04, 200.0), "0.0")
+        self.assertEqual(formatdistdir(12.34, 350.0), "12.3N")
+        self.assertEqual(formatdistdir(5.0, 225.0), "5.0SW")
+
+        tables = mirror.tables("Providence", "RI", "50", "144,440", ["nerep", "nyrep"])
+        self.assertEqual(
+            [(row[3], row[4]) for row in tables[0].rows],
+            [("W1BOS", "41.4NE"), ("W1NWH", "46.2NW"), ("W1PVD", "0.0")],
+        )
+        self.assertEqual(tables[1].rows, [])
+        self.assertEqual(tables[0].rows[2][5], "Club")
+        self.assertNotEqual(tables[0].rows[0][5], tables[0].rows[0][5])
+        tables = mirror.tables("Providence", "RI", "50", "440", ["nerep"])
+        self.assertEqual([row[3] for row in tables[0].rows], ["W1PVD"])
+        with self.assertRaisesRegex(ValueError, "Unknown location"):
+            mirror.tables("Atlantis", "RI", "50", "144", ["nerep"])
+        with self.assertRaisesRegex(ValueError, "not in the mirror"):
+            mirror.tables("Providence", "RI", "50", "144", ["csma"])
+
+        # Mirrored rows go through the same merge and classification
+        rows = fetchrepeaterrows(
+            MagicMock(), "Albany", "NY", "200", "144", 0, "nerep,nyrep", mirror=mirror
+        )
+        repeaters = list(classifyrepeaters(rows, False, False, "Low", "v1"))
+        self.assertEqual(
+            [(r.call, r.direct, r.source) for r in repeaters],
+            [("W2ALB", "", "nyrep"), ("W1BOS", "E", "nerep"), ("W1NWH", "E", "nerep")],
+        )
+        self.assertEqual(repeaters[1].miles, 140.3)
+
+    def test_nearestperfrequency(self) -> None:
+        """Test the closest repeaters per frequency are kept in their order."""
+        nan = float("nan")
+        rows = [
+            ["A, MA", "146.940", "100.0", "W1BBB", "12.0N", nan, nan],
+            ["B, MA", "146.94", "100.0", "W1AAA", "12.0S", nan, nan],
+            ["C, MA", "146.940", "100.0", "W1CCC", "3.5E", nan, nan],
+            ["D, MA", "147.000", "100.0", "W1DDD", "N/A", nan, nan],
+            ["E, MA", "147.000", "100.0", "W1EEE", "40.0W", nan, nan],
+            ["F, MA", nan, "100.0", "W1FFF", "1.0N", nan, nan],
+            ["G, MA", nan, "100.0", "W1GGG", "2.0N", nan, nan],
+        ]
+        calls = lambda kept: [row[3] for row in kept]  # noqa: E731
+        self.assertEqual(
+            calls(nearestperfrequency(rows, 1, rowrank)),
+            ["W1CCC", "W1EEE", "W1FFF", "W1GGG"],
+        )
+        self.assertEqual(
+            calls(nearestperfrequency(rows, 2, rowrank)),
+            ["W1AAA", "W1CCC", "W1DDD", "W1EEE", "W1FFF", "W1GGG"],
+        )
+        self.assertEqual(calls(nearestperfrequency(rows, 5, rowrank)), calls(rows))
+        repeaters = list(classifyrepeaters(rows, False, False, "Low", "v1"))
+        self.assertEqual(
+            [r.call for r in nearestperfrequency(repeaters, 1, repeaterrank)],
+            calls(nearestperfrequency(rows, 1, rowrank)),
+        )
+
+    @patch("requests.Session.post")
+    def test_main_oneper_fetches_full_result(self, mock_post: MagicMock) -> None:
+        """Test -k is applied locally, so the request is the one without -k."""
+        mock_response = MagicMock()
+        mock_response.text = (
+            "<table><tr><td>LOC</td><td>FREQ</td><td>PL</td><td>CALL</td>"
+            "<td>DIST/DIR</td><td>SPONSOR</td><td>NOTES</td></tr>"
+            "<tr><td>A, MA</td><td>146.940</td><td>100.0</td><td>W1FAR</td>"
+            "<td>20.0N</td><td></td><td></td></tr>"
+            "<tr><td>B, MA</td><td>146.940</td><td>100.0</td><td>W1NEAR</td>"
+            "<td>2.0S</td><td></td><td></td></tr></table>"
+        )
+        mock_post.return_value = mock_response
+        output = os.path.join(self.cachedir.name, "oneper.csv")
+        base = ["-c", "Boston", "-s", "MA", "-q", "nerep", "-o", output]
+
+        main(base + ["-k", "--no-cache"])
+        with open(output, encoding="UTF8") as f:
+            self.assertEqual([line.split(",")[5] for line in f][1:], ["W1NEAR"])
+        main(base + ["--no-cache"])
+        with open(output, encoding="UTF8") as f:
+            self.assertEqual(len(f.readlines()), 3)
+        forms = [
+            call.kwargs.get("data") or call.args[1] for call in mock_post.call_args_list
+        ]
+        self.assertEqual(forms[0], forms[1])
+        self.assertEqual(forms[0]["freq"], "")
+
+        # Both variants are answered from one cached response
+        mock_post.reset_mock()
+        main(base + ["-k"])
+        main(base + ["--perfreq", "2"])
+        self.assertEqual(mock_post.call_count, 1)
+        with self.assertRaises(SystemExit):
+            main(base + ["--perfreq", "-1"])
+
+    @patch("requests.Session.post")
+    def test_main_profile_report(self, mock_post: MagicMock) -> None:
+        """Test --profile writes per stage and per source timings as JSON."""
+        import json
+        import pstats
+
+        import webscrape
+
+        mock_response = MagicMock()
+        mock_response.text = (
+            "<table><tr><td>LOC</td><td>FREQ</td><td>PL</td><td>CALL</td>"
+            "<td>DIST/DIR</td><td>SPONSOR</td><td>NOTES</td></tr>"
+            "<tr><td>A, MA</td><td>146.940</td><td>100.0</td><td>W1AAA</td>"
+            "<td>2.0S</td><td></td><td>DMR</td></tr></table>"
+        )
+        mock_response.content = mock_response.text.encode()
+        mock_post.return_value = mock_response
+        output = os.path.join(self.cachedir.name, "profiled.csv")
+        report = os.path.join(self.cachedir.name, "profiled.profile.json")
+
+        main(["-q", "nerep,csma", "-o", output, "--no-cache", "--profile"])
+        with open(report, encoding="UTF8") as f:
+            profile = json.load(f)
+        stages = {
+            (stage["stage"], stage["source"]): stage for stage in profile["stages"]
+        }
+        self.assertEqual(
+            set(stages),
+            {
+                ("fetch", "nerep"),
+                ("fetch", "csma"),
+                ("parse", "nerep"),
+                ("parse", "csma"),
+                ("merge", ""),
+                ("classify", ""),
+                ("select", ""),
+                ("write", ""),
+            },
+        )
+        self.assertEqual(stages[("fetch", "csma")]["bytes"], len(mock_response.content))
+        self.assertEqual(stages[("parse", "nerep")]["rows_out"], 1)
+        self.assertEqual(stages[("merge", "")]["rows_in"], 2)
+        self.assertEqual(stages[("merge", "")]["rows_out"], 1)
+        self.assertEqual(stages[("write", "")]["rows_out"], 1)
+        self.assertGreater(profile["peak_rss_bytes"], 0)
+        # Stages over every source run one after another, fetches overlap
+        self.assertLessEqual(
+            sum(
+                stage["wall_seconds"]
+                for stage in profile["stages"]
+                if not stage["source"]
+            ),
+            profile["wall_seconds"],
+        )
+        for stage in profile["stages"]:
+            self.assertLessEqual(stage["wall_seconds"], profile["wall_seconds"])
+        self.assertNotIn("pstats", profile)
+        self.assertIsNone(webscrape.PROFILER)
+
+        # cProfile stats and traced peaks, written for failed runs too
+        with patch("webscrape.writerepeaters", side_effect=OSError("disk full")):
+            with self.assertRaises(SystemExit):
+                main(["-q", "nerep", "-o", output, "--no-cache", "--profile-stats"])
+        with open(report, encoding="UTF8") as f:
+            profile = json.load(f)
+        self.assertGreater(profile["traced_peak_bytes"], 0)
+        self.assertIn("traced_peak_bytes", profile["stages"][0])
+        self.assertGreater(pstats.Stats(profile["pstats"]).total_calls, 0)
+        self.assertIsNone(webscrape.PROFILER)
+
+    def test_profiler_traced_peak_across_threads(self) -> None:
+        """Test a stage entered on another thread keeps the peak of a running one."""
+        import tracemalloc
+
+        from webscrape import Profiler
+
+        profiler = Profiler(memory=True)
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        allocated = threading.Event()
+        entered = threading.Event()
+
+        def other() -> None:
+            allocated.wait()
+            with profiler.stage("fetch", "csma"):
+                entered.set()
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        with profiler.stage("fetch", "nerep"):
+            block = bytearray(4 << 20)
+            del block
+            allocated.set()
+            entered.wait()
+        thread.join()
+        stages = {stage["source"]: stage for stage in profiler.report()}
+        self.assertGreaterEqual(stages["nerep"]["traced_peak_bytes"], 4 << 20)
+        self.assertLess(stages["csma"]["traced_peak_bytes"], 4 << 20)
+
+    def test_microbench_baseline_report(self) -> None:
+        """Test the benchmark data parses back and regressions are flagged."""
+        import json
+
+        from rscrape.bench import syntheticpage, syntheticrows
+        from rscrape.microbench import (
+            BENCH_BASELINE,
+            BENCH_ROWS,
+            BENCHMARKS,
+            comparebaseline,
+            formatreport,
+            runbenchmarks,
+        )
+
+        rows = syntheticrows(200, seed=7)
+        self.assertEqual(syntheticrows(200, seed=7), rows)
+        table = extractrepeatertable(syntheticpage(rows))
+        self.assertIsNotNone(table)
+        assert table is not None
+        self.assertEqual(
+            [list(row) for row in table.rows],
+            [[str(cell) if cell == cell else cell for cell in row] for row in rows],
+        )
+        modes = 0
+        for repeater in classifyrepeaters(rows, False, False, "Low", "v1"):
+            modes |= repeater.modes
+        self.assertEqual(
+            modes, MODE_FM | MODE_DMR | MODE_NXDN | MODE_P25 | MODE_DSTAR | MODE_YSF
+        )
+
+        results = runbenchmarks(["determineoffset", "merge", "pipeline"], [50], 1)
+        self.assertEqual(
+            [(r["benchmark"], r["rows"]) for r in results],
+            [("determineoffset", 50), ("merge", 50), ("pipeline", 50)],
+        )
+        self.assertTrue(all(r["seconds"] > 0 for r in results))
+
+        baseline = [
+            {**results[0], "seconds": results[0]["seconds"] * 2},
+            {**results[1], "seconds": results[1]["seconds"] / 2},
+        ]
+        compared = comparebaseline(results, baseline, 0.1)
+        self.assertEqual(
+            [r["status"] for r in compared], ["improved", "regression", "new"]
+        )
+        self.assertAlmostEqual(compared[1]["change"], 1.0, places=2)
+        report = formatreport(compared)
+        self.assertIn("regression", report)
+        self.assertEqual(len(report.splitlines()), 4)
+
+        # The reference baseline covers every benchmark at the default sizes
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), BENCH_BASELINE)
+        with open(path, encoding="UTF8") as f:
+            reference = json.load(f)["results"]
+        self.assertEqual(
+            {(r["benchmark"], r["rows"]) for r in reference},
+            {
+                (name, int(rows))
+                for name in BENCHMARKS
+                for rows in BENCH_ROWS.split(",")
+            },
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
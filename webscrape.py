@@ -20,109 +20,98 @@ Example:
     python3 webscrape.py -c Boston -s MA -r 25 -b 144,440 -f ysf,dmr
 """
 
+from __future__ import annotations
+
 import argparse
+import bisect
 import csv
+import gzip
+import hashlib
+import heapq
+import json
 import logging
+import multiprocessing
+import os
 import re
 import sys
+import threading
+import time
+import tracemalloc
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import AbstractContextManager, ExitStack, contextmanager, nullcontext
+from functools import partial
 from io import StringIO
-from typing import Any
+from types import TracebackType
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+# pandas, requests and lxml are imported where they are used so that --help,
+# validation errors and cached or replayed queries start quickly
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    import requests
 
-import pandas as pd
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+    from rscrape.mirror import RepeaterMirror
 
 # Version info
 __version__ = "0.90.3"  # Type Checking and Pre-Commit checks
 
+# Repeater Query URL
+NESMC_URL = "https://rptr.amateur-radio.net/cgi-bin/exec.cgi"
 
-def updatewebformdata(
-    formdata: dict[str, str],
-    city: str,
-    state: str,
-    radius: str,
-    bands: str,
-    numperfreq: str,
-    dbfilter: str,
-) -> None:
-    # def updatewebformdata(formdata, city, state, radius, bands, numperfreq, dbfilter):
-    """Update the web form data dictionary with search parameters.
+# Individual databases served by the query URL
+DB_SOURCES = ("nerep", "nesmc", "csma", "nyrep")
 
-    Args:
-        formdata (dict): The form data dictionary to update.
-        city (str): The city to search from.
-        state (str): The two-letter state abbreviation.
-        radius (str): The search radius in miles.
-        bands (str): Comma-separated list of bands to search.
-        numperfreq (str): Option for number of repeaters per frequency.
-        dbfilter (str): The database filter to use.
+# Combined dbfilter shorthands and the databases they expand to
+DB_COMBINED = {
+    "nesct": ("nesmc", "csma"),
+    "neny": ("nerep", "nyrep"),
+}
 
-    Returns:
-        None: Updates the formdata in place.
-    """
+# Form fields that identify a query for caching
+CACHE_KEY_FIELDS = ("loca", "radi", "band", "freq", "dbfilter")
 
-    location = city + ", " + state
-    bandlist = bands + ","
+# Response cache defaults
+CACHE_TTL = 3600  # seconds a cached response is fresh
+CACHE_STALE = 86400  # seconds a stale response may be served while refreshing
+CACHE_SIZE = 64  # megabytes of response bodies kept on disk
 
-    formupdate = {
-        "loca": location,
-        "radi": radius,
-        "band": bandlist,
-        "freq": numperfreq,
-        "dbfilter": dbfilter,
-    }
-    formdata.update(formupdate)
+PROCESS_CHUNK = 2000  # raw rows classified per worker process task
 
+MERGE_TOLERANCE = 0.0005  # MHz apart the same call is one repeater across databases
 
-# def processrepeaterdata(
-#    rpters,
-#    repeater_list,
-#    rfilter,
-#    chirp,
-#    chirpcount,
-#    chirprepeater,
-#    chirprepeaterlist,
-#    searchfilter,
-#    exnotes,
-#    DEBUG,
-#    tx_power,
-#    ams_mode,
-# ):
-def processrepeaterdata(
-    rpters: list[list[Any]],
-    repeater_list: list[list[Any]],
-    rfilter: list[str],
-    chirp: bool,
-    chirpcount: int,
-    chirprepeater: list[Any],
-    chirprepeaterlist: list[list[Any]],
-    searchfilter: str,
-    exnotes: bool,
-    DEBUG: bool,
-    tx_power: str,
-    ams_mode: str,
-) -> None:
-    """Process raw repeater data into formatted entries for output.
+PERFREQ_DIGITS = 4  # MHz decimals frequencies are grouped by for --oneper/--perfreq
 
-    Args:
-        rpters (list): List of raw repeater data entries.
-        repeater_list (list): List to append processed repeater entries.
-        rfilter (list): List of mode filters (e.g., ['fm', 'ysf']).
-        chirp (bool): Flag to generate CHIRP format output.
-        chirpcount (int): Counter for CHIRP location indexing.
-        chirprepeater (list): Temporary list for building CHIRP entry.
-        chirprepeaterlist (list): List to append CHIRP entries.
-        searchfilter (str): Text to search for in repeater entries.
-        exnotes (bool): Flag to include extended notes.
-        DEBUG (bool): Flag for debug printing.
-        tx_power (str): Transmit power level.
-        ams_mode (str): AMS mode version ('v1' or 'v2').
+# Export sinks enabled by their own option (-p, --sqlite) instead of --format
+OPTION_SINKS = ("chirp", "sqlite")
 
-    Returns:
-        None: Modifies repeater_list and chirprepeaterlist in place.
-    """
-    valid_pls = [
+# Frequency limits in MHz of each band, used to answer a query from a cached
+# query over more bands
+BAND_RANGES = {
+    "29": (28.0, 29.7),
+    "50": (50.0, 54.0),
+    "144": (144.0, 148.0),
+    "222": (219.0, 225.0),
+    "440": (420.0, 450.0),
+    "902": (902.0, 928.0),
+    "1296": (1240.0, 1300.0),
+}
+
+# Whitespace collapsed in table cells, as pd.read_html does
+CELL_WHITESPACE = re.compile(r"[\r\n]+|\s{2,}")
+
+# Value of an empty table cell, as pd.read_html reads it
+NAN = float("nan")
+
+
+# Valid Bands
+VALID_BANDS = {"29", "50", "144", "222", "440", "902", "1296"}
+
+# CTCSS tones accepted from the PL field or notes
+VALID_PLS = frozenset(
+    [
         "67.0",
         "69.3",
         "71.9",
@@ -166,8 +155,11 @@ def processrepeaterdata(
         "250.3",
         "254.1",
     ]
+)
 
-    valid_dcs = [
+# DCS codes accepted from the notes
+VALID_DCS = frozenset(
+    [
         "006",
         "007",
         "015",
@@ -277,34 +269,547 @@ def processrepeaterdata(
         "743",
         "754",
     ]
+)
+
+# City and state of a repeater location
+LOCATION = re.compile(r"([A-Z][A-Za-z\.\/ ]+),\s([A-Za-z]{2})")
+
+# Distance and direction of a repeater
+DISTDIR = re.compile(r"([0-9]{1,3}.[0-9])([EWNS][EW]{0,1}|)")
+
+# Modes and tone in the PL field, found in a single scan. A match consumes
+# only the first character of a pattern, which the leading class lets the
+# regex engine skip ahead to, and looks behind and ahead for the rest. Every
+# pattern is therefore reported at each position it matches, even where it
+# overlaps another, and the first report of each is what a search for that
+# pattern alone would find. Groups hold the text after the first character.
+PL_SCAN = re.compile(
+    r"[NnYyDdPp1-26-9](?:"
+    r"(?<=[Nn])(?=(?P<nxdn>(?i:xdn)))"
+    r"|(?<=[Yy])(?=(?P<ysf>(?i:sf)))"
+    r"|(?<=[Dd])(?=(?P<dstar>(?i:-star))|(?P<dmr>(?i:mr)))"
+    r"|(?<=[Pp])(?=(?P<p25>25))"
+    r"|(?=(?P<tone>(?<=[6-9])[0-9]\.[0-9]|(?<=[1-2])[0-9]{2}\.[0-9]))"
+    r")"
+)
+
+# Modes, codes and tones in the notes, scanned the same way as PL_SCAN. A
+# DCS( without a valid code still marks the repeater as FM.
+NOTES_SCAN = re.compile(
+    r"[YyFfDdNnRC1-26-9](?:"
+    r"(?=(?P<ysf>(?<=[Yy])(?i:sf)|(?<=[Ff])(?i:usion)))"
+    r"|(?<=[Dd])(?=(?P<dstar>(?i:-star))"
+    r"|(?P<dmr>(?i:mr))"
+    r"|(?P<dcs>(?i:cs\()(?:(?P<dcsnum>[0-9]{1,3})\))?)"
+    r"|(?P<dcode>[0-9]{3}))"
+    r"|(?<=[Nn])(?=(?P<nxdn>(?i:xdn)))"
+    r"|(?<=N)(?=(?P<nac>AC(?P<naccolon>:?)(?P<nacnum>[0-9]{3,4}|)))"
+    r"|(?<=R)(?=(?P<ran>AN[0-9]{1,2}))"
+    r"|(?<=C)(?=(?P<cc>C{1,3}[0-9]{1,2}))"
+    r"|(?=(?P<tone>(?<=[6-9])[0-9]\.[0-9]|(?<=[1-2])[0-9]{2}\.[0-9]))"
+    r")"
+)
+
+# Repeater Header
+REPEATER_HEADER = [
+    "City",
+    "State",
+    "Frequency",
+    "Offset",
+    "Offset Direction",
+    "Name",
+    "Distance",
+    "Direction",
+    "Sponsor",
+    "FM",
+    "CTCSS",
+    "DCS",
+    "Tone Mode",
+    "DMR",
+    "DMR CC",
+    "NXDN",
+    "NXDN RAN",
+    "P25",
+    "P25 NAC",
+    "D-STAR",
+    "YSF",
+    "TX Power",
+    "Operating Mode",
+    "AMS",
+    "Comment",
+]
+
+# Chirp Repeater Header
+CHIRP_HEADER = [
+    "Location",
+    "Name",
+    "Frequency",
+    "Duplex",
+    "Offset",
+    "Tone",
+    "rToneFreq",
+    "cToneFreq",
+    "DtcsCode",
+    "DtcsPolarity",
+    "Mode",
+    "TStep",
+    "Skip",
+    "Comment",
+    "URCALL",
+    "RPT1CALL",
+    "RPT2CALL",
+    "DVCODE",
+]
+
+# Web Form Data
+FORMDATA = {
+    "task": "rsearch",
+    "template": "nesmc",
+    "band": "",
+    "sortby": "freq",
+    "meth": "RPList",
+    "radi": "",
+    "loca": "",
+    "freq": "",
+    "final": "Go!",
+}
+
+# Batch job fields, named after the long command line options
+BATCH_FIELDS = (
+    "city",
+    "state",
+    "radius",
+    "bands",
+    "filter",
+    "outputfile",
+    "oneper",
+    "chirp",
+    "dbfilter",
+    "xnotes",
+    "search",
+    "amsmode",
+    "power",
+    "columnar",
+    "prefer",
+    "format",
+    "sqlite",
+    "perfreq",
+)
+
+# Batch job field aliases
+BATCH_ALIASES = {"output": "outputfile", "filters": "filter"}
+
+
+def updatewebformdata(
+    formdata: dict[str, str],
+    city: str,
+    state: str,
+    radius: str,
+    bands: str,
+    numperfreq: str,
+    dbfilter: str,
+) -> None:
+    # def updatewebformdata(formdata, city, state, radius, bands, numperfreq, dbfilter):
+    """Update the web form data dictionary with search parameters.
+
+    Args:
+        formdata (dict): The form data dictionary to update.
+        city (str): The city to search from.
+        state (str): The two-letter state abbreviation.
+        radius (str): The search radius in miles.
+        bands (str): Comma-separated list of bands to search.
+        numperfreq (str): Option for number of repeaters per frequency.
+        dbfilter (str): The database filter to use.
+
+    Returns:
+        None: Updates the formdata in place.
+    """
+
+    location = city + ", " + state
+    bandlist = bands + ","
+
+    formupdate = {
+        "loca": location,
+        "radi": radius,
+        "band": bandlist,
+        "freq": numperfreq,
+        "dbfilter": dbfilter,
+    }
+    formdata.update(formupdate)
+
+
+def hasnan(value: Any) -> bool:
+    """Check a raw cell the way the row processing always has.
+
+    Any cell whose text contains "nan" counts as empty, which covers NaN
+    cells and, as before, words such as "maintenance".
+
+    Args:
+        value: Cell value.
+
+    Returns:
+        bool: True if the cell text contains "nan".
+    """
+    return "nan" in (value if isinstance(value, str) else str(value))
+
+
+# Mode bits of Repeater.modes
+MODE_FM = 1
+MODE_DMR = 2
+MODE_NXDN = 4
+MODE_P25 = 8
+MODE_DSTAR = 16
+MODE_YSF = 32
+
+# Mode filter names and their bits
+MODE_BITS = {
+    "fm": MODE_FM,
+    "ysf": MODE_YSF,
+    "dmr": MODE_DMR,
+    "dstar": MODE_DSTAR,
+    "p25": MODE_P25,
+    "nxdn": MODE_NXDN,
+}
+
+# Number of distinct combinations of mode bits
+MODE_SETS = 1 << len(MODE_BITS)
+
+
+class ModeFlags(NamedTuple):
+    """Operating modes and access codes of a repeater, as output fields."""
+
+    fm: str
+    pltone: str
+    dcs: str
+    tonemode: str
+    dmr: str
+    dmr_cc: str
+    nxdn: str
+    nxdn_ran: str
+    p25: str
+    p25_nac: str
+    dstar: str
+    ysf: str
+
+
+def classifymodes(plfield: str | None, notes: str) -> ModeFlags:
+    """Classify a repeater from its PL field and notes.
+
+    Each field is scanned once with a precompiled pattern; the first match
+    of every pattern gives the same result as searching for it on its own.
+
+    Args:
+        plfield (str): PL field, or None if empty.
+        notes (str): Repeater notes, "EMPTY" if there are none.
+
+    Returns:
+        ModeFlags: "TRUE" or "" for each mode, with the tone and codes found.
+    """
+    plfound: dict[str | None, re.Match[str]] = {}
+    if plfield is not None:
+        for match in PL_SCAN.finditer(plfield):
+            plfound.setdefault(match.lastgroup, match)
+    found: dict[str | None, re.Match[str]] = {}
+    dcsfound = None
+    for match in NOTES_SCAN.finditer(notes):
+        found.setdefault(match.lastgroup, match)
+        if match.lastgroup == "dcs" and dcsfound is None and match["dcsnum"]:
+            dcsfound = match
+
+    nxdn = "TRUE" if "nxdn" in plfound or "nxdn" in found else ""
+    ysf = "TRUE" if "ysf" in plfound or "ysf" in found else ""
+    dstar = "TRUE" if "dstar" in plfound or "dstar" in found else ""
+    dmr = "TRUE" if "dmr" in plfound or "dmr" in found else ""
+    p25 = "TRUE" if "p25" in plfound or "nac" in found else ""
+
+    # Codes are only read from notes that name the mode themselves
+    nxdn_ran = dmr_cc = p25_nac = ""
+    if "nxdn" in found and "ran" in found:
+        nxdn_ran = found["ran"][0] + found["ran"]["ran"]
+    if "dmr" in found and "cc" in found:
+        dmr_cc = found["cc"][0] + found["cc"]["cc"]
+    if "nac" in found:
+        nac = found["nac"]
+        p25_nac = "NAC" + nac["naccolon"] + " " + (nac["nacnum"] or "UNKNOWN")
+
+    # PL tone from the PL field, then from the notes
+    fm = pltone = dcs = tonemode = ""
+    if plfield is not None:
+        for tones in (plfound, found):
+            if "tone" in tones:
+                tone = tones["tone"][0] + tones["tone"]["tone"]
+                if tone in VALID_PLS:
+                    pltone = tone
+                    fm = "TRUE"
+                    tonemode = "Tone"
+                    break
+
+    # DCS from DCS(nnn), then from Dnnn
+    if notes != "EMPTY":
+        if "dcs" in found:
+            fm = "TRUE"
+            if dcsfound is not None:
+                code = dcsfound["dcsnum"].zfill(3)
+                if code in VALID_DCS:
+                    dcs = code
+                    tonemode = "DCS"
+        if "dcode" in found:
+            fm = "TRUE"
+            code = found["dcode"]["dcode"]
+            if code in VALID_DCS:
+                dcs = code
+                tonemode = "DCS"
+
+    # Some stations are FM and dont have a PL or DCS
+    if not (ysf or dstar or nxdn or p25 or dmr or fm):
+        fm = "TRUE"
+
+    return ModeFlags(
+        fm, pltone, dcs, tonemode, dmr, dmr_cc, nxdn, nxdn_ran, p25, p25_nac, dstar, ysf
+    )
+
+
+def modemask(modes: ModeFlags) -> int:
+    """Pack the mode flags of a repeater into Repeater.modes bits.
+
+    Args:
+        modes (ModeFlags): Modes from classifymodes.
+
+    Returns:
+        int: Bitmask of MODE_* bits.
+    """
+    mask = 0
+    if modes.fm:
+        mask |= MODE_FM
+    if modes.dmr:
+        mask |= MODE_DMR
+    if modes.nxdn:
+        mask |= MODE_NXDN
+    if modes.p25:
+        mask |= MODE_P25
+    if modes.dstar:
+        mask |= MODE_DSTAR
+    if modes.ysf:
+        mask |= MODE_YSF
+    return mask
+
+
+def tofloat(value: Any) -> float:
+    """Read a number from a cell, NaN if it has none.
+
+    Args:
+        value: Cell value.
+
+    Returns:
+        float: The number, or NaN.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+class Repeater(NamedTuple):
+    """One processed repeater.
+
+    Numbers and modes are kept typed, and text fields are shared with the
+    source rows, so large lists stay small and cheap to filter and sort.
+    Output rows are only built by row and chirprow when written.
+    """
+
+    city: str
+    state: str
+    freq: Any  # frequency as published, written verbatim
+    mhz: float  # frequency, NaN if not a number
+    offset: float
+    offset_dir: str
+    call: str
+    dist: str  # distance as published, written verbatim
+    miles: float  # distance, NaN if not a number
+    direct: str
+    sponsor: str
+    modes: int  # MODE_* bits
+    pltone: float | None
+    dcs: int | None
+    dmr_cc: str
+    nxdn_ran: str
+    p25_nac: str
+    tx_power: str
+    ams_mode: str
+    notes: str
+    comment: str
+    source: str = ""  # database the repeater was listed by
+
+    def row(self) -> list[Any]:
+        """Build the output row of the repeater, in REPEATER_HEADER order.
+
+        Returns:
+            list: Output row.
+        """
+        modes = self.modes
+        pltone = "" if self.pltone is None else str(self.pltone)
+        dcs = "" if self.dcs is None else f"{self.dcs:03d}"
+        tonemode = "DCS" if dcs else "Tone" if pltone else ""
+
+        # YSF Operating Mode
+        operating_mode = "FM" if modes & MODE_FM else ""
+        ams = "N"
+        if modes & MODE_YSF:
+            if self.ams_mode == "v1":
+                operating_mode = "Auto"
+                ams = ""
+            elif self.ams_mode == "v2":
+                operating_mode = "FM"
+                ams = "Y"
+
+        return [
+            self.city,
+            self.state,
+            self.freq,
+            str(self.offset) if self.offset else "0",
+            self.offset_dir,
+            self.call,
+            self.dist,
+            self.direct,
+            self.sponsor,
+            "TRUE" if modes & MODE_FM else "",
+            pltone,
+            dcs,
+            tonemode,
+            "TRUE" if modes & MODE_DMR else "",
+            self.dmr_cc,
+            "TRUE" if modes & MODE_NXDN else "",
+            self.nxdn_ran,
+            "TRUE" if modes & MODE_P25 else "",
+            self.p25_nac,
+            "TRUE" if modes & MODE_DSTAR else "",
+            "TRUE" if modes & MODE_YSF else "",
+            self.tx_power,
+            operating_mode,
+            ams,
+            self.comment,
+        ]
+
+    def chirprow(self, location: int) -> list[str]:
+        """Build the CHIRP row of the repeater, in CHIRP_HEADER order.
+
+        Args:
+            location (int): CHIRP memory location.
+
+        Returns:
+            list: CHIRP row.
+        """
+        pltone = "88.5" if self.pltone is None else str(self.pltone)
+        return [
+            str(location),
+            self.call,
+            str(self.freq),
+            self.offset_dir,
+            f"{abs(float(self.offset)):.6f}",
+            "Tone" if self.dcs is None else "DTCS",
+            pltone,
+            pltone,
+            "023" if self.dcs is None else f"{self.dcs:03d}",
+            "NN",
+            "FM",
+            "5.00",
+            "",
+            f"{self.dist} :: {self.call} :: {self.city} {self.state} :: {self.notes}",
+            "",
+            "",
+            "",
+            "",
+        ]
+
+
+# def processrepeaterdata(
+#    rpters,
+#    repeater_list,
+#    rfilter,
+#    chirp,
+#    chirpcount,
+#    chirprepeater,
+#    chirprepeaterlist,
+#    searchfilter,
+#    exnotes,
+#    DEBUG,
+#    tx_power,
+#    ams_mode,
+# ):
+def processrepeaterdata(
+    rpters: list[list[Any]],
+    repeater_list: list[Repeater],
+    rfilter: list[str],
+    chirp: bool,
+    chirpcount: int,
+    chirprepeater: list[Any],
+    chirprepeaterlist: list[Repeater],
+    searchfilter: str,
+    exnotes: bool,
+    DEBUG: bool,
+    tx_power: str,
+    ams_mode: str,
+) -> None:
+    """Process raw repeater data into formatted entries for output.
+
+    Args:
+        rpters (list): List of raw repeater data entries.
+        repeater_list (list): List to append processed Repeater entries.
+        rfilter (list): List of mode filters (e.g., ['fm', 'ysf']).
+        chirp (bool): Flag to generate CHIRP format output.
+        chirpcount (int): Counter for CHIRP location indexing.
+        chirprepeater (list): Unused, kept for existing callers.
+        chirprepeaterlist (list): List to append Repeater entries for CHIRP.
+        searchfilter (str): Text to search for in repeater entries.
+        exnotes (bool): Flag to include extended notes.
+        DEBUG (bool): Flag for debug printing.
+        tx_power (str): Transmit power level.
+        ams_mode (str): AMS mode version ('v1' or 'v2').
+
+    Returns:
+        None: Modifies repeater_list and chirprepeaterlist in place.
+    """
+    repeaters = classifyrepeaters(rpters, exnotes, DEBUG, tx_power, ams_mode)
+    for entry in selectrepeaters(repeaters, rfilter, chirp, searchfilter, chirpcount):
+        if entry.location is not None:
+            chirpbuild(entry.repeater, chirprepeaterlist)
+        if entry.output:
+            repeater_list.append(entry.repeater)
+
+
+def classifyrepeaters(
+    rpters: Iterable[list[Any]],
+    exnotes: bool,
+    DEBUG: bool,
+    tx_power: str,
+    ams_mode: str,
+) -> Iterator[Repeater]:
+    """Turn raw repeater rows into Repeater records, one row at a time.
+
+    Args:
+        rpters (iterable): Raw repeater data entries.
+        exnotes (bool): Flag to include extended notes.
+        DEBUG (bool): Flag for debug printing.
+        tx_power (str): Transmit power level.
+        ams_mode (str): AMS mode version ('v1' or 'v2').
 
+    Yields:
+        Repeater: The processed repeater of each raw entry.
+    """
     # Iterate through repater list to write in preferred format
-    for i in range(len(rpters)):
+    for rpter in rpters:
         if DEBUG:
-            logging.debug(rpters[i])
+            logging.debug(rpter)
 
         # Initialize/clear variables
-        ysf_mode = ""
-        dstar_mode = ""
-        nxdn_mode = ""
-        nxdn_ran = ""
-        dmr_mode = ""
-        dmr_cc = ""
-        p25_mode = ""
-        p25_nac = ""
-        dcs_code = ""
-        fm_mode = ""
         ex_notes = ""
-        fm_tone_mode = ""
-        operating_mode = ""
-        ams = "N"
 
         # Separate City, State and populate variables
-        if "nan" in str(rpters[i][0]):
+        if hasnan(rpter[0]):
             city = "EMPTY"
             state = "EMPTY"
         else:
-            location = re.search(r"([A-Z][A-Za-z\.\/ ]+),\s([A-Za-z]{2})", rpters[i][0])
+            location = LOCATION.search(rpter[0])
             if location:
                 city = location.group(1)
                 state = location.group(2)
@@ -312,25 +817,25 @@ def processrepeaterdata(
                 city = state = "UNKNOWN"
 
         # Get Frequency
-        if "nan" in str(rpters[i][1]):
+        if hasnan(rpter[1]):
             freq = "EMPTY"
         else:
-            freq = rpters[i][1]
+            freq = rpter[1]
 
         # Get offset and offset direction
         # offsetinfo = []
         offsetinfo: dict[str, float | str] = determineoffset(freq)
-        offset = offsetinfo["offset"]
+        offset = float(offsetinfo["offset"])
         offset_dir = offsetinfo["offset_dir"]
 
         # Get Repeater Callsign
-        if "nan" in str(rpters[i][3]):
+        if hasnan(rpter[3]):
             call = "EMPTY"
         else:
-            call = rpters[i][3]
+            call = rpter[3]
 
         # Separate Distance and Direction and populate variables
-        distdir = re.search(r"([0-9]{1,3}.[0-9])([EWNS][EW]{0,1}|)", rpters[i][4])
+        distdir = DISTDIR.search(rpter[4])
         if distdir:
             dist = distdir.group(1)
             direct = distdir.group(2)
@@ -338,152 +843,18 @@ def processrepeaterdata(
             dist = direct = "UNKNOWN"
 
         # Get Repeater Sponsor
-        if "nan" in str(rpters[i][5]):
+        if hasnan(rpter[5]):
             sponsor = "EMPTY"
         else:
-            sponsor = rpters[i][5]
-
-        if "nan" not in str(rpters[i][2]):
-            # Determine if NXDN Capable in PL Section
-            if re.search("nxdn", rpters[i][2], re.IGNORECASE):
-                nxdn_mode = "TRUE"
-
-            # Determine if YSF Capable in PL Section
-            if re.search("ysf", rpters[i][2], re.IGNORECASE):
-                ysf_mode = "TRUE"
-
-            # Determine if D-Star Capable in PL Section
-            if re.search("d-star", rpters[i][2], re.IGNORECASE):
-                dstar_mode = "TRUE"
-
-            # Determine if DMR Capable in PL Section
-            if re.search("dmr", rpters[i][2], re.IGNORECASE):
-                dmr_mode = "TRUE"
-
-            # Determine if DMR Capable in PL Section
-            if re.search("p25", rpters[i][2], re.IGNORECASE):
-                p25_mode = "TRUE"
+            sponsor = rpter[5]
 
         # Get Repeater Notes
-        notes = rpters[i][6]
-        if "nan" in str(notes):
+        notes = rpter[6]
+        if hasnan(notes):
             notes = "EMPTY"
-        else:
-            # Determine if C4FM Capable
-            ysf_match = re.search(r"ysf|fusion", notes, re.IGNORECASE)
-            if ysf_match:
-                ysf_mode = "TRUE"
-
-            # Determine if D-STAR Capable
-            dstar_match = re.search("d-star", notes, re.IGNORECASE)
-            if dstar_match:
-                dstar_mode = "TRUE"
-
-            # Get NXDN RAN if defined
-            nxdn_match = re.search("nxdn", notes, re.IGNORECASE)
-            if nxdn_match:
-                nxdn_mode = "TRUE"
-                code = re.search(r"RAN[0-9]{1,2}", notes)
-                if code:
-                    nxdn_ran = code.group(0)
-
-            # Determine if DMR Capable and set CC
-            dmr_match = re.search("dmr", notes, re.IGNORECASE)
-            if dmr_match:
-                dmr_mode = "TRUE"
-                code = re.search(r"[C]{2,4}[0-9]{1,2}", notes)
-                if code:
-                    dmr_cc = code.group(0)
-
-            # Determine if P25 Capable and set NAC
-            p25_match = re.search(r"(NAC\:|NAC)([0-9]{3,4}|)", notes)
-
-            if p25_match:
-                p25_mode = "TRUE"
-                if p25_match.group(2) == "":
-                    nac_number = "UNKNOWN"
-                else:
-                    nac_number = p25_match.group(2)
-                p25_nac = p25_match.group(1) + " " + nac_number
-
-        # Determine if Analog FM capable and set PL Tone from table and then tries notes
-        pltone = ""
-        if "nan" in str(rpters[i][2]):
-            pltone = ""
-        else:
-            pl_match = re.search(
-                r"[6-9]{1}[0-9]{1}\.[0-9]{1}|[1-2]{1}[0-9]{2}\.[0-9]{1}",
-                rpters[i][2],
-                re.IGNORECASE,
-            )
-            if pl_match and pl_match.group(0) in valid_pls:
-                pltone = pl_match.group(0)
-                fm_mode = "TRUE"
-                fm_tone_mode = "Tone"
-            elif pltone == "":
-                pl_match = re.search(
-                    r"[6-9]{1}[0-9]{1}\.[0-9]{1}|[1-2]{1}[0-9]{2}\.[0-9]{1}",
-                    notes,
-                    re.IGNORECASE,
-                )
-                if pl_match and pl_match.group(0) in valid_pls:
-                    fm_mode = "TRUE"
-                    pltone = pl_match.group(0)
-                    fm_tone_mode = "Tone"
-                else:
-                    pltone = ""
-
-        # Determine if FM Analog Capable and set DCS
-        if notes != "EMPTY":
-            if re.search(r"DCS\(", notes, re.IGNORECASE):
-                fm_mode = "TRUE"
-                code = re.search(
-                    r"DCS\(([0-9]{1,3})\)", notes, re.IGNORECASE
-                )  # Added IGNORECASE for consistency
-                if code:
-                    captured = code.group(1).zfill(
-                        3
-                    )  # Pad to 3 digits (handles e.g., '23' -> '023')
-                    if captured in valid_dcs:
-                        dcs_code = captured
-                        fm_tone_mode = "DCS"
-
-            if re.search(r"D[0-9][0-9]{2}", notes, re.IGNORECASE):
-                fm_mode = "TRUE"
-                code = re.search(
-                    r"D([0-9]{3})", notes, re.IGNORECASE
-                )  # Fixed to [0-9]{3}, added IGNORECASE
-                if code:
-                    # Already 3 digits, no padding needed
-                    captured = code.group(1)
-                    if captured in valid_dcs:
-                        dcs_code = captured
-                        fm_tone_mode = "DCS"
-
-        # Some stations are FM and dont have a PL or DCS
-        # Adding logic for these stations
-        if (
-            ysf_mode != "TRUE"
-            and dstar_mode != "TRUE"
-            and nxdn_mode != "TRUE"
-            and p25_mode != "TRUE"
-            and dmr_mode != "TRUE"
-            and fm_mode != "TRUE"
-        ):
-            fm_mode = "TRUE"
-
-        # YSF Operating Mode
-        if fm_mode:
-            operating_mode = "FM"
-            ams = "N"
 
-        if ysf_mode:
-            if ams_mode == "v1":
-                operating_mode = "Auto"
-                ams = ""
-            elif ams_mode == "v2":
-                operating_mode = "FM"
-                ams = "Y"
+        # Determine modes, PL tone, DCS and digital codes
+        modes = classifymodes(None if hasnan(rpter[2]) else rpter[2], notes)
 
         # Extended Notes
         if DEBUG:
@@ -491,356 +862,2455 @@ def processrepeaterdata(
         if notes != "EMPTY":
             ex_notes = city + "," + state + "," + call + "," + notes
 
+        # Source database, added after the cells by mergerepeatertables
+        source = rpter[7] if len(rpter) > 7 else ""
+
         # Build Repeater Entry
-        repeater = []
-        repeater.append(city)
-        repeater.append(state)
-        repeater.append(freq)
-        repeater.append(str(offset))
-        repeater.append(str(offset_dir))
-        repeater.append(call)
-        repeater.append(dist)
-        repeater.append(direct)
-        repeater.append(sponsor)
-        repeater.append(fm_mode)
-        repeater.append(pltone)
-        repeater.append(dcs_code)
-        repeater.append(fm_tone_mode)
-        repeater.append(dmr_mode)
-        repeater.append(dmr_cc)
-        repeater.append(nxdn_mode)
-        repeater.append(nxdn_ran)
-        repeater.append(p25_mode)
-        repeater.append(p25_nac)
-        repeater.append(dstar_mode)
-        repeater.append(ysf_mode)
-        repeater.append(tx_power)
-        repeater.append(operating_mode)
-        repeater.append(ams)
-
-        if exnotes:
-            repeater.append(ex_notes)
-        else:
-            repeater.append(notes)
-
-        # If chirp option is true build chirp list
-        if chirp and fm_mode:
-            chirprepeater = []
-            # chirprepeater: list[Any] = []
-            chirprepeater.append(str(chirpcount))
-            chirprepeater.append(call)
-            # chirprepeater.append(freq)
-            chirprepeater.append(str(freq))
-            chirprepeater.append(offset_dir)
-            chirprepeater.append(f"{abs(float(offset)):.6f}")
-            if dcs_code and not dcs_code.isspace():
-                chirprepeater.append("DTCS")
-            else:
-                chirprepeater.append("Tone")
-            if pltone and not pltone.isspace():
-                chirprepeater.append(pltone)
-                chirprepeater.append(pltone)
-            else:
-                chirprepeater.append("88.5")
-                chirprepeater.append("88.5")
-            if dcs_code and not dcs_code.isspace():
-                chirprepeater.append(dcs_code)
-            else:
-                chirprepeater.append("023")
-            chirprepeater.append("NN")
-            chirprepeater.append("FM")
-            chirprepeater.append("5.00")
-            chirprepeater.append("")
-            chirprepeater.append(
-                dist + " :: " + call + " :: " + city + " " + state + " :: " + notes
-            )
-            chirprepeater.append("")
-            chirprepeater.append("")
-            chirprepeater.append("")
-            chirprepeater.append("")
-
-        # Build Chirp list
-        if chirp and fm_mode:
-            if searchfilter != "":
-                if any(searchfilter in s for s in chirprepeater):
-                    chirpbuild(chirprepeater, chirprepeaterlist)
-                    chirpcount += 1
-            else:
-                chirpbuild(chirprepeater, chirprepeaterlist)
+        yield Repeater(
+            city,
+            state,
+            freq,
+            tofloat(freq),
+            offset,
+            str(offset_dir),
+            call,
+            dist,
+            tofloat(dist),
+            direct,
+            sponsor,
+            modemask(modes),
+            float(modes.pltone) if modes.pltone else None,
+            int(modes.dcs) if modes.dcs else None,
+            modes.dmr_cc,
+            modes.nxdn_ran,
+            modes.p25_nac,
+            tx_power,
+            ams_mode,
+            notes,
+            ex_notes if exnotes else notes,
+            source,
+        )
+
+
+class StreamEntry(NamedTuple):
+    """A repeater selected for output, and where it is written."""
+
+    repeater: Repeater
+    output: bool  # written to the repeater file
+    location: int | None  # CHIRP memory location, None if not a CHIRP entry
+
+
+def selectrepeaters(
+    repeaters: Iterable[Repeater],
+    rfilter: list[str],
+    chirp: bool,
+    searchfilter: str,
+    chirpcount: int = 0,
+) -> Iterator[StreamEntry]:
+    """Select the repeaters to write as they stream past.
+
+    CHIRP memory locations are counted here, in the order entries are kept.
+
+    Args:
+        repeaters (iterable): Processed repeaters.
+        rfilter (list): List of mode filters (e.g., ['fm', 'ysf']).
+        chirp (bool): Flag to select CHIRP entries as well.
+        searchfilter (str): Text to search for in repeater entries.
+        chirpcount (int): First CHIRP memory location.
+
+    Yields:
+        StreamEntry: Each repeater written to either file.
+    """
+    plan = compilefilter(rfilter)
+    for repeater in repeaters:
+        # Chirp entries are FM repeaters, numbered in the order they are kept
+        location = None
+        if chirp and repeater.modes & MODE_FM:
+            if searchfilter == "" or any(
+                searchfilter in s for s in repeater.chirprow(chirpcount)
+            ):
+                location = chirpcount
                 chirpcount += 1
 
-        # Append filtered output
-        if searchfilter != "":
-            if any(searchfilter in s for s in repeater):
-                filteroutput(rfilter, repeater, repeater_list)
-        else:
-            filteroutput(rfilter, repeater, repeater_list)
+        # Filtered output, searching only repeaters of wanted modes
+        output = bool(plan >> repeater.modes & 1) and (
+            searchfilter == "" or any(searchfilter in s for s in repeater.row())
+        )
 
+        if output or location is not None:
+            yield StreamEntry(repeater, output, location)
 
-# def determineoffset(freq_string):
-def determineoffset(freq_string: str) -> dict[str, float | str]:
-    """Calculate repeater offset based on frequency.
+
+class ExportTarget(NamedTuple):
+    """Where the outputs of one query are written."""
+
+    outputfile: str
+    chirpfile: str | None = None
+    store: str | None = None  # SQLite database
+    origin: str = ""  # location of the query
+
+    def path(self, suffix: str) -> str:
+        """Path of a file named after the output file, with its own suffix.
+
+        Args:
+            suffix (str): File suffix i.e. ".parquet".
+
+        Returns:
+            str: Path of the file.
+        """
+        return os.path.splitext(self.outputfile)[0] + suffix
+
+
+class ExportSink(ABC):
+    """Output the selected repeaters are fanned out to.
+
+    A sink gets every entry of the stream once and writes the ones it takes,
+    closing it flushes whatever it buffered.
+    """
+
+    @abstractmethod
+    def write(self, entry: StreamEntry) -> None:
+        """Write an entry if the sink takes it.
+
+        Args:
+            entry (StreamEntry): Selected repeater.
+        """
+
+    def close(self) -> None:
+        """Flush and close the output, nothing to do for unbuffered sinks."""
+        return None
+
+    def __enter__(self) -> ExportSink:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+class CSVSink(ExportSink):
+    """CSV file of the output rows, or of the CHIRP rows."""
+
+    def __init__(self, path: str, chirp: bool = False) -> None:
+        """Open the file and write its header.
+
+        Args:
+            path (str): Path of the CSV file.
+            chirp (bool): Write the CHIRP entries instead of the output ones.
+        """
+        self.file = open(path, "w", encoding="UTF8", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CHIRP_HEADER if chirp else REPEATER_HEADER)
+        self.chirp = chirp
+
+    def write(self, entry: StreamEntry) -> None:
+        if self.chirp:
+            if entry.location is not None:
+                self.writer.writerow(entry.repeater.chirprow(entry.location))
+        elif entry.output:
+            self.writer.writerow(entry.repeater.row())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def recordfields(repeater: Repeater) -> dict[str, Any]:
+    """Typed fields of a repeater for JSON, with the modes by name.
+
+    Args:
+        repeater (Repeater): Processed repeater.
+
+    Returns:
+        dict: Repeater fields, numbers that are not numbers as None.
+    """
+    fields: dict[str, Any] = {
+        name: None if isinstance(value, float) and value != value else value
+        for name, value in zip(Repeater._fields, repeater, strict=True)
+    }
+    fields["modes"] = [name for name, bit in MODE_BITS.items() if repeater.modes & bit]
+    return fields
+
+
+class JSONLinesSink(ExportSink):
+    """JSON Lines of the output repeaters on a text stream, i.e. stdout."""
+
+    def __init__(self, stream: Any) -> None:
+        """Use a stream, which is flushed but left open.
+
+        Args:
+            stream (TextIO): Stream to write to.
+        """
+        self.stream = stream
+
+    def write(self, entry: StreamEntry) -> None:
+        if entry.output:
+            self.stream.write(json.dumps(recordfields(entry.repeater)) + "\n")
+
+    def close(self) -> None:
+        self.stream.flush()
+
+
+class GeoJSONSink(ExportSink):
+    """GeoJSON FeatureCollection of the output repeaters, written as it grows.
+
+    Listings carry no coordinates, so every feature has a null geometry and
+    the repeater fields as its properties.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open the file and start the collection.
+
+        Args:
+            path (str): Path of the GeoJSON file.
+        """
+        self.file = open(path, "w", encoding="UTF8")
+        self.file.write('{"type": "FeatureCollection", "features": [')
+        self.separator = "\n"
+
+    def write(self, entry: StreamEntry) -> None:
+        if entry.output:
+            feature = {
+                "type": "Feature",
+                "geometry": None,
+                "properties": recordfields(entry.repeater),
+            }
+            self.file.write(self.separator + json.dumps(feature))
+            self.separator = ",\n"
+
+    def close(self) -> None:
+        self.file.write("\n]}\n")
+        self.file.close()
+
+
+def recordsink(fmt: str, target: ExportTarget) -> ExportSink:
+    """Open a typed Parquet or Arrow file, pyarrow is only imported here."""
+    from rscrape.export import RecordWriter
+
+    return RecordWriter(target.path("." + fmt), fmt)
+
+
+def storesink(target: ExportTarget) -> ExportSink:
+    """Open the SQLite store of the target."""
+    from rscrape.store import RepeaterStore
+
+    return RepeaterStore(str(target.store), target.origin)
+
+
+# Export sinks by name, each opened from the ExportTarget of a query, and
+# where each writes to for --help
+EXPORTERS: dict[str, Callable[[ExportTarget], ExportSink]] = {}
+EXPORT_DESTINATIONS: dict[str, str] = {}
+
+
+def registerexporter(
+    name: str, factory: Callable[[ExportTarget], ExportSink], destination: str = ""
+) -> None:
+    """Make an export sink available to --format.
+
+    Args:
+        name (str): Format name.
+        factory (callable): Opens the sink for the ExportTarget of a query.
+        destination (str): Where the sink writes to, shown by --help.
+    """
+    EXPORTERS[name] = factory
+    EXPORT_DESTINATIONS[name] = destination
+
+
+def formathelp() -> str:
+    """Describe the --format choices and where each is written.
+
+    Returns:
+        str: Comma-separated formats with their destinations.
+    """
+    return ", ".join(
+        f"{name} ({EXPORT_DESTINATIONS[name]})" if EXPORT_DESTINATIONS[name] else name
+        for name in EXPORTERS
+        if name not in OPTION_SINKS
+    )
+
+
+registerexporter("csv", lambda target: CSVSink(target.outputfile), "the output file")
+registerexporter("chirp", lambda target: CSVSink(str(target.chirpfile), chirp=True))
+registerexporter("jsonl", lambda target: JSONLinesSink(sys.stdout), "stdout")
+registerexporter(
+    "geojson", lambda target: GeoJSONSink(target.path(".geojson")), "<output>.geojson"
+)
+registerexporter("parquet", partial(recordsink, "parquet"), "<output>.parquet")
+registerexporter("arrow", partial(recordsink, "arrow"), "<output>.arrow")
+registerexporter("sqlite", storesink)
+
+
+def expandformats(formats: str) -> list[str]:
+    """Expand a format option into the output formats to write.
+
+    Args:
+        formats (str): Comma-separated formats i.e. csv,parquet.
+
+    Returns:
+        list: Unique formats in the order given.
+
+    Raises:
+        ValueError: If any entry is not a known format.
+    """
+    expanded: list[str] = []
+    for name in formats.lower().split(","):
+        name = name.strip()
+        if name not in EXPORTERS or name in OPTION_SINKS:
+            raise ValueError(f"Invalid format '{name}'")
+        if name not in expanded:
+            expanded.append(name)
+    return expanded
+
+
+def formattype(value: str) -> str:
+    """Argparse type for the format option.
+
+    Args:
+        value (str): Raw option value.
+
+    Returns:
+        str: The value unchanged if every format in it is valid.
+    """
+    try:
+        expandformats(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+    return value
+
+
+def writerepeaters(
+    entries: Iterable[StreamEntry],
+    outputfile: str,
+    chirpfile: str | None = None,
+    formats: str = "csv",
+    store: str | None = None,
+    origin: str = "",
+) -> int:
+    """Fan selected repeaters out to every enabled sink as they arrive.
+
+    The stream is read once, whatever the number of sinks, so each extra
+    format only adds its own serialization.
+
+    Args:
+        entries (iterable): Selected repeaters.
+        outputfile (str): Path of the repeater CSV file, the other files
+            take its name with their own suffix.
+        chirpfile (str): Optional path of the CHIRP CSV file.
+        formats (str): Comma-separated formats of EXPORTERS.
+        store (str): Optional SQLite database to upsert the repeaters into.
+        origin (str): Location of the query, stored with the repeaters.
+
+    Returns:
+        int: Number of repeaters written to the output file.
+    """
+    target = ExportTarget(outputfile, chirpfile, store, origin)
+    names = expandformats(formats)
+    if chirpfile is not None:
+        names.append("chirp")
+    if store is not None:
+        names.append("sqlite")
+
+    written = 0
+    with ExitStack() as sinks:
+        writes = [sinks.enter_context(EXPORTERS[name](target)).write for name in names]
+        for entry in entries:
+            for write in writes:
+                write(entry)
+            written += entry.output
+    return written
+
+
+def initprocess(ranges: tuple[OffsetRange, ...]) -> None:
+    """Give a worker process the band plan of the main process.
+
+    Args:
+        ranges (tuple): Offset ranges of BAND_PLAN.
+    """
+    BAND_PLAN.setranges(ranges)
+
+
+def createprocesspool(processes: int) -> ProcessPoolExecutor:
+    """Start worker processes for parsing and classification.
+
+    Workers are spawned rather than forked, since the main process already
+    runs fetch threads, and get the current band plan.
+
+    Args:
+        processes (int): Number of worker processes.
+
+    Returns:
+        ProcessPoolExecutor: The worker pool.
+    """
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initprocess,
+        initargs=(BAND_PLAN.ranges,),
+    )
+
+
+def createworkerpool(processes: int = 0, threads: int = 0) -> Executor | None:
+    """Start the workers asked for on the command line, if any.
+
+    Threads share the parsed rows without pickling them, and run in
+    parallel on a free-threaded (no-GIL) Python build; on the standard build
+    only the lxml parsing, which releases the GIL, overlaps.
+
+    Args:
+        processes (int): Number of worker processes.
+        threads (int): Number of worker threads.
+
+    Returns:
+        Executor: The worker pool, or None to work in the calling thread.
+    """
+    if processes > 0:
+        return createprocesspool(processes)
+    if threads > 0:
+        return ThreadPoolExecutor(max_workers=threads, thread_name_prefix="rscrape")
+    return None
+
+
+def classifychunk(
+    rpters: list[list[Any]],
+    exnotes: bool,
+    DEBUG: bool,
+    tx_power: str,
+    ams_mode: str,
+    packed: bool = False,
+) -> list[Any]:
+    """Classify a chunk of raw rows on a worker.
+
+    Args:
+        rpters (list): Raw repeater data entries.
+        exnotes (bool): Flag to include extended notes.
+        DEBUG (bool): Flag for debug printing.
+        tx_power (str): Transmit power level.
+        ams_mode (str): AMS mode version ('v1' or 'v2').
+        packed (bool): Return plain tuples, which pickle back from a worker
+            process about twice as fast as the records themselves.
+
+    Returns:
+        list: The processed repeater of each raw entry.
+    """
+    repeaters = classifyrepeaters(rpters, exnotes, DEBUG, tx_power, ams_mode)
+    if packed:
+        return [tuple(repeater) for repeater in repeaters]
+    return list(repeaters)
+
+
+def classifyrepeatersinpool(
+    pool: Executor,
+    rpters: list[list[Any]],
+    exnotes: bool,
+    DEBUG: bool,
+    tx_power: str,
+    ams_mode: str,
+    chunksize: int = PROCESS_CHUNK,
+) -> Iterator[Repeater]:
+    """Classify raw rows in chunks across worker processes or threads.
+
+    Repeaters come back in the order of the raw rows, whatever order the
+    chunks finish in.
+
+    Args:
+        pool (Executor): Worker processes or threads.
+        rpters (list): Raw repeater data entries.
+        exnotes (bool): Flag to include extended notes.
+        DEBUG (bool): Flag for debug printing.
+        tx_power (str): Transmit power level.
+        ams_mode (str): AMS mode version ('v1' or 'v2').
+        chunksize (int): Raw rows per worker task.
+
+    Yields:
+        Repeater: The processed repeater of each raw entry.
+    """
+    chunks = [rpters[i : i + chunksize] for i in range(0, len(rpters), chunksize)]
+    packed = isinstance(pool, ProcessPoolExecutor)
+    classify = partial(
+        classifychunk,
+        exnotes=exnotes,
+        DEBUG=DEBUG,
+        tx_power=tx_power,
+        ams_mode=ams_mode,
+        packed=packed,
+    )
+    for repeaters in pool.map(classify, chunks):
+        yield from map(Repeater._make, repeaters) if packed else repeaters
+
+
+class OffsetRange(NamedTuple):
+    """Repeater offset of the frequencies from low to high MHz, inclusive."""
+
+    low: float
+    high: float
+    offset: float
+    offset_dir: str
+
+
+# Repeater offsets of the band plan, by frequency
+OFFSET_RANGES = (
+    OffsetRange(51, 51.99, -0.5, "-"),
+    OffsetRange(52, 54, -1.0, "-"),
+    OffsetRange(144.51, 144.89, 0.6, "+"),
+    OffsetRange(145.11, 145.49, -0.6, "-"),
+    OffsetRange(146.0, 146.39, 0.6, "+"),
+    OffsetRange(146.4, 146.5, -1.5, "-"),
+    OffsetRange(146.61, 146.99, -0.6, "-"),
+    OffsetRange(147.0, 147.39, 0.6, "+"),
+    OffsetRange(147.6, 147.99, -0.6, "-"),
+    OffsetRange(223, 225, -1.6, "-"),
+    OffsetRange(440, 444.99, 5.0, "+"),
+    OffsetRange(445, 450, -5.0, "-"),
+    OffsetRange(918, 922, -12.0, "-"),
+    OffsetRange(927, 928, -25.0, "-"),
+)
+
+# Offset of frequencies outside the band plan
+NO_OFFSET: tuple[float, str] = (0, "off")
+
+BAND_PLAN_CACHE = 4096  # distinct frequencies remembered per band plan
+
+
+class BandPlan:
+    """Repeater offsets by frequency, looked up in a sorted range table.
+
+    Lookups bisect the range lows, and the offsets of recent frequencies
+    are remembered since pulls repeat the same frequencies many times. Each
+    thread remembers its own, so worker threads never share a dict.
+    """
+
+    def __init__(self, ranges: Iterable[OffsetRange]) -> None:
+        """Build a band plan.
+
+        Args:
+            ranges (iterable): Offset ranges, in any order.
+
+        Raises:
+            ValueError: If a range is empty or ranges overlap.
+        """
+        self.setranges(ranges)
+
+    def setranges(self, ranges: Iterable[OffsetRange]) -> None:
+        """Replace the ranges of the band plan.
+
+        Args:
+            ranges (iterable): Offset ranges, in any order.
+
+        Raises:
+            ValueError: If a range is empty or ranges overlap.
+        """
+        ranges = sorted(ranges)
+        for previous, current in zip([None, *ranges], ranges, strict=False):
+            if current.low > current.high:
+                raise ValueError(f"Empty range {current.low}-{current.high}")
+            if previous is not None and current.low <= previous.high:
+                raise ValueError(
+                    f"Range {current.low}-{current.high} overlaps "
+                    f"{previous.low}-{previous.high}"
+                )
+        self.ranges = tuple(ranges)
+        self.lows = [r.low for r in self.ranges]
+        self.local = threading.local()
+
+    def update(self, ranges: Iterable[OffsetRange]) -> None:
+        """Add ranges, replacing the ranges of the plan they overlap.
+
+        Args:
+            ranges (iterable): Offset ranges, in any order.
+
+        Raises:
+            ValueError: If a range is empty or the new ranges overlap.
+        """
+        added = list(ranges)
+        kept = [
+            r
+            for r in self.ranges
+            if not any(r.low <= a.high and a.low <= r.high for a in added)
+        ]
+        self.setranges(kept + added)
+
+    def offset(self, freq: float) -> tuple[float, str]:
+        """Look up the offset of a frequency.
+
+        Args:
+            freq (float): Frequency in MHz.
+
+        Returns:
+            tuple: Offset in MHz and offset direction, NO_OFFSET outside the plan.
+        """
+        cache = getattr(self.local, "cache", None)
+        if cache is None:
+            cache = self.local.cache = {}
+        found: tuple[float, str] | None = cache.get(freq)
+        if found is not None:
+            return found
+        index = bisect.bisect_right(self.lows, freq) - 1
+        found = NO_OFFSET
+        if index >= 0 and freq <= self.ranges[index].high:
+            found = self.ranges[index].offset, self.ranges[index].offset_dir
+        if len(cache) < BAND_PLAN_CACHE:
+            cache[freq] = found
+        return found
+
+    def offsets(self, freqs: Any) -> tuple[np.ndarray, np.ndarray]:
+        """Look up the offsets of a whole column of frequencies at once.
+
+        Args:
+            freqs (array-like): Frequencies in MHz, NaN where there is none.
+
+        Returns:
+            tuple: Array of offsets and object array of offset directions.
+        """
+        import numpy as np
+
+        freqs = np.asarray(freqs, dtype=float)
+        offsets = np.zeros(freqs.shape)
+        directions = np.full(freqs.shape, NO_OFFSET[1], dtype=object)
+        if not self.ranges:
+            return offsets, directions
+        index = np.searchsorted(self.lows, freqs, side="right") - 1
+        highs = np.array([r.high for r in self.ranges])
+        found = (index >= 0) & (freqs <= highs[index])
+        index = index[found]
+        offsets[found] = np.array([r.offset for r in self.ranges])[index]
+        directions[found] = np.array([r.offset_dir for r in self.ranges])[index]
+        return offsets, directions
+
+
+# Band plan of the repeater offsets written, extended with --band-plan
+BAND_PLAN = BandPlan(OFFSET_RANGES)
+
+
+def readbandplan(path: str) -> list[OffsetRange]:
+    """Read offset ranges from a CSV file.
+
+    The file needs a header row with low, high and offset columns, in MHz.
+    Negative offsets are written with a "-" direction, positive ones with "+"
+    and zero offsets as "off".
+
+    Args:
+        path (str): Path of the band plan file.
+
+    Returns:
+        list: Offset ranges of the file.
+
+    Raises:
+        ValueError: If a row is missing a column or holds a non-numeric value.
+    """
+    ranges = []
+    with open(path, encoding="UTF8", newline="") as f:
+        for number, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                low = float(row["low"])
+                high = float(row["high"])
+                offset = float(row["offset"])
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(
+                    f"Band plan line {number}: low, high and offset must be numeric"
+                ) from e
+            offset_dir = "-" if offset < 0 else "+" if offset > 0 else "off"
+            ranges.append(OffsetRange(low, high, offset, offset_dir))
+    return ranges
+
+
+# def determineoffset(freq_string):
+def determineoffset(freq_string: str) -> dict[str, float | str]:
+    """Calculate repeater offset based on frequency.
 
     Args:
         freq_string (str): Frequency as string.
 
     Returns:
-        dict: {'offset': float, 'offset_dir': str}
+        dict: {'offset': float, 'offset_dir': str}
+    """
+
+    # Convert String to Float for comparison
+    try:
+        # Attempt to convert freq_string to float
+        freq = float(freq_string)
+    except ValueError:
+        # Handle the case where freq_string is not convertible to float
+        logging.error(f"Error: '{freq_string}' is not a valid float string")
+        return {"offset": 0, "offset_dir": "off"}
+
+    offset, offset_dir = BAND_PLAN.offset(freq)
+    return {"offset": offset, "offset_dir": offset_dir}
+
+
+def compilefilter(rfilter: list[str]) -> int:
+    """Compile mode filters into a filter plan.
+
+    Each filter keeps repeaters with any of its modes joined by "+", and
+    without any of its modes prefixed with "!"; a repeater is kept when it
+    passes any filter. "dmr+!fm" keeps DMR repeaters that are not FM, and
+    "ysf+fm" keeps YSF repeaters that are also FM.
+
+    The plan has one bit per combination of Repeater.modes bits, set when
+    repeaters with exactly those modes are kept, so testing a repeater is a
+    single shift and AND whatever the filters.
+
+    Args:
+        rfilter (list): List of mode filters (e.g., ['fm', 'dmr+!ysf']).
+
+    Returns:
+        int: Filter plan.
+
+    Raises:
+        ValueError: For a filter naming an unknown mode.
+    """
+    plan = 0
+    for term in rfilter:
+        if not term:
+            continue
+        if term == "all":
+            return (1 << MODE_SETS) - 1
+        required = excluded = 0
+        for name in term.split("+"):
+            negated = name.startswith("!")
+            bit = MODE_BITS.get(name[1:] if negated else name)
+            if bit is None:
+                raise ValueError(f"Invalid filter {term}")
+            if negated:
+                excluded |= bit
+            else:
+                required |= bit
+        for modes in range(MODE_SETS):
+            if modes & required == required and not modes & excluded:
+                plan |= 1 << modes
+    return plan
+
+
+# def filteroutput(rfilter, repeater, repeater_list):
+def filteroutput(
+    rfilter: list[str] | int, repeater: Repeater, repeater_list: list[Repeater]
+) -> None:
+    """Filter and append repeater entry based on mode filters.
+
+    Args:
+        rfilter (list | int): List of mode filters, or a compiled plan.
+        repeater (Repeater): The repeater entry to filter.
+        repeater_list (list): List to append filtered entries.
+
+    Returns:
+        None: Appends to repeater_list if matched.
+    """
+    plan = rfilter if isinstance(rfilter, int) else compilefilter(rfilter)
+    if plan >> repeater.modes & 1:
+        repeater_list.append(repeater)
+
+
+# def chirpbuild(chirprepeater, chirprepeaterlist):
+def chirpbuild(chirprepeater: Repeater, chirprepeaterlist: list[Repeater]) -> None:
+    """Append a repeater to the list of CHIRP entries.
+
+    Args:
+        chirprepeater (Repeater): The repeater to append.
+        chirprepeaterlist (list): List to append the entry.
+
+    Returns:
+        None: Appends to chirprepeaterlist.
+    """
+    chirprepeaterlist.append(chirprepeater)
+
+
+def expanddbfilter(dbfilter: str) -> list[str]:
+    """Expand a dbfilter option into the individual databases to query.
+
+    Args:
+        dbfilter (str): Single database, combined shorthand (neny, nesct) or a
+            comma-separated combination i.e. nerep,nesmc,csma,nyrep.
+
+    Returns:
+        list: Unique database names in the order given.
+
+    Raises:
+        ValueError: If any entry is not a known database.
+    """
+    sources: list[str] = []
+    for name in dbfilter.lower().split(","):
+        name = name.strip()
+        expanded: tuple[str, ...]
+        if name in DB_COMBINED:
+            expanded = DB_COMBINED[name]
+        elif name in DB_SOURCES:
+            expanded = (name,)
+        else:
+            raise ValueError(f"Invalid dbfilter '{name}'")
+        for source in expanded:
+            if source not in sources:
+                sources.append(source)
+    return sources
+
+
+def dbfiltertype(value: str) -> str:
+    """Argparse type for the dbfilter option.
+
+    Args:
+        value (str): Raw option value.
+
+    Returns:
+        str: The value unchanged if every database in it is valid.
+    """
+    try:
+        expanddbfilter(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+    return value
+
+
+def createsession(
+    poolsize: int = 1, record: str | None = None, replay: str | None = None
+) -> requests.Session:
+    """Create a pooled HTTP session with retry logic.
+
+    Args:
+        poolsize (int): Number of connections kept alive per host, should be at
+            least the number of concurrent requests.
+        record (str): Archive directory to record every response into.
+        replay (str): Archive directory to answer every request from instead
+            of the network.
+
+    Returns:
+        requests.Session: Session with retrying adapters mounted.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session: requests.Session
+    if replay or record:
+        from rscrape.archive import RecordingSession, ReplaySession, ResponseArchive
+
+        if replay:
+            session = ReplaySession(ResponseArchive(replay))
+        else:
+            session = RecordingSession(ResponseArchive(str(record)))
+    else:
+        session = requests.Session()
+    # 3 retries, exponential backoff
+    retry = Retry(connect=3, backoff_factor=0.5)
+    adapter = HTTPAdapter(
+        max_retries=retry, pool_connections=poolsize, pool_maxsize=poolsize
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def defaultcachedir() -> str:
+    """Return the default response cache directory.
+
+    Returns:
+        str: $XDG_CACHE_HOME/rscrape, falling back to ~/.cache/rscrape.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "rscrape")
+
+
+def normalizeformdata(formdata: dict[str, str]) -> dict[str, str]:
+    """Normalize the query fields of the form data for cache lookups.
+
+    Location case and spacing, radius formatting and band order do not change
+    the result returned by the query URL, so they are normalized away.
+
+    Args:
+        formdata (dict): Form data built by updatewebformdata.
+
+    Returns:
+        dict: The CACHE_KEY_FIELDS in normalized form.
+    """
+    loca = " ".join(formdata.get("loca", "").split()).lower()
+
+    radi = formdata.get("radi", "").strip()
+    try:
+        radi = str(int(float(radi)))
+    except ValueError:
+        pass
+
+    bandset = {b.strip() for b in formdata.get("band", "").split(",") if b.strip()}
+    band = ",".join(sorted(bandset, key=lambda b: (len(b), b)))
+
+    return {
+        "loca": loca,
+        "radi": radi,
+        "band": band,
+        "freq": formdata.get("freq", "").strip().lower(),
+        "dbfilter": formdata.get("dbfilter", "").strip().lower(),
+    }
+
+
+def cachekey(formdata: dict[str, str]) -> str:
+    """Build the cache key for a query.
+
+    Args:
+        formdata (dict): Form data built by updatewebformdata.
+
+    Returns:
+        str: Hex digest of the normalized CACHE_KEY_FIELDS.
+    """
+    normalized = normalizeformdata(formdata)
+    encoded = json.dumps([normalized[k] for k in CACHE_KEY_FIELDS])
+    return hashlib.sha256(encoded.encode("UTF8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache of query responses keyed by normalized form data.
+
+    Each entry is a small JSON metadata file next to a gzip compressed response
+    body. Entries are fresh for ttl seconds and may then be served for a
+    further stale seconds while a background request refreshes them. Once the
+    bodies exceed maxsize bytes the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        ttl: float = CACHE_TTL,
+        stale: float = CACHE_STALE,
+        maxsize: int = CACHE_SIZE * 1024 * 1024,
+        refresh: bool = False,
+    ) -> None:
+        """Create the cache.
+
+        Args:
+            directory (str): Directory holding the cache entries.
+            ttl (float): Seconds an entry is served without revalidation.
+            stale (float): Seconds past ttl an entry may be served while it is
+                refreshed in the background.
+            maxsize (int): Maximum total size of cached bodies in bytes.
+            refresh (bool): Ignore cached entries but store new responses.
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.stale = stale
+        self.maxsize = maxsize
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._revalidating: set[str] = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        base = os.path.join(self.directory, key)
+        return base + ".json", base + ".html.gz"
+
+    def get(self, formdata: dict[str, str]) -> tuple[str, bool] | None:
+        """Look up a cached response.
+
+        Args:
+            formdata (dict): Form data of the query.
+
+        Returns:
+            tuple: (response text, fresh) or None on a miss, when the entry is
+            too old to serve or when refreshing.
+        """
+        if self.refresh:
+            return None
+
+        metapath, bodypath = self._paths(cachekey(formdata))
+        meta = self._readmeta(metapath)
+        if meta is None:
+            return None
+        try:
+            with gzip.open(bodypath, "rt", encoding="UTF8") as g:
+                text = g.read()
+        except OSError:
+            return None
+
+        age = time.time() - float(meta.get("stored", 0))
+        if age > self.ttl + self.stale:
+            return None
+
+        # Mark as recently used for eviction
+        try:
+            os.utime(metapath)
+        except OSError:
+            pass
+
+        return text, age <= self.ttl
+
+    def put(self, formdata: dict[str, str], text: str) -> None:
+        """Store a response and evict old entries if over the size limit.
+
+        Args:
+            formdata (dict): Form data of the query.
+            text (str): Response body.
+        """
+        key = cachekey(formdata)
+        metapath, bodypath = self._paths(key)
+        meta = {"form": normalizeformdata(formdata), "stored": time.time()}
+
+        # Write to temporary files and rename so readers never see partial data
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with gzip.open(bodypath + suffix, "wt", encoding="UTF8") as g:
+                g.write(text)
+            with open(metapath + suffix, "w", encoding="UTF8") as f:
+                json.dump(meta, f)
+            os.replace(bodypath + suffix, bodypath)
+            os.replace(metapath + suffix, metapath)
+        except OSError as e:
+            logging.error(f"Error writing cache entry: {e}")
+            return
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until under the size limit."""
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                metapath, bodypath = self._paths(name[: -len(".json")])
+                try:
+                    used = os.path.getmtime(metapath)
+                    size = os.path.getsize(bodypath)
+                except OSError:
+                    continue
+                entries.append((used, size, metapath, bodypath))
+                total += size
+
+            entries.sort()
+            for _used, size, metapath, bodypath in entries:
+                if total <= self.maxsize:
+                    break
+                for path in (metapath, bodypath):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+
+    def _readmeta(self, metapath: str) -> dict[str, Any] | None:
+        try:
+            with open(metapath, encoding="UTF8") as f:
+                meta: dict[str, Any] = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta
+
+    def contains(self, formdata: dict[str, str]) -> bool:
+        """Check whether get would return an entry, without reading the body.
+
+        Args:
+            formdata (dict): Form data of the query.
+
+        Returns:
+            bool: True if a fresh or servable stale entry exists.
+        """
+        if self.refresh:
+            return False
+        meta = self._readmeta(self._paths(cachekey(formdata))[0])
+        if meta is None:
+            return False
+        return time.time() - float(meta.get("stored", 0)) <= self.ttl + self.stale
+
+    def getbroader(self, formdata: dict[str, str]) -> str | None:
+        """Find a fresh cached response for a query that subsumes this one.
+
+        A cached query subsumes another when location, dbfilter and repeaters
+        per frequency match, its radius is at least as large and its bands are
+        a superset. The smallest such radius is preferred.
+
+        Args:
+            formdata (dict): Form data of the query.
+
+        Returns:
+            str: Response text of the broader query or None.
+        """
+        if self.refresh:
+            return None
+
+        wanted = normalizeformdata(formdata)
+        try:
+            radius = float(wanted["radi"])
+        except ValueError:
+            return None
+        bands = set(wanted["band"].split(",")) - {""}
+
+        best: tuple[float, str] | None = None
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            meta = self._readmeta(os.path.join(self.directory, name))
+            if meta is None or now - float(meta.get("stored", 0)) > self.ttl:
+                continue
+            form = meta.get("form", {})
+            if any(form.get(f) != wanted[f] for f in ("loca", "freq", "dbfilter")):
+                continue
+            try:
+                cached_radius = float(form["radi"])
+            except (KeyError, ValueError):
+                continue
+            if cached_radius < radius or not bands <= set(form["band"].split(",")):
+                continue
+            if best is None or cached_radius < best[0]:
+                best = (cached_radius, name[: -len(".json")])
+
+        if best is None:
+            return None
+        try:
+            with gzip.open(self._paths(best[1])[1], "rt", encoding="UTF8") as g:
+                return g.read()
+        except OSError:
+            return None
+
+    def revalidate(self, session: requests.Session, formdata: dict[str, str]) -> None:
+        """Refresh a stale entry on a background thread.
+
+        The thread is not a daemon so the refreshed response is stored before
+        the interpreter exits, after the outputs have already been written.
+
+        Args:
+            session (requests.Session): Session used to issue the request.
+            formdata (dict): Form data of the stale query.
+        """
+        key = cachekey(formdata)
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def worker() -> None:
+            try:
+                response = session.post(NESMC_URL, data=formdata, timeout=10)
+                if response.ok:
+                    self.put(formdata, response.text)
+            except Exception as e:
+                logging.error(f"Error revalidating cache entry: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        threading.Thread(target=worker, name=f"revalidate-{key[:8]}").start()
+
+
+def fetchresponsetext(
+    session: requests.Session,
+    formdata: dict[str, str],
+    cache: ResponseCache | None = None,
+) -> str:
+    """POST one query, answering it from the response cache when possible.
+
+    Args:
+        session (requests.Session): Session used to issue the request.
+        formdata (dict): Complete form data for the query.
+        cache (ResponseCache): Optional response cache.
+
+    Returns:
+        str: Response body.
+    """
+    with profilestage("fetch", formdata.get("dbfilter", "")) as counts:
+        if cache is not None:
+            cached = cache.get(formdata)
+            if cached is not None:
+                text, fresh = cached
+                if not fresh:
+                    cache.revalidate(session, formdata)
+                counts["cached"] = 1
+                return text
+
+        response = session.post(NESMC_URL, data=formdata, timeout=10)
+        counts["bytes"] = len(response.content)
+        if cache is not None and response.ok:
+            cache.put(formdata, response.text)
+        return response.text
+
+
+class RepeaterTable(NamedTuple):
+    """Repeater table parsed from one query response."""
+
+    header: tuple[str, ...]
+    rows: list[tuple[Any, ...]]
+
+
+def cleancelltext(text: str) -> str:
+    """Collapse cell whitespace the same way pd.read_html does.
+
+    Args:
+        text (str): Raw text content of a table cell.
+
+    Returns:
+        str: Stripped text with line breaks and whitespace runs as one space.
+    """
+    return CELL_WHITESPACE.sub(" ", text.strip())
+
+
+def extractrepeatertable(html: str) -> RepeaterTable | None:
+    """Extract the repeater table from a query response with lxml.
+
+    The page is parsed once and only the table whose first row names the
+    FREQ and CALL columns is read, straight into tuples of cell text. Empty
+    cells become NaN as they do with pd.read_html so processrepeaterdata sees
+    the same values on either path.
+
+    Args:
+        html (str): Response body returned by the query URL.
+
+    Returns:
+        RepeaterTable: Header and data rows, or None if no table on the page
+        looks like the repeater table.
+    """
+    import lxml.etree
+    import lxml.html
+
+    try:
+        doc = lxml.html.fromstring(html)
+    except (lxml.etree.ParserError, ValueError):
+        return None
+
+    for table in doc.iter("table"):
+        rows = table.xpath("./thead/tr|./tbody/tr|./tr|./tfoot/tr")
+        if not rows:
+            continue
+        header = tuple(
+            cleancelltext(cell.text_content()) for cell in rows[0].xpath("./td|./th")
+        )
+        if "FREQ" not in header or "CALL" not in header:
+            continue
+
+        # <br> separates words like the line breaks pd.read_html inserts
+        for br in table.iter("br"):
+            br.tail = "\n" + (br.tail or "")
+
+        width = len(header)
+        data: list[tuple[Any, ...]] = []
+        for tr in rows[1:]:
+            cells: list[Any] = []
+            for cell in tr:
+                if cell.tag != "td" and cell.tag != "th":
+                    continue
+                # Plain cells hold only .text, avoid the string() XPath call
+                if len(cell):
+                    raw = "".join(cell.itertext())
+                else:
+                    raw = cell.text or ""
+                text = cleancelltext(raw)
+                value = text if text else NAN
+                try:
+                    span = max(1, int(cell.get("colspan", 1)))
+                except ValueError:
+                    span = 1
+                cells.extend([value] * span)
+            if len(cells) > width:
+                # More cells than header names, the layout changed
+                return None
+            cells.extend([NAN] * (width - len(cells)))
+            data.append(tuple(cells))
+        return RepeaterTable(header, data)
+
+    return None
+
+
+def parserepeatertable(html: str) -> pd.DataFrame:
+    """Parse the repeater table out of a query response with pd.read_html.
+
+    Args:
+        html (str): Response body returned by the query URL.
+
+    Returns:
+        DataFrame: Repeater table with the header row applied as column names.
+
+    Raises:
+        ValueError: If the page no longer contains the repeater table.
+    """
+    import pandas as pd
+
+    tables = pd.read_html(StringIO(html))
+
+    # Select table as its sorted by distance... to be selectable in the future
+    if len(tables) > 1:
+        df = tables[1]
+    else:
+        raise ValueError("Data changed, less tables")
+
+    # Dynamically set columns from first row and drop it
+    df.columns = df.iloc[0]
+    return df.drop(index=0).reset_index(drop=True)
+
+
+def readrepeatertable(html: str) -> RepeaterTable:
+    """Read the repeater table, falling back to pd.read_html if needed.
+
+    Args:
+        html (str): Response body returned by the query URL.
+
+    Returns:
+        RepeaterTable: Header and data rows of the repeater table.
+
+    Raises:
+        ValueError: If neither parser finds the repeater table.
+    """
+    table = extractrepeatertable(html)
+    if table is not None:
+        return table
+
+    logging.debug("Repeater table not found by lxml, falling back to read_html")
+    df = parserepeatertable(html)
+    return RepeaterTable(
+        tuple(str(c) for c in df.columns), [tuple(r) for r in df.values.tolist()]
+    )
+
+
+def readrepeatertablein(pool: Executor | None, html: str) -> RepeaterTable:
+    """Read the repeater table of a response, on a worker if a pool is given.
+
+    Args:
+        pool (Executor): Optional worker processes or threads.
+        html (str): Response body returned by the query URL.
+
+    Returns:
+        RepeaterTable: Header and data rows of the repeater table.
+    """
+    if pool is None:
+        return readrepeatertable(html)
+    return pool.submit(readrepeatertable, html).result()
+
+
+def ismissing(value: Any) -> bool:
+    """Check for an empty table cell.
+
+    Args:
+        value: Cell value.
+
+    Returns:
+        bool: True for None and NaN.
+    """
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def subsetrepeatertable(
+    table: RepeaterTable, formdata: dict[str, str]
+) -> RepeaterTable | None:
+    """Narrow a table from a broader query down to a smaller one.
+
+    Rows are kept when their distance is within the query radius and their
+    'FREQ' falls in one of the query bands.
+
+    Args:
+        table (RepeaterTable): Repeater table returned for the broader query.
+        formdata (dict): Form data of the narrower query.
+
+    Returns:
+        RepeaterTable: Rows matching the narrower query, or None if a distance
+        or frequency could not be parsed and the subset would not be reliable.
+    """
+    wanted = normalizeformdata(formdata)
+    try:
+        radius = float(wanted["radi"])
+        ranges = [BAND_RANGES[b] for b in wanted["band"].split(",") if b]
+        freqindex = table.header.index("FREQ")
+        distindex = table.header.index("DIST/DIR")
+    except (KeyError, ValueError):
+        return None
+
+    rows = []
+    for row in table.rows:
+        distdir = DISTDIR.search(str(row[distindex]))
+        if distdir is None:
+            return None
+        try:
+            freq = float(row[freqindex])
+            dist = float(distdir.group(1))
+        except (TypeError, ValueError):
+            return None
+        if freq != freq:
+            return None
+        if dist <= radius and any(low <= freq <= high for low, high in ranges):
+            rows.append(row)
+
+    return RepeaterTable(table.header, rows)
+
+
+def fetchrepeatertable(
+    session: requests.Session,
+    formdata: dict[str, str],
+    DEBUG: bool = False,
+    cache: ResponseCache | None = None,
+    pool: Executor | None = None,
+) -> RepeaterTable:
+    """POST one query and parse the repeater table from the response.
+
+    Args:
+        session (requests.Session): Session used to issue the request.
+        formdata (dict): Complete form data for the query.
+        DEBUG (bool): Flag for debug printing.
+        cache (ResponseCache): Optional response cache.
+        pool (Executor): Optional worker processes or threads to parse on.
+
+    Returns:
+        RepeaterTable: Parsed repeater table for the query.
+    """
+    if DEBUG:
+        logging.debug(formdata)
+
+    # Answer smaller radius/fewer band queries from a broader cached query
+    source = formdata.get("dbfilter", "")
+    table = None
+    if cache is not None and not cache.contains(formdata):
+        broader = cache.getbroader(formdata)
+        if broader is not None:
+            with profilestage("parse", source) as counts:
+                broadtable = readrepeatertablein(pool, broader)
+                table = subsetrepeatertable(broadtable, formdata)
+                counts["rows_out"] = 0 if table is None else len(table.rows)
+            if DEBUG and table is not None:
+                logging.debug("Answered from a broader cached query")
+
+    if table is None:
+        html = fetchresponsetext(session, formdata, cache)
+        with profilestage("parse", source) as counts:
+            table = readrepeatertablein(pool, html)
+            counts["rows_out"] = len(table.rows)
+
+    # Print Table
+    if DEBUG:
+        logging.debug(f"TABLE {formdata['dbfilter'].upper()}")
+        logging.debug(table.header)
+        for row in table.rows:
+            logging.debug(row)
+
+    return table
+
+
+def fetchrepeatertables(
+    session: requests.Session,
+    formdata: dict[str, str],
+    city: str,
+    state: str,
+    radius: str,
+    bands: str,
+    numperfreq: str,
+    sources: list[str],
+    DEBUG: bool = False,
+    cache: ResponseCache | None = None,
+    pool: Executor | None = None,
+) -> list[RepeaterTable]:
+    """Fetch and parse several databases concurrently.
+
+    Every source gets its own copy of the form data and is posted and parsed
+    on a worker thread, so wall time is bounded by the slowest source rather
+    than the sum of all of them.
+
+    Args:
+        session (requests.Session): Shared pooled session.
+        formdata (dict): Base form data, left unmodified.
+        city (str): The city to search from.
+        state (str): The two-letter state abbreviation.
+        radius (str): The search radius in miles.
+        bands (str): Comma-separated list of bands to search.
+        numperfreq (str): Option for number of repeaters per frequency.
+        sources (list): Databases to query.
+        DEBUG (bool): Flag for debug printing.
+        cache (ResponseCache): Optional response cache.
+        pool (Executor): Optional worker processes or threads to parse on.
+
+    Returns:
+        list: One parsed RepeaterTable per source, in the order of sources.
+    """
+    queries = []
+    for source in sources:
+        sourceform = dict(formdata)
+        updatewebformdata(sourceform, city, state, radius, bands, numperfreq, source)
+        queries.append(sourceform)
+
+    if len(queries) == 1:
+        return [fetchrepeatertable(session, queries[0], DEBUG, cache, pool)]
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        futures = [
+            executor.submit(fetchrepeatertable, session, query, DEBUG, cache, pool)
+            for query in queries
+        ]
+        return [future.result() for future in futures]
+
+
+def freqkey(freq: Any) -> tuple[int, float, str]:
+    """Order frequencies numerically, other text after them and empty last.
+
+    Args:
+        freq: Frequency cell as published.
+
+    Returns:
+        tuple: Sort key of the frequency.
+    """
+    if ismissing(freq):
+        return 2, 0.0, ""
+    mhz = tofloat(freq)
+    if mhz != mhz:
+        return 1, 0.0, str(freq)
+    return 0, mhz, ""
+
+
+def sourcestream(
+    table: RepeaterTable, rank: int
+) -> list[tuple[tuple[int, float, str], int, int, Any, tuple[Any, ...]]]:
+    """List the rows of one source table in frequency order.
+
+    Sources are requested sorted by frequency, so a table is only sorted
+    again when its rows turn out not to be.
+
+    Args:
+        table (RepeaterTable): Parsed repeater table of one source.
+        rank (int): Precedence of the source, lower wins duplicates.
+
+    Returns:
+        list: Frequency key, rank, position, CALL cell and row of each table
+        row, tuples that order without comparing the rows themselves.
+    """
+    freqindex = table.header.index("FREQ")
+    callindex = table.header.index("CALL")
+    entries = [
+        (freqkey(row[freqindex]), rank, position, row[callindex], row)
+        for position, row in enumerate(table.rows)
+    ]
+    if any(a[0] > b[0] for a, b in zip(entries, entries[1:], strict=False)):
+        entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def mergerepeatertables(
+    tables: list[RepeaterTable],
+    sources: list[str] | None = None,
+    prefer: list[str] | None = None,
+    tolerance: float = MERGE_TOLERANCE,
+) -> list[list[Any]]:
+    """Merge parsed source tables into one frequency sorted list of rows.
+
+    Every table is a frequency sorted stream, the streams are merged with a
+    heap in one pass. With more than one source, rows of the same call within
+    tolerance MHz of each other are one repeater and only the row of the
+    preferred source is kept, in the place of the first of them.
+
+    Args:
+        tables (list): Parsed repeater tables, one per source.
+        sources (list): Database of each table, when given it is added to
+            the end of every row as the SOURCE cell.
+        prefer (list): Databases whose rows win duplicates, in order, the
+            other databases follow in the order of sources.
+        tolerance (float): MHz apart the same call is a duplicate.
+
+    Returns:
+        list: Rows of every table sorted numerically by 'FREQ', empty last,
+        with duplicate CALL/FREQ entries dropped when more than one source
+        was queried.
+    """
+    named = sources is not None
+    sources = sources or [""] * len(tables)
+    preferred = [source for source in prefer or [] if source in sources]
+    ranks = [
+        preferred.index(source) if source in preferred else len(preferred) + index
+        for index, source in enumerate(sources)
+    ]
+    source = dict(zip(ranks, sources, strict=True))
+
+    def mergedrow(row: tuple[Any, ...], rank: int) -> list[Any]:
+        return [*row, source[rank]] if named else list(row)
+
+    streams = [
+        sourcestream(table, rank) for table, rank in zip(tables, ranks, strict=True)
+    ]
+    if len(tables) == 1:
+        return [mergedrow(entry[4], entry[1]) for entry in streams[0]]
+
+    # Drop Dupes, keeping the preferred source of each
+    merged: list[list[Any]] = []
+    kept: list[int] = []  # rank of each merged row
+    nearby: dict[Any, tuple[float, int]] = {}  # call -> MHz, position of last kept
+    seen: dict[tuple[Any, Any], int] = {}  # call, text FREQ -> position
+    for key, rank, _, call, row in heapq.merge(*streams):
+        call = None if ismissing(call) else str(call).strip().upper()
+        position = None
+        if key[0] == 0:
+            last = nearby.get(call)
+            if last is not None and key[1] - last[0] <= tolerance:
+                position = last[1]
+        else:
+            position = seen.get((call, key[2]))
+        if position is None:
+            position = len(merged)
+            merged.append(mergedrow(row, rank))
+            kept.append(rank)
+            if key[0] == 0:
+                nearby[call] = (key[1], position)
+            else:
+                seen[(call, key[2])] = position
+        elif rank < kept[position]:
+            merged[position] = mergedrow(row, rank)
+            kept[position] = rank
+    return merged
+
+
+def rowrank(row: list[Any]) -> tuple[float | None, float, str]:
+    """Rank a raw row for nearestperfrequency.
+
+    Args:
+        row (list): Raw row of location, frequency, PL, call, distance, ...
+
+    Returns:
+        tuple: Grouped frequency, or None if it is not a number, distance,
+        infinite if unknown, and upper case call.
+    """
+    mhz = tofloat(row[1])
+    distdir = DISTDIR.search(str(row[4]))
+    return (
+        None if mhz != mhz else round(mhz, PERFREQ_DIGITS),
+        float(distdir.group(1)) if distdir else float("inf"),
+        "" if ismissing(row[3]) else str(row[3]).upper(),
+    )
+
+
+def repeaterrank(repeater: Repeater) -> tuple[float | None, float, str]:
+    """Rank a processed repeater for nearestperfrequency.
+
+    Args:
+        repeater (Repeater): Processed repeater.
+
+    Returns:
+        tuple: Grouped frequency, or None if it is not a number, distance,
+        infinite if unknown, and upper case call.
+    """
+    mhz, miles = repeater.mhz, repeater.miles
+    return (
+        None if mhz != mhz else round(mhz, PERFREQ_DIGITS),
+        float("inf") if miles != miles else miles,
+        repeater.call.upper(),
+    )
+
+
+def nearestperfrequency(
+    items: Iterable[Any],
+    count: int,
+    rank: Callable[[Any], tuple[float | None, float, str]],
+) -> list[Any]:
+    """Keep the closest repeaters of every frequency, in their given order.
+
+    One pass groups the items by frequency and keeps the count nearest of
+    each, equal distances go to the lower call sign. Items without a numeric
+    frequency are all kept. Selecting here instead of asking the databases
+    for one per frequency lets the full result be fetched and cached once
+    for every count.
+
+    Args:
+        items (iterable): Raw rows or repeaters, in output order.
+        count (int): Repeaters kept per frequency.
+        rank (callable): rowrank or repeaterrank.
+
+    Returns:
+        list: The kept items.
+    """
+    items = list(items)
+    keep = [True] * len(items)
+    nearest: dict[float, list[tuple[float, str, int]]] = {}
+    for position, item in enumerate(items):
+        mhz, miles, call = rank(item)
+        if mhz is None:
+            continue
+        chosen = nearest.setdefault(mhz, [])
+        entry = (miles, call, position)
+        if len(chosen) < count:
+            bisect.insort(chosen, entry)
+        elif entry < chosen[-1]:
+            keep[chosen.pop()[2]] = False
+            bisect.insort(chosen, entry)
+        else:
+            keep[position] = False
+    return [item for item, kept in zip(items, keep, strict=True) if kept]
+
+
+def validatequery(
+    state: str,
+    radius: str,
+    bands: str,
+    dbfilter: str,
+    ams_mode: str,
+    rfilter: list[str] | None = None,
+    prefer: str = "",
+    perfreq: str | int = 0,
+) -> None:
+    """Validate the search parameters of a query.
+
+    Args:
+        state (str): The two-letter state abbreviation.
+        radius (str): The search radius in miles.
+        bands (str): Comma-separated list of bands to search.
+        dbfilter (str): The database filter to use.
+        ams_mode (str): AMS mode version ('v1' or 'v2').
+        rfilter (list): Optional list of mode filters.
+        prefer (str): Optional databases preferred for duplicates.
+        perfreq (str): Closest repeaters kept per frequency, 0 for all.
+
+    Raises:
+        ValueError: Describing the first invalid parameter.
+    """
+    # Validate Radius
+    try:
+        radius_miles = int(radius)
+    except ValueError as e:
+        raise ValueError("Radius must be numeric") from e
+
+    # Radius positive
+    if radius_miles <= 0:
+        raise ValueError("Radius must be positive")
+
+    # Validate Bands
+    if not all(b in VALID_BANDS for b in bands.split(",")):
+        raise ValueError("Invalid bands")
+
+    # Two Leter State Abbreviation
+    if not re.match(r"^[A-Z]{2}$", state):
+        raise ValueError("State must be a two-letter code")
+
+    # Validate DB Filters
+    try:
+        expanddbfilter(dbfilter)
+    except ValueError as e:
+        raise ValueError("Invalid dbfilter") from e
+
+    # Validate AMS Mode
+    if ams_mode not in {"v1", "v2"}:
+        raise ValueError("amsmode must be v1 or v2")
+
+    # Validate Mode Filters
+    if rfilter is not None:
+        compilefilter(rfilter)
+
+    # Validate Preferred Databases
+    if prefer:
+        try:
+            expanddbfilter(prefer)
+        except ValueError as e:
+            raise ValueError("Invalid prefer") from e
+
+    # Validate Repeaters Per Frequency
+    try:
+        perfreq_count = int(perfreq)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Perfreq must be numeric") from e
+    if perfreq_count < 0:
+        raise ValueError("Perfreq must not be negative")
+
+
+def fetchrepeaterrows(
+    session: requests.Session,
+    city: str,
+    state: str,
+    radius: str,
+    bands: str,
+    perfreq: int,
+    dbfilter: str,
+    DEBUG: bool = False,
+    cache: ResponseCache | None = None,
+    pool: Executor | None = None,
+    prefer: str = "",
+    mirror: RepeaterMirror | None = None,
+) -> list[list[Any]]:
+    """Fetch every database of a query and merge their rows.
+
+    Args:
+        session (requests.Session): Shared pooled session.
+        city (str): The city to search from.
+        state (str): The two-letter state abbreviation.
+        radius (str): The search radius in miles.
+        bands (str): Comma-separated list of bands to search.
+        perfreq (int): Closest repeaters kept per frequency, 0 for all.
+        dbfilter (str): The database filter to use.
+        DEBUG (bool): Flag for debug printing.
+        cache (ResponseCache): Optional response cache.
+        pool (Executor): Optional workers to parse on.
+        prefer (str): Databases whose entries win duplicates, in order.
+        mirror (RepeaterMirror): Optional local mirror to answer from instead.
+
+    Raises:
+        ValueError: If the mirror cannot answer the query.
+
+    Returns:
+        list: Raw rows sorted by frequency, each ending with its database.
+    """
+    sources = expanddbfilter(dbfilter)
+    if mirror is not None:
+        with profilestage("mirror") as counts:
+            tables = mirror.tables(city, state, radius, bands, sources)
+            counts["rows_out"] = sum(len(table.rows) for table in tables)
+    else:
+        # Fetch and parse every selected database concurrently
+        tables = fetchrepeatertables(
+            session,
+            FORMDATA,
+            city,
+            state,
+            radius,
+            bands,
+            "",
+            sources,
+            DEBUG,
+            cache,
+            pool,
+        )
+
+    # Merge sources by 'FREQ' and drop dupes across databases
+    with profilestage("merge") as counts:
+        rows = mergerepeatertables(
+            tables, sources, expanddbfilter(prefer) if prefer else None
+        )
+        counts["rows_in"] = sum(len(table.rows) for table in tables)
+        counts["rows_out"] = len(rows)
+
+    # Closest per frequency over every database, from the full result
+    if perfreq > 0:
+        with profilestage("perfreq") as counts:
+            counts["rows_in"] = len(rows)
+            rows = nearestperfrequency(rows, perfreq, rowrank)
+            counts["rows_out"] = len(rows)
+    return rows
+
+
+class Profiler:
+    """Wall and CPU time, bytes, rows and memory of every stage of a run.
+
+    Stages are keyed by name and source database and may nest, the time of
+    a stage leaves out the stages run inside it, so streaming stages that
+    pull rows from each other are told apart. CPU time is that of the thread
+    running the stage, work handed to --processes workers shows as wall time
+    only. Every stage reports the peak RSS of the process when it ended, and
+    with memory, tracemalloc's peak while it ran. Traced memory is that of
+    the whole process, so stages running at once on several threads, such
+    as concurrent fetches, each report the peak of all of them.
+    """
+
+    def __init__(self, memory: bool = False) -> None:
+        """Create an empty profile.
+
+        Args:
+            memory (bool): Record traced memory peaks, tracemalloc must be
+                running.
+        """
+        self.memory = memory
+        self.stages: dict[tuple[str, str], dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stacks: list[list[list[Any]]] = []  # running stages of each thread
+
+    def record(self, name: str, source: str = "") -> dict[str, Any]:
+        """Get the totals of a stage, adding it on first use.
+
+        Args:
+            name (str): Stage name.
+            source (str): Source database, "" for stages over all of them.
+
+        Returns:
+            dict: Totals of the stage.
+        """
+        with self._lock:
+            record = self.stages.get((name, source))
+            if record is None:
+                record = {
+                    "stage": name,
+                    "source": source,
+                    "wall_seconds": 0.0,
+                    "cpu_seconds": 0.0,
+                    "bytes": 0,
+                    "rows_in": 0,
+                    "rows_out": 0,
+                    "max_rss_bytes": 0,
+                }
+                if self.memory:
+                    record["traced_peak_bytes"] = 0
+                self.stages[(name, source)] = record
+        return record
+
+    def foldpeak(self) -> None:
+        """Fold the traced peak so far into the running stages of every thread.
+
+        Called with the lock held, before the peak is reset or a stage ends.
+        """
+        peak = tracemalloc.get_traced_memory()[1]
+        for stack in self._stacks:
+            for frame in stack:
+                frame[5] = max(frame[5], peak)
+
+    def enter(self, record: dict[str, Any]) -> None:
+        """Start timing a stage on this thread.
+
+        Args:
+            record (dict): Totals of the stage.
+        """
+        stack = self._local.__dict__.get("stack")
+        if stack is None:
+            stack = self._local.stack = []
+            with self._lock:
+                self._stacks.append(stack)
+        frame = [record, time.perf_counter(), time.thread_time(), 0.0, 0.0, 0]
+        if self.memory:
+            # The peak is process wide, stages of other threads keep theirs
+            with self._lock:
+                self.foldpeak()
+                tracemalloc.reset_peak()
+                stack.append(frame)
+        else:
+            stack.append(frame)
+
+    def exit(self, counts: dict[str, int] | None = None) -> None:
+        """Stop timing the innermost stage of this thread and add it up.
+
+        Args:
+            counts (dict): Bytes and rows to add to the stage.
+        """
+        stack = self._local.stack
+        if self.memory:
+            with self._lock:
+                self.foldpeak()
+                frame = stack.pop()
+        else:
+            frame = stack.pop()
+        record, wall, cpu, innerwall, innercpu, peak = frame
+        wall = time.perf_counter() - wall
+        cpu = time.thread_time() - cpu
+        if stack:
+            stack[-1][3] += wall
+            stack[-1][4] += cpu
+        with self._lock:
+            record["wall_seconds"] += wall - innerwall
+            record["cpu_seconds"] += cpu - innercpu
+            for field, count in (counts or {}).items():
+                record[field] = record.get(field, 0) + count
+            if self.memory:
+                record["traced_peak_bytes"] = max(record["traced_peak_bytes"], peak)
+
+    def markrss(self, record: dict[str, Any]) -> None:
+        """Note the peak RSS of the process at the end of a stage."""
+        rss = peakrss()
+        with self._lock:
+            record["max_rss_bytes"] = max(record["max_rss_bytes"], rss)
+
+    @contextmanager
+    def stage(self, name: str, source: str = "") -> Iterator[dict[str, int]]:
+        """Time the enclosed code as a stage.
+
+        Args:
+            name (str): Stage name.
+            source (str): Source database, "" for stages over all of them.
+
+        Yields:
+            dict: Counts of bytes, rows_in and rows_out to add to the stage.
+        """
+        record = self.record(name, source)
+        counts: dict[str, int] = {}
+        self.enter(record)
+        try:
+            yield counts
+        finally:
+            self.exit(counts)
+            self.markrss(record)
+
+    def iterate(self, name: str, iterable: Iterable[Any]) -> Iterator[Any]:
+        """Time the production of every item of an iterable as a stage.
+
+        Args:
+            name (str): Stage name.
+            iterable (iterable): Items, counted as rows out.
+
+        Yields:
+            Each item of the iterable.
+        """
+        record = self.record(name)
+        iterator = iter(iterable)
+        rows = 0
+        try:
+            while True:
+                self.enter(record)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.exit()
+                rows += 1
+                yield item
+        finally:
+            with self._lock:
+                record["rows_out"] += rows
+            self.markrss(record)
+
+    def report(self) -> list[dict[str, Any]]:
+        """List the stage totals in the order the stages first ran.
+
+        Returns:
+            list: One dict per stage and source, times rounded to microseconds.
+        """
+        with self._lock:
+            stages = [dict(record) for record in self.stages.values()]
+        for record in stages:
+            record["wall_seconds"] = round(record["wall_seconds"], 6)
+            record["cpu_seconds"] = round(record["cpu_seconds"], 6)
+        return stages
+
+
+def peakrss() -> int:
+    """Peak resident set size of the process.
+
+    Returns:
+        int: Bytes, 0 where the resource module is not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Profiler of the running command, set by --profile
+PROFILER: Profiler | None = None
+
+
+def profilestage(name: str, source: str = "") -> AbstractContextManager[dict[str, int]]:
+    """Time the enclosed code as a stage of the running profile, if any.
+
+    Args:
+        name (str): Stage name.
+        source (str): Source database, "" for stages over all of them.
+
+    Returns:
+        context manager: Yields the counts to add to the stage.
+    """
+    if PROFILER is None:
+        return nullcontext({})
+    return PROFILER.stage(name, source)
+
+
+def profileiter(name: str, iterable: Iterable[Any]) -> Iterable[Any]:
+    """Time the items of an iterable as a stage of the running profile, if any.
+
+    Args:
+        name (str): Stage name.
+        iterable (iterable): Items.
+
+    Returns:
+        iterable: The iterable, wrapped when a profile is running.
+    """
+    if PROFILER is None:
+        return iterable
+    return PROFILER.iterate(name, iterable)
+
+
+@contextmanager
+def profiling(profiler: Profiler, stem: str, argv: list[str]) -> Iterator[None]:
+    """Profile the enclosed run and write <stem>.profile.json when it ends.
+
+    The report is written when the run fails too. With a memory profiler the
+    run is also wrapped in cProfile, whose stats are saved as <stem>.pstats,
+    and tracemalloc.
+
+    Args:
+        profiler (Profiler): Profiler the stages are recorded in.
+        stem (str): Path of the report files without suffix.
+        argv (list[str]): Command-line arguments of the run.
+
+    Yields:
+        None: While the run is profiled.
+    """
+    global PROFILER
+    stats = None
+    if profiler.memory:
+        import cProfile
+
+        tracemalloc.start()
+        stats = cProfile.Profile()
+    PROFILER = profiler
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    if stats is not None:
+        stats.enable()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.disable()
+            stats.dump_stats(stem + ".pstats")
+        report: dict[str, Any] = {
+            "version": __version__,
+            "python": sys.version.split()[0],
+            "argv": argv,
+            "wall_seconds": round(time.perf_counter() - wall, 6),
+            "cpu_seconds": round(time.process_time() - cpu, 6),
+            "peak_rss_bytes": peakrss(),
+            "stages": profiler.report(),
+        }
+        if stats is not None:
+            tracemalloc.stop()
+            report["traced_peak_bytes"] = max(
+                (stage["traced_peak_bytes"] for stage in report["stages"]), default=0
+            )
+            report["pstats"] = stem + ".pstats"
+        PROFILER = None
+        with open(stem + ".profile.json", "w", encoding="UTF8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+
+def runquery(
+    session: requests.Session,
+    city: str,
+    state: str,
+    radius: str,
+    bands: str,
+    rfilter: list[str],
+    outputfile: str,
+    chirp: bool,
+    searchfilter: str,
+    perfreq: int,
+    dbfilter: str,
+    exnotes: bool,
+    DEBUG: bool,
+    tx_power: str,
+    ams_mode: str,
+    cache: ResponseCache | None = None,
+    columnar: bool = False,
+    pool: Executor | None = None,
+    prefer: str = "",
+    formats: str = "csv",
+    store: str | None = None,
+    mirror: RepeaterMirror | None = None,
+) -> int:
+    """Fetch, process and write the output files for one query.
+
+    Args:
+        session (requests.Session): Shared pooled session.
+        city (str): The city to search from.
+        state (str): The two-letter state abbreviation.
+        radius (str): The search radius in miles.
+        bands (str): Comma-separated list of bands to search.
+        rfilter (list): List of mode filters (e.g., ['fm', 'ysf']).
+        outputfile (str): Name of the csv file to write.
+        chirp (bool): Flag to also write the CHIRP_ prefixed csv file.
+        searchfilter (str): Text to search for in repeater entries.
+        perfreq (int): Closest repeaters kept per frequency, 0 for all.
+        dbfilter (str): The database filter to use.
+        exnotes (bool): Flag to include extended notes.
+        DEBUG (bool): Flag for debug printing.
+        tx_power (str): Transmit power level.
+        ams_mode (str): AMS mode version ('v1' or 'v2').
+        cache (ResponseCache): Optional response cache.
+        columnar (bool): Flag to process the rows column-wise with pandas.
+        pool (Executor): Optional workers to parse and classify on.
+        prefer (str): Databases whose entries win duplicates, in order.
+        formats (str): Comma-separated output formats.
+        store (str): Optional SQLite database to upsert the repeaters into.
+        mirror (RepeaterMirror): Optional local mirror to answer from.
+
+    Returns:
+        int: Number of repeaters written to the output file.
     """
+    rpters = fetchrepeaterrows(
+        session,
+        city,
+        state,
+        radius,
+        bands,
+        perfreq,
+        dbfilter,
+        DEBUG,
+        cache,
+        pool,
+        prefer,
+        mirror,
+    )
 
-    # Convert String to Float for comparison
-    try:
-        # Attempt to convert freq_string to float
-        freq = float(freq_string)
-    except ValueError:
-        # Handle the case where freq_string is not convertible to float
-        logging.error(f"Error: '{freq_string}' is not a valid float string")
-        return {"offset": 0, "offset_dir": "off"}
+    # Chirp Repeater list
+    chirpfile = None
+    if chirp:
+        directory, filename = os.path.split(outputfile)
+        chirpfile = os.path.join(directory, "CHIRP_" + filename)
+
+    # Process Repeater Data as it streams to the csv files
+    if columnar:
+        from rscrape.frame import selectrepeaterframe
+
+        entries = profileiter(
+            "process",
+            selectrepeaterframe(
+                rpters,
+                rfilter,
+                chirp,
+                searchfilter,
+                exnotes,
+                DEBUG,
+                tx_power,
+                ams_mode,
+            ),
+        )
+    else:
+        if pool is not None:
+            repeaters = classifyrepeatersinpool(
+                pool, rpters, exnotes, DEBUG, tx_power, ams_mode
+            )
+        else:
+            repeaters = classifyrepeaters(rpters, exnotes, DEBUG, tx_power, ams_mode)
+        entries = profileiter(
+            "select",
+            selectrepeaters(
+                profileiter("classify", repeaters), rfilter, chirp, searchfilter
+            ),
+        )
 
-    if freq >= 51 and freq <= 51.99:
-        offset = -0.500000
-        offset_dir = "-"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 52 and freq <= 54:
-        offset = -1.000000
-        offset_dir = "-"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 144.51 and freq <= 144.89:
-        offset = 0.600000
-        offset_dir = "+"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 145.11 and freq <= 145.49:
-        offset = -0.600000
-        offset_dir = "-"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 146.0 and freq <= 146.39:
-        offset = 0.600000
-        offset_dir = "+"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 146.4 and freq <= 146.5:
-        offset = -1.500000
-        offset_dir = "-"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 146.61 and freq <= 146.99:
-        offset = -0.600000
-        offset_dir = "-"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 147.0 and freq <= 147.39:
-        offset = 0.600000
-        offset_dir = "+"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 147.6 and freq <= 147.99:
-        offset = -0.600000
-        offset_dir = "-"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 223 and freq <= 225:
-        offset = -1.600000
-        offset_dir = "-"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 440 and freq <= 444.99:
-        offset = 5.000000
-        offset_dir = "+"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 445 and freq <= 450:
-        offset = -5.000000
-        offset_dir = "-"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 918 and freq <= 922:
-        offset = -12.000000
-        offset_dir = "-"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    if freq >= 927 and freq <= 928:
-        offset = -25.000000
-        offset_dir = "-"
-        return {"offset": offset, "offset_dir": offset_dir}
-
-    # If not in list return 0
-    return {"offset": 0, "offset_dir": "off"}
+    with profilestage("write") as counts:
+        written = writerepeaters(
+            entries, outputfile, chirpfile, formats, store, f"{city}, {state}"
+        )
+        counts["rows_out"] = written
+    return written
 
 
-# def filteroutput(rfilter, repeater, repeater_list):
-def filteroutput(
-    rfilter: list[str], repeater: list[Any], repeater_list: list[list[Any]]
-) -> None:
-    """Filter and append repeater entry based on mode filters.
+def parseflag(value: Any) -> bool:
+    """Interpret a batch job field as a boolean option.
 
     Args:
-        rfilter (list): List of mode filters.
-        repeater (list): The repeater entry to filter.
-        repeater_list (list): List to append filtered entries.
+        value: Field value, a bool from JSON or a string from CSV.
 
     Returns:
-        None: Appends to repeater_list if matched.
+        bool: True for true/yes/y/1/on, False otherwise.
     """
-    matched = False
-    if "fm" in rfilter and repeater[9] == "TRUE":
-        matched = True
-    if "ysf" in rfilter and repeater[20] == "TRUE":
-        matched = True
-    if "dmr" in rfilter and repeater[13] == "TRUE":
-        matched = True
-    if "dstar" in rfilter and repeater[19] == "TRUE":
-        matched = True
-    if "p25" in rfilter and repeater[17] == "TRUE":
-        matched = True
-    if "nxdn" in rfilter and repeater[15] == "TRUE":
-        matched = True
-    if "all" in rfilter or matched:
-        repeater_list.append(repeater)
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in {"true", "yes", "y", "1", "on"}
 
 
-# def chirpbuild(chirprepeater, chirprepeaterlist):
-def chirpbuild(chirprepeater: list[Any], chirprepeaterlist: list[list[Any]]) -> None:
-    """Append a CHIRP-formatted repeater entry to the list.
+def readbatchjobs(path: str) -> list[dict[str, Any]]:
+    """Read batch jobs from a CSV or JSON Lines file.
+
+    CSV files need a header row, JSON Lines files hold one object per line.
+    Field names are the long command line options (city, state, radius, bands,
+    filter, outputfile, oneper, chirp, dbfilter, xnotes, search, amsmode,
+    power, perfreq), output and filters are accepted as aliases. Missing or empty
+    fields fall back to the command line values.
 
     Args:
-        chirprepeater (list): The CHIRP entry to append.
-        chirprepeaterlist (list): List to append the entry.
+        path (str): Path of the job file, .jsonl/.json for JSON Lines.
 
     Returns:
-        None: Appends to chirprepeaterlist.
-    """
-    chirprepeaterlist.append(chirprepeater)
-
+        list: One dict of fields per job, string values except JSON booleans.
 
-# def main(argv):
-def main(argv: list[str]) -> None:
-    """Main entry point for the amateur radio repeater scraper.
-    
-    Parses command-line arguments, fetches repeater data from various databases,
-    processes the data according to filters, and outputs results to CSV files.
-    Optionally generates CHIRP-compatible format for radio programming.
+    Raises:
+        ValueError: If the file contains unknown fields or invalid JSON.
+    """
+    with open(path, encoding="UTF8", newline="") as f:
+        if path.lower().endswith((".jsonl", ".json")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for number, row in enumerate(rows, start=1):
+        job: dict[str, Any] = {}
+        for key, value in row.items():
+            field = str(key).strip().lower()
+            field = BATCH_ALIASES.get(field, field)
+            if field not in BATCH_FIELDS:
+                raise ValueError(f"Job {number}: unknown field '{key}'")
+            if value is not None and str(value).strip() != "":
+                job[field] = value if isinstance(value, bool) else str(value).strip()
+        jobs.append(job)
+    return jobs
+
+
+def runbatchjob(
+    session: requests.Session,
+    job: dict[str, Any],
+    DEBUG: bool,
+    cache: ResponseCache | None = None,
+    pool: Executor | None = None,
+    mirror: RepeaterMirror | None = None,
+) -> dict[str, Any]:
+    """Run one batch job, capturing failures instead of exiting.
 
     Args:
-        argv (list[str]): Command-line arguments (excluding script name).
+        session (requests.Session): Shared pooled session.
+        job (dict): Job fields merged with the command line defaults.
+        DEBUG (bool): Flag for debug printing.
+        cache (ResponseCache): Optional response cache.
+        pool (Executor): Optional workers shared by every job.
+        mirror (RepeaterMirror): Optional local mirror shared by every job.
 
     Returns:
-        None: Processes data and writes output files.
+        dict: Summary with status, repeaters written, seconds and error.
     """
+    result = {
+        "city": job["city"],
+        "state": job["state"],
+        "outputfile": job["outputfile"],
+        "status": "ok",
+        "repeaters": 0,
+        "seconds": 0.0,
+        "error": "",
+    }
+    start = time.perf_counter()
+    try:
+        radius = str(job["radius"])
+        rfilter = ["all"] if not job["filter"] else job["filter"].lower().split(",")
+        validatequery(
+            job["state"],
+            radius,
+            job["bands"],
+            job["dbfilter"],
+            job["amsmode"],
+            rfilter,
+            job.get("prefer", ""),
+            job.get("perfreq", 0),
+        )
+        result["repeaters"] = runquery(
+            session,
+            job["city"],
+            job["state"],
+            radius,
+            job["bands"],
+            rfilter,
+            job["outputfile"],
+            parseflag(job["chirp"]),
+            job["search"],
+            1 if parseflag(job["oneper"]) else int(job.get("perfreq", 0)),
+            job["dbfilter"],
+            parseflag(job["xnotes"]),
+            DEBUG,
+            job["power"],
+            job["amsmode"],
+            cache,
+            parseflag(job.get("columnar", False)),
+            pool,
+            job.get("prefer", ""),
+            job.get("format", "csv"),
+            job.get("sqlite") or None,
+            mirror,
+        )
+    except Exception as e:
+        logging.error(f"Batch job {job['city']}, {job['state']} failed: {e}")
+        result["status"] = "failed"
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def runbatch(
+    jobs: list[dict[str, str]],
+    defaults: dict[str, Any],
+    concurrency: int,
+    DEBUG: bool = False,
+    cache: ResponseCache | None = None,
+    record: str | None = None,
+    replay: str | None = None,
+    pool: Executor | None = None,
+    mirror: RepeaterMirror | None = None,
+) -> list[dict[str, Any]]:
+    """Run batch jobs over one pooled session with bounded concurrency.
+
+    Jobs without an outputfile write to <city>_<state>.csv. A job whose
+    outputfile is already used by an earlier job fails rather than
+    overwriting it.
 
-    DEBUG = False
+    Args:
+        jobs (list): Job fields as returned by readbatchjobs.
+        defaults (dict): Command line values for fields a job leaves out.
+        concurrency (int): Maximum number of jobs run at the same time.
+        DEBUG (bool): Flag for debug printing.
+        cache (ResponseCache): Optional response cache.
+        record (str): Archive directory to record every response into.
+        replay (str): Archive directory to answer every request from.
+        pool (Executor): Optional workers shared by every job.
+        mirror (RepeaterMirror): Optional local mirror shared by every job.
 
-    # Default Values
-    city = "Providence"
-    state = "RI"
-    radius = "50"
-    bands = "144,440"
-    rfilter = ["all"]
-    outputfile = "repeaters.csv"
-    searchfilter = ""
-    numperfreq = ""
-    dbfilter = "neny"
-    tx_power = "Low"
-    ams_mode = "v1"
+    Returns:
+        list: One summary dict per job, in job order.
+    """
+    merged = []
+    outputs: set[str] = set()
+    for job in jobs:
+        full = {**defaults, **job}
+        if "outputfile" not in job:
+            name = re.sub(r"[^A-Za-z0-9]+", "_", f"{full['city']}_{full['state']}")
+            full["outputfile"] = name.strip("_") + ".csv"
+        merged.append(full)
+
+    # Enough pooled connections for every source of every concurrent job
+    try:
+        perjob = max(len(expanddbfilter(job["dbfilter"])) for job in merged)
+    except ValueError:
+        perjob = len(DB_SOURCES)
+    session = createsession(max(1, concurrency) * perjob, record, replay)
+
+    results: list[dict[str, Any] | None] = [None] * len(merged)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {}
+        for index, job in enumerate(merged):
+            output = os.path.abspath(job["outputfile"])
+            if output in outputs:
+                results[index] = {
+                    "city": job["city"],
+                    "state": job["state"],
+                    "outputfile": job["outputfile"],
+                    "status": "failed",
+                    "repeaters": 0,
+                    "seconds": 0.0,
+                    "error": "Output file used by an earlier job",
+                }
+                continue
+            outputs.add(output)
+            futures[index] = executor.submit(
+                runbatchjob, session, job, DEBUG, cache, pool, mirror
+            )
+        for index, future in futures.items():
+            results[index] = future.result()
 
-    # extended notes
-    exnotes = False
+    return [result for result in results if result is not None]
 
-    # chirp
-    chirp = False
 
-    # Chirp list index
-    chirpcount = 0
+def writebatchsummary(results: list[dict[str, Any]], summaryfile: str) -> None:
+    """Write the per-job batch summary to csv.
 
-    # Two Dimensional List
-    repeater_list = []
+    Args:
+        results (list): Summaries returned by runbatch.
+        summaryfile (str): Name of the csv file to write.
 
-    # Chirp Repeater list
-    chirprepeaterlist = []
-
-    # Chirp Repeaters
-    chirprepeater: list[str | float] = []
-
-    # Repeater Header
-    repeater_header = [
-        "City",
-        "State",
-        "Frequency",
-        "Offset",
-        "Offset Direction",
-        "Name",
-        "Distance",
-        "Direction",
-        "Sponsor",
-        "FM",
-        "CTCSS",
-        "DCS",
-        "Tone Mode",
-        "DMR",
-        "DMR CC",
-        "NXDN",
-        "NXDN RAN",
-        "P25",
-        "P25 NAC",
-        "D-STAR",
-        "YSF",
-        "TX Power",
-        "Operating Mode",
-        "AMS",
-        "Comment",
-    ]
+    Returns:
+        None: Writes the summary file.
+    """
+    header = ["Job", "City", "State", "Output", "Status", "Repeaters", "Seconds"]
+    with open(summaryfile, "w", encoding="UTF8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header + ["Error"])
+        for number, result in enumerate(results, start=1):
+            writer.writerow(
+                [
+                    number,
+                    result["city"],
+                    result["state"],
+                    result["outputfile"],
+                    result["status"],
+                    result["repeaters"],
+                    f"{result['seconds']:.3f}",
+                    result["error"],
+                ]
+            )
 
-    # Chirp Repeater repeater_header
-    chirprepeaterlist_header = [
-        "Location",
-        "Name",
-        "Frequency",
-        "Duplex",
-        "Offset",
-        "Tone",
-        "rToneFreq",
-        "cToneFreq",
-        "DtcsCode",
-        "DtcsPolarity",
-        "Mode",
-        "TStep",
-        "Skip",
-        "Comment",
-        "URCALL",
-        "RPT1CALL",
-        "RPT2CALL",
-        "DVCODE",
-    ]
 
-    # Append Header to List
-    repeater_list.append(repeater_header)
-
-    # Append Chrp Header to list
-    chirprepeaterlist.append(chirprepeaterlist_header)
-
-    # Repeater Query URL
-    nesmc_url = "https://rptr.amateur-radio.net/cgi-bin/exec.cgi"
-
-    # Web Form Data
-    formdata = {
-        "task": "rsearch",
-        "template": "nesmc",
-        "band": "",
-        "sortby": "freq",
-        "meth": "RPList",
-        "radi": "",
-        "loca": "",
-        "freq": "",
-        "final": "Go!",
-    }
+# def main(argv):
+def createparser() -> argparse.ArgumentParser:
+    """Build the command-line parser of the scraper.
 
+    Returns:
+        argparse.ArgumentParser: Parser of every option, with its defaults.
+    """
     # Process options
     parser = argparse.ArgumentParser(
         description="Web scraping for amateur radio repeaters",
-        epilog="Valid bands: 29, 50, 144, 222, 440, 902, 1296. Valid filters: fm, ysf, dmr, dstar, nxdn, p25. Valid dbfilters: nerep, nesmc, csma, nyrep, nesct, neny (default). Valid amsmodes: v1 (default), v2.",
+        epilog="Valid bands: 29, 50, 144, 222, 440, 902, 1296. Valid filters: fm, ysf, dmr, dstar, nxdn, p25. Valid dbfilters: nerep, nesmc, csma, nyrep, nesct, neny (default) or any comma-separated combination. Valid amsmodes: v1 (default), v2.",
     )
 
     # Arguments with defaults (no required=True)
@@ -880,7 +3350,8 @@ def main(argv: list[str]) -> None:
     parser.add_argument(
         "-f",
         "--filter",
-        help="Filter by repeater type (comma-separated, e.g., ysf,dmr; default: all)",
+        help="Filter by repeater type (comma-separated, e.g., ysf,dmr; + for and, "
+        "! for not, e.g., 'dmr+!fm'; default: all)",
     )
     parser.add_argument(
         "-k",
@@ -888,6 +3359,13 @@ def main(argv: list[str]) -> None:
         action="store_true",
         help="Output only the closest repeater per frequency",
     )
+    parser.add_argument(
+        "--perfreq",
+        type=int,
+        default=0,
+        metavar="K",
+        help="Output only the K closest repeaters per frequency (default: 0, all)",
+    )
     parser.add_argument(
         "-p",
         "--chirp",
@@ -898,8 +3376,8 @@ def main(argv: list[str]) -> None:
         "-q",
         "--dbfilter",
         default="neny",
-        choices=["nerep", "nesmc", "csma", "nyrep", "nesct", "neny"],
-        help="Database to query (default: neny)",
+        type=dbfiltertype,
+        help="Database(s) to query, comma-separated to combine (e.g., nerep,csma; default: neny)",
     )
     parser.add_argument(
         "-x",
@@ -924,9 +3402,179 @@ def main(argv: list[str]) -> None:
         "-w", "--power", default="Low", help="TX power level (default: Low)"
     )
     parser.add_argument("-d", "--debug", action="store_true", help="Enable debug mode")
+    parser.add_argument(
+        "--format",
+        default="csv",
+        type=formattype,
+        help=f"Comma-separated output formats: {formathelp()}; <output> is the "
+        "output file without its extension (default: csv)",
+    )
+    parser.add_argument(
+        "--sqlite",
+        metavar="PATH",
+        help="Also upsert the repeaters into a SQLite database, kept across runs",
+    )
+    parser.add_argument(
+        "--prefer",
+        default="",
+        metavar="DBS",
+        help="Databases whose entries win duplicates across databases, in order "
+        "(e.g., nyrep,nerep; default: the -q order)",
+    )
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="Process rows column-wise with pandas, faster for large pulls",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Parse and classify on N worker processes (default: 0, none)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Parse and classify on N worker threads, for free-threaded Python "
+        "(default: 0, none)",
+    )
+    parser.add_argument(
+        "--mirror",
+        metavar="DIR",
+        help="Answer queries from the local mirror of every database in DIR, "
+        "distances computed from bundled city positions",
+    )
+    parser.add_argument(
+        "--update-mirror",
+        action="store_true",
+        help="Pull every database into the --mirror directory first",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write the wall and CPU time, bytes, rows and peak memory of every "
+        "stage as JSON next to the output file (<output>.profile.json, or next to "
+        "the --summary file for --batch)",
+    )
+    parser.add_argument(
+        "--profile-stats",
+        action="store_true",
+        help="Also run under cProfile and tracemalloc, saving <output>.pstats and "
+        "the traced memory peak of every stage (implies --profile)",
+    )
+    parser.add_argument(
+        "--band-plan",
+        metavar="FILE",
+        help="CSV of low,high,offset MHz ranges added to the repeater offset table",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the response cache",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached responses but store the new ones",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=defaultcachedir(),
+        help="Response cache directory (default: ~/.cache/rscrape)",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        default=CACHE_TTL,
+        type=int,
+        help=f"Seconds a cached response is used as is (default: {CACHE_TTL})",
+    )
+    parser.add_argument(
+        "--cache-stale",
+        default=CACHE_STALE,
+        type=int,
+        help="Seconds past the TTL a cached response is still used while it is "
+        f"refreshed in the background (default: {CACHE_STALE})",
+    )
+    parser.add_argument(
+        "--cache-size",
+        default=CACHE_SIZE,
+        type=int,
+        help=f"Maximum size of the response cache in MB (default: {CACHE_SIZE})",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="DIR",
+        help="Archive every raw response in DIR for later --replay (implies --no-cache)",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="DIR",
+        help="Answer every request from the archive in DIR instead of the network "
+        "(implies --no-cache)",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="Run every job in a CSV or JSON Lines file, job fields override the "
+        "options above",
+    )
+    parser.add_argument(
+        "--jobs",
+        default=4,
+        type=int,
+        help="Number of batch jobs run at the same time (default: 4)",
+    )
+    parser.add_argument(
+        "--summary",
+        default="batch_summary.csv",
+        help="Batch timing and failure summary file (default: batch_summary.csv)",
+    )
+    return parser
+
+
+def main(argv: list[str]) -> None:
+    """Main entry point for the amateur radio repeater scraper.
+    
+    Parses command-line arguments, fetches repeater data from various databases,
+    processes the data according to filters, and outputs results to CSV files.
+    Optionally generates CHIRP-compatible format for radio programming.
+
+    Args:
+        argv (list[str]): Command-line arguments (excluding script name).
+
+    Returns:
+        None: Processes data and writes output files.
+    """
+
+    # Process options
+    parser = createparser()
 
     # Parse the arguments
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    # Run inside the profile, which is written however the run ends
+    if args.profile or args.profile_stats:
+        stem = os.path.splitext(args.summary if args.batch else args.outputfile)[0]
+        with profiling(Profiler(args.profile_stats), stem, argv):
+            run(parser, args)
+    else:
+        run(parser, args)
+
+
+def run(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Run the scraper with parsed command-line arguments.
+
+    Args:
+        parser (argparse.ArgumentParser): Parser the arguments came from,
+            reports invalid combinations.
+        args (argparse.Namespace): Parsed arguments.
+
+    Returns:
+        None: Processes data and writes output files.
+    """
 
     # Map parsed args to your existing variables
     DEBUG = args.debug
@@ -938,7 +3586,7 @@ def main(argv: list[str]) -> None:
     rfilter = ["all"] if not args.filter else args.filter.lower().split(",")
     chirp = args.chirp
     searchfilter = args.search
-    numperfreq = "1per" if args.oneper else ""
+    perfreq = 1 if args.oneper else args.perfreq
     dbfilter = args.dbfilter
     exnotes = args.xnotes
     tx_power = args.power
@@ -962,266 +3610,132 @@ def main(argv: list[str]) -> None:
         logging.debug(f"Band(s) is/are {bands}")
         logging.debug(f"Output file is {outputfile}")
         logging.debug(f"Filter(s) is/are {rfilter}")
-        logging.debug(f"OnePer is {numperfreq}")
+        logging.debug(f"PerFreq is {perfreq}")
         logging.debug(f"dbfilter is {dbfilter}")
         logging.debug(f"power {tx_power}")
         logging.debug(f"amsmode {ams_mode}")
 
-    # Radius positive
-    if args.radius <= 0:
-        parser.error("Radius must be positive")
-
-    # Validate Bands
-    valid_bands = {"29", "50", "144", "222", "440", "902", "1296"}
-    if not all(b in valid_bands for b in bands.split(",")):
-        parser.error("Invalid bands")
-
-    # Two Leter State Abbreviation
-    if not re.match(r"^[A-Z]{2}$", state):
-        parser.error("State must be a two-letter code")
-
-    # Validate Radius
-    try:
-        int(radius)
-    except ValueError:
-        logging.error("Radius must be numeric")
-        sys.exit(1)
-
-    # Validate DB Filters
-    valid_dbfilters = {"nerep", "nesmc", "csma", "nyrep", "nesct", "neny"}
-    if dbfilter not in valid_dbfilters:
-        logging.error("Invalid dbfilter")
-        sys.exit(1)
-
-    # Validate AMS Mode
-    if ams_mode not in {"v1", "v2"}:
-        logging.error("amsmode must be v1 or v2")
-        sys.exit(1)
-
-    # Create a session with retry logic -- NEW: Retries added here
-    session = requests.Session()
-    # 3 retries, exponential backoff
-    retry = Retry(connect=3, backoff_factor=0.5)
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-
-    # Create Webform Data
-    if dbfilter == "neny":
-        updatewebformdata(formdata, city, state, radius, bands, numperfreq, "nerep")
-        try:
-            nerep_rptrs = session.post(nesmc_url, data=formdata, timeout=10)
-        except Exception as e:
-            logging.error(f"Error fetching data: {e}")
-            sys.exit(1)
-        updatewebformdata(formdata, city, state, radius, bands, numperfreq, "nyrep")
-        try:
-            nyrep_rptrs = session.post(nesmc_url, data=formdata, timeout=10)
-        except Exception as e:
-            logging.error(f"Error fetching data: {e}")
-            sys.exit(1)
-
-        # Read HTML response and parse table
-        try:
-            tables_nerep = pd.read_html(StringIO(nerep_rptrs.text))
-        except Exception as e:
-            logging.error(f"Error fetching data: {e}")
-            sys.exit(1)
-
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be combined")
+    if args.processes > 0 and args.threads > 0:
+        parser.error("--processes and --threads cannot be combined")
+    if args.update_mirror and not args.mirror:
+        parser.error("--update-mirror needs --mirror")
+
+    # Response cache, bypassed entirely with --no-cache and when recording or
+    # replaying so every response goes through the archive
+    cache = None
+    if not (args.no_cache or args.record or args.replay):
         try:
-            tables_nyrep = pd.read_html(StringIO(nyrep_rptrs.text))
-        except Exception as e:
-            logging.error(f"Error fetching data: {e}")
-            sys.exit(1)
-
-        # Print Table in Pandas Data Frame Format
-        if DEBUG:
-            logging.debug("TABLES NEREP")
-            logging.debug(tables_nerep)
-            logging.debug("TABLES NYEP")
-            logging.debug(tables_nyrep)
-
-        # Select 4th Table as its sorted by distance... to be selectable in the future
-
-        # df_nerep=tables_nerep[1]
-        # df_nyrep=tables_nyrep[1]
-
-        if len(tables_nerep) > 1:
-            df_nerep = tables_nerep[1]
-        else:
-            logging.error("Data changed, less tables")
-            sys.exit(1)
-
-        if len(tables_nyrep) > 1:
-            df_nyrep = tables_nyrep[1]
-        else:
-            logging.error("Data changed, less tables")
-            sys.exit(1)
-
-        # Dynamically set columns from first row and drop it
-        df_nerep.columns = df_nerep.iloc[0]
-        df_nerep = df_nerep.drop(index=0).reset_index(drop=True)
-
-        df_nyrep.columns = df_nyrep.iloc[0]
-        df_nyrep = df_nyrep.drop(index=0).reset_index(drop=True)
-
-        frames = [df_nerep, df_nyrep]
-        df = pd.concat(frames)
-
-        # Now sorts by actual 'FREQ' column name from source
-        df_sorted = df.sort_values(by=["FREQ"])
-
-        # Drop Dupes
-        df_sorted = df_sorted.drop_duplicates(subset=["CALL", "FREQ"])
-
-        # Write Data Frame to two dimensional list
-        rpters = df_sorted.values.tolist()
+            cache = ResponseCache(
+                args.cache_dir,
+                ttl=args.cache_ttl,
+                stale=args.cache_stale,
+                maxsize=args.cache_size * 1024 * 1024,
+                refresh=args.refresh,
+            )
+        except OSError as e:
+            logging.error(f"Response cache disabled: {e}")
 
-    # Create Webform Data
-    elif dbfilter == "nesct":
-        updatewebformdata(formdata, city, state, radius, bands, numperfreq, "nesmc")
-        try:
-            nerep_rptrs = session.post(nesmc_url, data=formdata, timeout=10)
-        except Exception as e:
-            logging.error(f"Error fetching data: {e}")
-            sys.exit(1)
-        updatewebformdata(formdata, city, state, radius, bands, numperfreq, "csma")
+    # Regional offsets on top of the built-in band plan
+    if args.band_plan:
         try:
-            nyrep_rptrs = session.post(nesmc_url, data=formdata, timeout=10)
-        except Exception as e:
-            logging.error(f"Error fetching data: {e}")
+            BAND_PLAN.update(readbandplan(args.band_plan))
+        except (OSError, ValueError) as e:
+            logging.error(f"Error reading band plan: {e}")
             sys.exit(1)
 
-        # Read HTML response and parse table
-        try:
-            tables_nerep = pd.read_html(StringIO(nerep_rptrs.text))
-        except Exception as e:
-            logging.error(f"Error fetching data: {e}")
-            sys.exit(1)
+    # Local mirror, pulled again with --update-mirror
+    mirror = None
+    if args.mirror:
+        from rscrape.mirror import RepeaterMirror, updatemirror
 
         try:
-            tables_nyrep = pd.read_html(StringIO(nyrep_rptrs.text))
+            if args.update_mirror:
+                session = createsession(len(DB_SOURCES), args.record, args.replay)
+                mirror = updatemirror(session, args.mirror, DEBUG, cache)
+            else:
+                mirror = RepeaterMirror.load(args.mirror)
         except Exception as e:
-            logging.error(f"Error fetching data: {e}")
-            sys.exit(1)
-
-        # Print Table in Pandas Data Frame Format
-        if DEBUG:
-            logging.debug("TABLES NEREP")
-            logging.debug(tables_nerep)
-            logging.debug("TABLES NYEP")
-            logging.debug(tables_nyrep)
-
-        # Select table as its sorted by distance... to be selectable in the future
-        if len(tables_nerep) > 1:
-            df_nerep = tables_nerep[1]
-        else:
-            logging.error("Data changed, less tables")
-            sys.exit(1)
-
-        if len(tables_nyrep) > 1:
-            df_nyrep = tables_nyrep[1]
-        else:
-            logging.error("Data changed, less tables")
+            logging.error(f"Error reading mirror: {e}")
             sys.exit(1)
 
-        # Dynamically set columns from first row and drop it
-        df_nerep.columns = df_nerep.iloc[0]
-        df_nerep = df_nerep.drop(index=0).reset_index(drop=True)
-
-        df_nyrep.columns = df_nyrep.iloc[0]
-        df_nyrep = df_nyrep.drop(index=0).reset_index(drop=True)
-
-        frames = [df_nerep, df_nyrep]
-        df = pd.concat(frames)
-
-        # Now sorts by actual 'FREQ' column name from source
-        df_sorted = df.sort_values(by=["FREQ"])
-
-        # Drop Dupes
-        df_sorted = df_sorted.drop_duplicates(subset=["CALL", "FREQ"])
-
-        # Write Data Frame to two dimensional list
-        rpters = df_sorted.values.tolist()
-
-    else:
-        updatewebformdata(formdata, city, state, radius, bands, numperfreq, dbfilter)
-
-        if DEBUG:
-            logging.debug(formdata)
-
-        # POST Form Request
+    # Batch mode, one summary line per job instead of exiting on errors
+    if args.batch:
+        defaults = {field: getattr(args, field) for field in BATCH_FIELDS}
         try:
-            nesmc_rptrs = session.post(nesmc_url, data=formdata, timeout=10)
-        except Exception as e:
-            logging.error(f"Error fetching data: {e}")
+            jobs = readbatchjobs(args.batch)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error reading batch file: {e}")
             sys.exit(1)
-
-        # Read HTML response and parse table
+        pool = createworkerpool(args.processes, args.threads)
         try:
-            tables = pd.read_html(StringIO(nesmc_rptrs.text))
-        except Exception as e:
-            logging.error(f"Error fetching data: {e}")
-            sys.exit(1)
-
-        # Print Table in Pandas Data Frame Format
-        if DEBUG and tables:
-            logging.debug(tables)
-
-        # Select table as its sorted by distance... to be selectable in the future
-        if len(tables) > 1:
-            df = tables[1]
-        else:
-            logging.debug("Data changed, less tables")
+            results = runbatch(
+                jobs,
+                defaults,
+                args.jobs,
+                DEBUG,
+                cache,
+                args.record,
+                args.replay,
+                pool,
+                mirror,
+            )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        writebatchsummary(results, args.summary)
+        if any(result["status"] != "ok" for result in results):
             sys.exit(1)
+        return
 
-        # Dynamically set columns from first row and drop it
-        df.columns = df.iloc[0]
-        df = df.drop(index=0).reset_index(drop=True)
-
-        df_sorted = df.sort_values(
-            by=["FREQ"]
-        )  # Now sorts by actual 'FREQ' column name from source
-
-        # If needed, sort or process further (script doesn't sort here currently)
-        rpters = df_sorted.values.tolist()
-
-    # Process Repeater Data
-    processrepeaterdata(
-        rpters,
-        repeater_list,
-        rfilter,
-        chirp,
-        chirpcount,
-        chirprepeater,
-        chirprepeaterlist,
-        searchfilter,
-        exnotes,
-        DEBUG,
-        tx_power,
-        ams_mode,
-    )
-
-    # Print Repeaters
-    # if DEBUG == True:
-    # logging.debug(*repeater_list, sep="\n")
-
-    # Write repeater list to csv
-    with open(outputfile, "w", encoding="UTF8", newline="") as f:
-        writer = csv.writer(f)
-
-        # write multiple rows
-        writer.writerows(repeater_list)
+    try:
+        validatequery(
+            state, radius, bands, dbfilter, ams_mode, rfilter, args.prefer, perfreq
+        )
+    except ValueError as e:
+        parser.error(str(e))
 
-    # Chirp Repeater list
-    if chirp:
-        # Write chirp list to csv
-        with open("CHIRP_" + outputfile, "w", encoding="UTF8", newline="") as g:
-            writerchirp = csv.writer(g)
+    # Shared pooled session, one connection slot per source
+    session = createsession(len(expanddbfilter(dbfilter)), args.record, args.replay)
 
-            # write multiple rows
-            writerchirp.writerows(chirprepeaterlist)
+    pool = createworkerpool(args.processes, args.threads)
+    try:
+        runquery(
+            session,
+            city,
+            state,
+            radius,
+            bands,
+            rfilter,
+            outputfile,
+            chirp,
+            searchfilter,
+            perfreq,
+            dbfilter,
+            exnotes,
+            DEBUG,
+            tx_power,
+            ams_mode,
+            cache,
+            args.columnar,
+            pool,
+            args.prefer,
+            args.format,
+            args.sqlite,
+            mirror,
+        )
+    except Exception as e:
+        logging.error(f"Error fetching data: {e}")
+        sys.exit(1)
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
 
 if __name__ == "__main__":
-    main(sys.argv[1:])
+    # Run the imported webscrape module, the one the rscrape package imports
+    # its tables and profiler from, not this __main__ copy of it
+    from rscrape.cli import main as cli_main
+
+    cli_main(sys.argv[1:])